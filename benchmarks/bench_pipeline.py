@@ -0,0 +1,218 @@
+"""
+Benchmark the preprocessing and postprocessing pipeline stages on a synthetic DMRS corpus.
+
+Stages timed:
+* preprocess_penman (decode, anonymize, combine attributes, linearize)
+* combine_attributes (on its own, over graphs decoded and anonymized beforehand)
+* preprocess_sentence (anonymize spans and tokenize)
+* replace_rare_tokens
+* remove_overlap (find_overlapping_lines + apply_blacklist)
+* postprocess (de-anonymize and detokenize)
+
+Each stage reports throughput (items/sec) and peak Python memory (via tracemalloc), in total and
+per item. Results can be saved as a baseline and later runs compared against it.
+
+Usage (from the repo root):
+> python benchmarks/bench_pipeline.py --num_graphs 5000 --save_baseline results/bench-baseline.json
+> python benchmarks/bench_pipeline.py --num_graphs 5000 --baseline results/bench-baseline.json
+
+"""
+
+import argparse
+import copy
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'scripts'))
+
+import postprocessing
+import preprocessing
+import remove_overlap
+import replacements
+import synthetic_dmrs
+
+
+def measure(name, fn, num_items, setup=None, repeat=3):
+    """Return a dict of timing and peak memory stats for fn.
+
+    Time is the best of repeat runs. fn is then run once more under tracemalloc (which slows
+    things down) to get peak memory. setup, if given, is called before each run and isn't timed.
+
+    """
+    seconds = float('inf')
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start_time = time.perf_counter()
+        fn()
+        seconds = min(seconds, time.perf_counter() - start_time)
+    if setup:
+        setup()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result = {
+        'stage': name,
+        'items': num_items,
+        'seconds': seconds,
+        'items_per_sec': num_items / seconds if seconds else float('inf'),
+        'peak_mb': peak / 1024.0 / 1024.0,
+        'peak_kb_per_item': peak / 1024.0 / num_items,
+    }
+    sys.stderr.write('{stage:<22} {items:>8d} items {seconds:>9.3f}s {items_per_sec:>11.1f}/s '
+                     '{peak_mb:>9.2f} MB peak {peak_kb_per_item:>7.2f} KB/item\n'.format(**result))
+    return result
+
+
+def load_corpus(penman_filename):
+    """Returns list of (penman_serialized, sentence) pairs as create_parallel_files sees them."""
+    corpus = []
+    for label, penman_serialized in preprocessing.load_serialized_from_file(penman_filename):
+        penman_serialized = re.sub(r'_([^\s]+)\/(.*?_unknown)', r'UNK\1 :carg "\1"', penman_serialized)
+        sentence = label.split('# ::snt ')[-1].strip()
+        corpus.append((penman_serialized, sentence))
+    return corpus
+
+
+def run_benchmarks(penman_filename, workdir, repeat=3):
+    corpus = load_corpus(penman_filename)
+    results = []
+
+    anon_maps = []
+    def run_preprocess_penman():
+        anon_maps[:] = [preprocessing.preprocess_penman(penman_serialized)[1]
+                        for penman_serialized, _ in corpus]
+    results.append(measure('preprocess_penman', run_preprocess_penman, len(corpus), repeat=repeat))
+
+    # the graphs are all kept, so peak memory includes every graph's combined labels
+    graphs = []
+    def decode_graphs():
+        graphs[:] = []
+        for penman_serialized, _ in corpus:
+            g = preprocessing.preprocess_penman.codec.decode(penman_serialized)
+            preprocessing.anonymize_graph(g)
+            graphs.append(g)
+    def run_combine_attributes():
+        for g in graphs:
+            preprocessing.combine_attributes(g)
+    results.append(measure('combine_attributes', run_combine_attributes, len(corpus),
+                           setup=decode_graphs, repeat=repeat))
+
+    # preprocess_sentence modifies anon maps, so give each run fresh copies
+    anon_map_copies = []
+    def copy_anon_maps():
+        anon_map_copies[:] = copy.deepcopy(anon_maps)
+    def run_preprocess_sentence():
+        for (_, sentence), anon_map in zip(corpus, anon_map_copies):
+            preprocessing.preprocess_sentence(sentence, anon_map)
+    results.append(measure('preprocess_sentence', run_preprocess_sentence, len(corpus),
+                           setup=copy_anon_maps, repeat=repeat))
+
+    # later stages work on parallel files. replace_rare_tokens and remove_overlap change them in
+    # place, so each run (including the tracemalloc one) starts from fresh copies of pristine ones
+    pristine_prefix = os.path.join(workdir, 'pristine', 'train')
+    os.makedirs(os.path.dirname(pristine_prefix))
+    preprocessing.create_parallel_files(penman_filename, pristine_prefix)
+    prefix = os.path.join(workdir, 'train')
+    blacklist_filename = os.path.join(workdir, 'blacklist.txt')
+    def restore_parallel_files():
+        for pristine_filename, filename in zip(preprocessing.get_parallel_filenames(pristine_prefix),
+                                               preprocessing.get_parallel_filenames(prefix)):
+            shutil.copyfile(pristine_filename, filename)
+        if os.path.exists(blacklist_filename):
+            os.remove(blacklist_filename)
+
+    tgt_filename = preprocessing.get_tgt_filename(prefix)
+    pristine_tgt_filename = preprocessing.get_tgt_filename(pristine_prefix)
+    vocab_filename = os.path.join(workdir, 'vocab.txt')
+    preprocessing.build_vocab(pristine_tgt_filename, vocab_filename)
+    results.append(measure(
+        'replace_rare_tokens',
+        lambda: preprocessing.replace_rare_tokens(prefix, vocab_filename, min_word_freq=2),
+        len(corpus), setup=restore_parallel_files, repeat=repeat))
+
+    # use every other target line as the "test set" so about half the lines overlap
+    test_filename = os.path.join(workdir, 'test-tgt.txt')
+    with open(pristine_tgt_filename) as infile, open(test_filename, 'w') as outfile:
+        for i, line in enumerate(infile):
+            if i % 2 == 0:
+                outfile.write(line)
+    def run_remove_overlap():
+        remove_overlap.find_overlapping_lines(test_filename, tgt_filename, blacklist_filename)
+        remove_overlap.apply_blacklist(prefix, blacklist_filename, output_blank=True)
+    results.append(measure('remove_overlap', run_remove_overlap, len(corpus),
+                           setup=restore_parallel_files, repeat=repeat))
+
+    # postprocess the (unmodified) target file as if it were model predictions
+    anon_filename = preprocessing.get_anon_filename(pristine_prefix)
+    replacements_map_filename = os.path.join(workdir, 'anon-replacements.json')
+    replacements.build_replacement_map_most_common([anon_filename], replacements_map_filename)
+    results.append(measure(
+        'postprocess',
+        lambda: postprocessing.postprocess(pristine_tgt_filename, os.path.join(workdir, 'pred.text'),
+                                           anon_filename, replacements_map_filename),
+        len(corpus), repeat=repeat))
+    return results
+
+
+def compare_to_baseline(results, baseline):
+    """Print each stage's throughput and peak memory relative to the baseline run."""
+    baseline_by_stage = {r['stage']: r for r in baseline['results']}
+    print('{:<22} {:>12} {:>12}'.format('stage', 'speedup', 'peak mem'))
+    for r in results:
+        base = baseline_by_stage.get(r['stage'])
+        if base is None:
+            print('{:<22} {:>12} {:>12}'.format(r['stage'], '(new)', '(new)'))
+            continue
+        print('{:<22} {:>11.2f}x {:>11.2f}x'.format(
+            r['stage'], r['items_per_sec'] / base['items_per_sec'], r['peak_mb'] / base['peak_mb']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_graphs', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sample', default=os.path.join(ROOT_DIR, 'data/sample/sample.txt'),
+                        help='Synthetic graphs are shaped like the graphs in this file')
+    parser.add_argument('--repeat', type=int, default=3, help='Report the best time of this many runs')
+    parser.add_argument('--corpus', help='Benchmark this Penman file instead of generating one')
+    parser.add_argument('--save_baseline', help='Write results to this JSON file')
+    parser.add_argument('--baseline', help='Compare results to a JSON file written with --save_baseline')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='dmrs-bench-')
+    try:
+        penman_filename = args.corpus
+        if not penman_filename:
+            penman_filename = os.path.join(workdir, 'synthetic.txt')
+            synthetic_dmrs.write_corpus(penman_filename, args.num_graphs, seed=args.seed,
+                                        **synthetic_dmrs.params_from_sample(args.sample))
+        results = run_benchmarks(penman_filename, workdir, repeat=args.repeat)
+    finally:
+        shutil.rmtree(workdir)
+
+    run_info = {
+        'num_graphs': args.num_graphs,
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'corpus': args.corpus,
+        'python': sys.version.split()[0],
+        'results': results,
+    }
+    print(json.dumps(run_info, indent=4))
+    if args.baseline:
+        with open(args.baseline) as infile:
+            compare_to_baseline(results, json.load(infile))
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as outfile:
+            json.dump(run_info, outfile, indent=4)
+        sys.stderr.write('Saved baseline to {}\n'.format(os.path.abspath(args.save_baseline)))
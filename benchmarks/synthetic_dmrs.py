@@ -0,0 +1,216 @@
+"""
+Generate a synthetic corpus of Penman-serialized DMRS graphs with matching sentences.
+
+Output has the same format as data/sample/sample.txt (and the mrs-to-penman output read by
+preprocessing.py), so it can be fed through the whole pipeline at any scale. Graph shape is
+taken from a sample file: graph depth, graph size, and how often nodes are named/carg nodes or
+unknown words. Each graph's lnk spans point at the words of its generated sentence.
+
+Usage:
+python benchmarks/synthetic_dmrs.py --num_graphs 100000 --seed 1 --outfile data/synthetic.txt
+
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+
+SYLLABLES = ['ba', 'ker', 'lo', 'mi', 'son', 'ta', 'ven', 'ri', 'dor', 'gal', 'pe', 'nu', 'shi', 'tro']
+E_PROPERTIES = [('sf', ['PROP']), ('mood', ['INDICATIVE']), ('tense', ['PAST', 'PRES', 'FUT']), ('perf', ['-'])]
+MOD_PROPERTIES = [('perf', ['-']), ('tense', ['UNTENSED']), ('mood', ['INDICATIVE']), ('sf', ['PROP'])]
+X_PROPERTIES = [('ind', ['+']), ('num', ['SG', 'PL']), ('pers', ['3'])]
+QUANTIFIERS = [('_the_q', 'the'), ('_a_q', 'a')]
+PREPOSITIONS = ['in', 'of', 'at', 'on', 'for']
+
+
+def measure_structure(penman_filename):
+    """Measure graph shape in a Penman file.
+
+    Returns dict with the number of graphs, mean nodes per graph, max and mean graph depth,
+    and the fraction of nodes that have a carg or are unknown words.
+
+    """
+    with open(penman_filename) as infile:
+        graphs = re.split(r'\n\s*\n(?=\s*#)', infile.read().strip())
+    num_nodes = num_carg = num_unknown = 0
+    depths = []
+    for graph in graphs:
+        body = '\n'.join(line for line in graph.splitlines() if not line.startswith('#'))
+        num_nodes += len(re.findall(r'\(\s*\d+\s*/', body))
+        num_carg += body.count(':carg')
+        num_unknown += len(re.findall(r'_unknown\b', body))
+        depth = max_depth = 0
+        for char in body:
+            if char == '(':
+                depth += 1
+                max_depth = max(max_depth, depth)
+            elif char == ')':
+                depth -= 1
+        depths.append(max_depth)
+    return {
+        'graphs': len(graphs),
+        'nodes_per_graph': num_nodes / float(len(graphs)),
+        'max_depth': max(depths),
+        'mean_depth': sum(depths) / float(len(depths)),
+        'carg_ratio': num_carg / float(num_nodes),
+        'unknown_ratio': num_unknown / float(num_nodes),
+    }
+
+
+class SyntheticDmrsGenerator(object):
+    """Builds random DMRS graphs and sentences from a seeded random generator.
+
+    Usage:
+    > gen = SyntheticDmrsGenerator(seed=1, **params)
+    > penman_str, sentence = gen.generate()
+
+    """
+    def __init__(self, seed=0, max_depth=6, carg_ratio=0.15, unknown_ratio=0.02, vocab_size=5000):
+        self.rng = random.Random(seed)
+        self.max_depth = max_depth
+        self.carg_ratio = carg_ratio
+        self.unknown_ratio = unknown_ratio
+        self.nouns = self._make_words(vocab_size)
+        self.verbs = self._make_words(max(vocab_size // 4, 1))
+        self.adjectives = self._make_words(max(vocab_size // 4, 1))
+        self.names = [w.capitalize() for w in self._make_words(max(vocab_size // 2, 1))]
+        self.next_id = 10000
+
+    def _make_words(self, n):
+        return [''.join(self.rng.choice(SYLLABLES) for _ in range(self.rng.randint(2, 4))) for _ in range(n)]
+
+    def _choose(self, words):
+        # roughly Zipfian so some words are frequent and many are rare
+        return words[min(int(self.rng.paretovariate(1.0)) - 1, len(words) - 1)]
+
+    def _node(self, pred, word, props=(), carg=None):
+        self.next_id += 1
+        return {
+            'id': self.next_id, 'pred': pred, 'word': word, 'carg': carg,
+            'props': [(name, self.rng.choice(values)) for name, values in props],
+            'edges': [], 'before': [], 'after': [],
+        }
+
+    def _modifier(self):
+        # modifiers make up about a quarter of all nodes, so scale ratios up to hit the overall rate
+        r = self.rng.random()
+        if r < self.unknown_ratio * 4:
+            word = ''.join(self.rng.choice(SYLLABLES) for _ in range(5))
+            return self._node('_{}/jj_u_unknown'.format(word), word, MOD_PROPERTIES)
+        if r < (self.unknown_ratio + self.carg_ratio / 2) * 4:
+            number = str(self.rng.randint(2, 999))
+            return self._node('card', number, MOD_PROPERTIES, carg=number)
+        adj = self._choose(self.adjectives)
+        return self._node('_{}_a_1'.format(adj), adj, MOD_PROPERTIES)
+
+    def _noun(self, depth):
+        if self.rng.random() < self.carg_ratio:
+            name = self._choose(self.names)
+            return self._node('named', name, X_PROPERTIES, carg=name)
+        lemma = self._choose(self.nouns)
+        node = self._node('_{}_n_1'.format(lemma), lemma, X_PROPERTIES)
+        if dict(node['props'])['num'] == 'PL':
+            node['word'] += 's'
+        pred, word = self.rng.choice(QUANTIFIERS)
+        quantifier = self._node(pred, word)
+        node['edges'].append(('RSTR-H-of', quantifier))
+        node['before'].append(quantifier)
+        if depth > 1 and self.rng.random() < 0.6:
+            modifier = self._modifier()
+            node['edges'].append(('ARG1-EQ-of', modifier))
+            node['before'].append(modifier)
+        if depth > 2 and self.rng.random() < 0.6:
+            prep = self.rng.choice(PREPOSITIONS)
+            pp = self._node('_{}_p'.format(prep), prep, MOD_PROPERTIES)
+            obj = self._noun(depth - 2)
+            pp['edges'].append(('ARG2-NEQ', obj))
+            pp['after'].append(obj)
+            node['edges'].append(('ARG1-EQ-of', pp))
+            node['after'].append(pp)
+        return node
+
+    def _verb(self, depth):
+        lemma = self._choose(self.verbs)
+        node = self._node('_{}_v_1'.format(lemma), lemma + 'ed', E_PROPERTIES)
+        subj = self._noun(depth - 1)
+        node['edges'].append(('ARG1-NEQ', subj))
+        node['before'].append(subj)
+        if self.rng.random() < 0.8:
+            obj = self._noun(depth - 1)
+            node['edges'].append(('ARG2-NEQ', obj))
+            node['after'].append(obj)
+        return node
+
+    def _realize(self, node, words):
+        for child in node['before']:
+            self._realize(child, words)
+        words.append((node, node['word']))
+        for child in node['after']:
+            self._realize(child, words)
+
+    def _serialize(self, node, spans, indent, lines):
+        pad = '  ' * indent
+        lines.append('(' + '{} / {}'.format(node['id'], node['pred']))
+        start, end = spans[node['id']]
+        lines.append('{}  :lnk "<{}:{}>"'.format(pad, start, end))
+        if node['carg'] is not None:
+            lines.append('{}  :carg "{}"'.format(pad, node['carg']))
+        for name, value in node['props']:
+            lines.append('{}  :{} {}'.format(pad, name, value))
+        for rel, child in node['edges']:
+            child_lines = []
+            self._serialize(child, spans, indent + 1, child_lines)
+            lines.append('{}  :{} {}'.format(pad, rel, child_lines[0]))
+            lines.extend(child_lines[1:])
+        lines[-1] += ')'
+
+    def generate(self):
+        """Returns tuple of (penman_serialized_graph, sentence)."""
+        self.next_id = 10000
+        root = self._verb(self.rng.randint(2, self.max_depth))
+        words = []
+        self._realize(root, words)
+        spans = {}
+        offset = 0
+        for node, word in words:
+            spans[node['id']] = (offset, offset + len(word))
+            offset += len(word) + 1
+        sentence = ' '.join(word for _, word in words) + '.'
+        lines = []
+        self._serialize(root, spans, 0, lines)
+        return '\n'.join(lines), sentence
+
+
+def write_corpus(outfilename, num_graphs, seed=0, **params):
+    gen = SyntheticDmrsGenerator(seed=seed, **params)
+    with open(outfilename, 'w') as outfile:
+        for i in range(num_graphs):
+            penman_str, sentence = gen.generate()
+            outfile.write('# ::id {}\n# ::snt {}\n{}\n\n'.format(i, sentence, penman_str))
+    sys.stderr.write('Wrote {} synthetic graphs to {}\n'.format(num_graphs, os.path.abspath(outfilename)))
+
+
+def params_from_sample(sample_filename):
+    """Generator parameters matching the shape of graphs in sample_filename."""
+    structure = measure_structure(sample_filename)
+    return {
+        'max_depth': structure['max_depth'],
+        'carg_ratio': structure['carg_ratio'],
+        'unknown_ratio': structure['unknown_ratio'],
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_graphs', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--outfile', required=True, help='Penman-serialized graphs will be written here')
+    parser.add_argument('--sample', default='data/sample/sample.txt',
+                        help='Graph shape (depth, carg and unknown ratios) is measured from this file')
+    parser.add_argument('--vocab_size', type=int, default=5000)
+    args = parser.parse_args()
+    params = params_from_sample(args.sample)
+    sys.stderr.write('Generating graphs with {}\n'.format(params))
+    write_corpus(args.outfile, args.num_graphs, seed=args.seed, vocab_size=args.vocab_size, **params)
@@ -0,0 +1,85 @@
+"""
+Open plain, gzip (.gz) or zstandard (.zst) files, choosing by file extension.
+
+Compressed files are read and written as streams, so they never need to fit in memory. Files
+named from a prefix (like the parallel files written by preprocessing.py) can be compressed by
+adding the extension to the usual name, e.g. data/train/train-src.txt.gz, and find_file will
+pick up whichever version exists.
+
+.zst files need the zstandard package (pip install zstandard); nothing else does.
+
+Usage:
+> with fileio.open_file('data_gw/parsed.txt.zst') as infile:
+>     for line in infile:
+>         ...
+
+"""
+
+import gzip
+import os
+
+COMPRESSION_EXTENSIONS = ['.gz', '.zst']
+GZIP_LEVEL = 6  # gzip's default of 9 is much slower to write for little gain
+ZSTD_LEVEL = 3
+
+
+def get_compression(filename):
+    """Compression extension of filename ('.gz' or '.zst'), or '' if it isn't compressed."""
+    for ext in COMPRESSION_EXTENSIONS:
+        if filename.endswith(ext):
+            return ext
+    return ''
+
+
+def with_compression(filename, compression):
+    """Add a compression extension (like 'gz', '.gz', or None for none) to filename."""
+    if not compression:
+        return filename
+    return filename + (compression if compression.startswith('.') else '.' + compression)
+
+
+def add_suffix(filename, suffix):
+    """Add suffix to filename before any compression extension. (train-src.txt.gz -> train-src.txt.full.gz)"""
+    compression = get_compression(filename)
+    return filename[:len(filename) - len(compression)] + suffix + compression
+
+
+def find_file(filename):
+    """Return filename if it exists, otherwise a compressed version of it that exists.
+
+    If neither exists, returns filename unchanged (so the caller's open fails as usual).
+
+    """
+    if os.path.exists(filename) or get_compression(filename):
+        return filename
+    for ext in COMPRESSION_EXTENSIONS:
+        if os.path.exists(filename + ext):
+            return filename + ext
+    return filename
+
+
+def open_file(filename, mode='r', encoding=None):
+    """Like open(), but transparently (de)compresses .gz and .zst files.
+
+    Text mode (the default) uses encoding, or the locale's encoding if it's None, as open() does.
+
+    """
+    compression = get_compression(filename)
+    binary = 'b' in mode
+    if compression == '.gz':
+        if binary:
+            return gzip.open(filename, mode, compresslevel=GZIP_LEVEL)
+        return gzip.open(filename, mode.replace('t', '') + 't', compresslevel=GZIP_LEVEL, encoding=encoding)
+    if compression == '.zst':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError('Reading or writing {} requires the zstandard package (pip install zstandard)'.format(
+                filename))
+        kwargs = {}
+        if 'w' in mode or 'a' in mode:
+            kwargs['cctx'] = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        if binary:
+            return zstandard.open(filename, mode, **kwargs)
+        return zstandard.open(filename, mode.replace('t', '') + 't', encoding=encoding, **kwargs)
+    return open(filename, mode, encoding=encoding)
@@ -14,26 +14,47 @@ Usage (if not using defaults):
 Note: you currently need to change the list of profiles in code to switch
 from dev to test.
 
+Per-item generation time is written as one json object per line to the run log
+(--run-log), and p50/p95/p99 latencies and the slowest items for each profile are
+printed to stderr and saved to {run log}.summary.json
+
 """
 import sys
 import os
 import re
 import argparse
 import json
+import math
+import time
 
 from delphin.interfaces import ace
 from delphin.mrs import xmrs, simplemrs, penman
 from delphin.mrs.components import var_sort
-from delphin import itsdb
+
+from profiles import read_profile
 
 # Parser hangs on these ids
 BAD_IDS = set(['1000009000880'])
 
-def run(input_dirs, args, output_filename):
+# Number of slowest items to list in each profile's timing summary
+NUM_SLOWEST = 10
+
+
+def run(input_dirs, args, output_filename, runlog_filename=None):
     """Run for each input dir."""
+    summaries = []
+    runlog = open(runlog_filename, 'w') if runlog_filename else None
     with open(output_filename, 'w') as outfile:
         for profile in input_dirs:
-            process(read_profile(profile, args), args, outfile)
+            records = process(read_profile(profile, args), args, outfile, runlog=runlog, profile=profile)
+            summary = summarize_latency(profile, records)
+            print_latency_summary(summary)
+            summaries.append(summary)
+    if runlog:
+        runlog.close()
+        with open(runlog_filename + '.summary.json', 'w') as summary_file:
+            json.dump(summaries, summary_file, indent=4)
+    return summaries
 
 
 def run_debug(input_dirs, args, output_filename):
@@ -45,11 +66,20 @@ def run_debug(input_dirs, args, output_filename):
                 outfile.write('{}\n'.format(snt))
 
 
-def process(items, args, outfile):
-    """Generate text from MRS."""
+def process(items, args, outfile, runlog=None, profile=None):
+    """Generate text from MRS.
+
+    Returns list of per-item records with the wall time spent on each item. If runlog
+    is given, each record is also written to it as a line of json as soon as the item
+    finishes, so the last line shows how far a slow or hung run got.
+
+    """
     i = 0
+    records = []
     for item_id, snt, mrss in items:
         print('# ::id {}\n# ::snt {}'.format(item_id, snt))
+        start_time = time.perf_counter()
+        error = None
         try:
             if mrss is None:
                 raise ValueError("mrss was None")
@@ -60,35 +90,70 @@ def process(items, args, outfile):
             outfile.write(response.result(0)['surface'] + '\n')
         except Exception as ex:
             outfile.write('\n')
-            print('Item {}\t{}'.format(item_id, str(ex)), file=sys.stderr)
+            error = str(ex)
+            print('Item {}\t{}'.format(item_id, error), file=sys.stderr)
+        record = {
+            'profile': profile,
+            'item_id': item_id,
+            'seconds': time.perf_counter() - start_time,
+            'num_eps': mrs_size(mrss),
+            'ok': error is None,
+            'error': error,
+        }
+        records.append(record)
+        if runlog:
+            runlog.write(json.dumps(record) + '\n')
+            runlog.flush()
         print()
         i += 1
         if i % 100 == 0:
             outfile.flush()
-
-
-def read_profile(f, args):
-    """Load MRS from tsdb. (Copied from mrs_to_penman.py)"""
-    p = itsdb.ItsdbProfile(f)
-    inputs = dict((r['i-id'], r['i-input']) for r in p.read_table('item'))
-    cur_id, mrss = None, []
-    for row in p.join('parse', 'result'):
-        try:
-            mrs = simplemrs.loads_one(row['result:mrs'])
-
-            if cur_id is None:
-                cur_id = row['parse:i-id']
-
-            if cur_id == row['parse:i-id']:
-                mrss.append(mrs)
-            else:
-                yield (cur_id, inputs[cur_id], mrss)
-                cur_id, mrss = row['parse:i-id'], [mrs]
-        except Exception as ex:
-            print('Could not read profile from file {}, row: {}\n'.format(f, row))
-            mrss = None  # error case, must be handled by caller
-
-    yield (cur_id, inputs[cur_id], mrss)
+    return records
+
+
+def mrs_size(mrss):
+    """Number of EPs in the first MRS of an item, or None if it couldn't be read."""
+    try:
+        return len(mrss[0].eps())
+    except Exception:
+        return None
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = int(math.ceil(pct / 100.0 * len(sorted_values))) - 1
+    return sorted_values[min(max(rank, 0), len(sorted_values) - 1)]
+
+
+def summarize_latency(profile, records):
+    """Latency percentiles and slowest items for one profile's records."""
+    seconds = sorted(r['seconds'] for r in records)
+    slowest = sorted(records, key=lambda r: r['seconds'], reverse=True)[:NUM_SLOWEST]
+    return {
+        'profile': profile,
+        'items': len(records),
+        'failed': sum(1 for r in records if not r['ok']),
+        'total_seconds': sum(seconds),
+        'p50': percentile(seconds, 50),
+        'p95': percentile(seconds, 95),
+        'p99': percentile(seconds, 99),
+        'max': seconds[-1] if seconds else None,
+        'slowest': [{'item_id': r['item_id'], 'seconds': r['seconds'], 'num_eps': r['num_eps']}
+                    for r in slowest],
+    }
+
+
+def print_latency_summary(summary):
+    if not summary['items']:
+        print('{}: no items'.format(summary['profile']), file=sys.stderr)
+        return
+    print('{profile}: {items} items ({failed} failed) in {total_seconds:.1f}s, '
+          'p50 {p50:.3f}s p95 {p95:.3f}s p99 {p99:.3f}s max {max:.3f}s'.format(**summary),
+          file=sys.stderr)
+    for r in summary['slowest'][:3]:
+        print('  slow: item {item_id} {seconds:.3f}s ({num_eps} EPs)'.format(**r), file=sys.stderr)
 
 
 def get_test_profiles():
@@ -139,10 +204,12 @@ if __name__ == '__main__':
                            help='path to a grammar file compiled with ACE')
     argparser.add_argument('--ace-binary', default='mrs-to-penman/ace-0.9.25/ace',
                            help='path to the ACE binary (default: mrs-to-penman/ace-0.9.25/ace)')
+    argparser.add_argument('--run-log', default='results/ace.pred.test.runlog.jsonl',
+                           help='per-item timings are written here, one json object per line')
     args = argparser.parse_args()
     #dev_profiles = ["ecpa", "jh5", "tg2", "ws12", "wsj20a", "wsj20b", "wsj20c", "wsj20d", "wsj20e"]
     test_profiles = get_test_profiles()
     input_dirs = ["mrs-to-penman/profiles/%s" % prof for prof in test_profiles]
     output_filename = "results/ace.pred.test.text"
-    run(input_dirs, args, output_filename)
+    run(input_dirs, args, output_filename, runlog_filename=args.run_log)
     #generate_parallel_text(input_dirs, args, 'data/test/ace-test-orig.debug.txt')
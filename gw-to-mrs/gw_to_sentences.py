@@ -1,12 +1,19 @@
 """
-Usage: python run.py
+Usage: python gw_to_sentences.py [--sample_size N --seed S]
 
 Extracts sentences and writes them to a new file, one per line, with a unique id.
 
-After the run:
+Gzipped Gigaword files are parsed incrementally and spread across a pool of worker processes.
+With --sample_size, only a seeded, uniformly random subset of that many sentences is kept
+(in random order), so the full sentences.txt never needs to be written. Each sentence is given
+a random key from a generator seeded by the file it came from, and the sentences with the
+smallest keys are kept, so the sample doesn't depend on how files were scheduled. The largest
+key in the sample so far is shared with the workers, which drop sentences with larger keys
+instead of sending them back, so memory stays about sample_size sentences however many files
+there are.
 
-Get a random subset of 1M:
-> cat sentences.txt | shuf | head -n 1000000 > sentences1M.txt
+Get a random subset of 1M in one pass:
+> python gw_to_sentences.py --sample_size 1000000 --seed 1 --outfile sentences1M.txt
 
 Check vocab size with:
 > cat sentences1M.txt | awk -F'\t' '{print $2}' | tr -d '[:punct:]' | tr -d '0123456789' | tr '[:upper:]' '[:lower:]' | tr ' ' '\n' | sort | uniq | wc -l
@@ -20,42 +27,161 @@ Write ids and sentences to separate files:
 
 """
 
-from collections import deque
 from lxml import etree
+from multiprocessing import Pool, RawValue
 
+import argparse
 import glob
 import gzip
+import heapq
 import nltk
 import os
+import random
 import re
 import sys
 
 GIGAWORD_BASE_DIR='/data/corpora/gigaword_eng_5/data'
+THRESHOLD_CHECK_INTERVAL = 1000  # sentences between a worker's reads of the shared key threshold
 
+# largest key in the parent's sample once it's full (infinity until then), shared with the workers
+_key_threshold = None
 
-def extract_sentences(base_dir, outfilename='sentences.txt'):
-    html_parser = etree.HTMLParser()
+
+def _init_sample_worker(key_threshold):
+    global _key_threshold
+    _key_threshold = key_threshold
+
+
+def iter_file_sentences(filename):
+    """Yield (sent_id, sentence) for every sentence in a gzipped Gigaword file.
+
+    Paragraphs are read with iterparse so the whole document tree is never held in memory.
+
+    """
+    doc_id = os.path.basename(filename)
+    with gzip.open(filename, 'rb') as doc_file:
+        pnum = 0
+        for _, pnode in etree.iterparse(doc_file, events=('end',), tag=('p', 'doc'), html=True):
+            if pnode.tag == 'doc':
+                # free documents that have already been processed (their paragraphs are gone already)
+                pnode.clear()
+                while pnode.getprevious() is not None:
+                    del pnode.getparent()[0]
+                continue
+            text = (pnode.text or '').strip()
+            sentences = nltk.sent_tokenize(text)  # FIXME: use Moses instead
+            for snum, sent in enumerate(sentences):
+                sent_id = '{}_{}_{}'.format(doc_id, pnum, snum)
+                sent = re.sub('\s+', ' ', sent)  # make sure no tabs or newlines
+                yield sent_id, sent
+            pnum += 1
+            # free paragraphs that have already been processed
+            pnode.clear()
+            while pnode.getprevious() is not None:
+                del pnode.getparent()[0]
+
+
+def extract_file_sentences(filename):
+    """Return list of all (sent_id, sentence) tuples in a file."""
+    return list(iter_file_sentences(filename))
+
+
+def sample_file_sentences(args):
+    """Return up to sample_size (-key, sent_id, sentence) tuples with the smallest random keys.
+
+    Keys come from a generator seeded with the seed and file name, so the same sentences are
+    chosen no matter which worker processes the file. Sentences with keys above the shared
+    threshold can't be in the final sample, so they're dropped.
+
+    """
+    filename, sample_size, seed = args
+    rng = random.Random('{}:{}'.format(seed, os.path.basename(filename)))
+    # max-heap (via negated keys) of the sample_size smallest keys seen so far
+    reservoir = []
+    num_sentences = 0
+    threshold = _key_threshold.value if _key_threshold is not None else float('inf')
+    for sent_id, sent in iter_file_sentences(filename):
+        key = rng.random()
+        num_sentences += 1
+        if num_sentences % THRESHOLD_CHECK_INTERVAL == 0 and _key_threshold is not None:
+            threshold = _key_threshold.value
+        if key > threshold:
+            continue
+        if len(reservoir) < sample_size:
+            heapq.heappush(reservoir, (-key, sent_id, sent))
+        elif key < -reservoir[0][0]:
+            heapq.heapreplace(reservoir, (-key, sent_id, sent))
+    return num_sentences, reservoir
+
+
+def get_filenames(base_dir):
+    # use files published before 2000 since these are closer to wsj corpus
+    return sorted(glob.glob(os.path.join(base_dir, "*/*_19*.gz")))  # 1900s
+
+
+def extract_sentences(base_dir, outfilename='sentences.txt', processes=None):
+    """Write every sentence from every file, in file order."""
+    filenames = get_filenames(base_dir)
+    pool = Pool(processes)
     with open (outfilename, 'w') as outfile:
         num_sentences = 0
         num_files = 0
-        # use files published before 2000 since these are closer to wsj corpus
-        for filename in glob.glob(os.path.join(base_dir, "*/*_19*.gz")):  # 1900s
-            doc_id = os.path.basename(filename)
-            doc_file = gzip.open(filename, 'rb')
-            doc_html_tree = etree.parse(doc_file, html_parser)
-            paragraph_nodes = doc_html_tree.xpath('//p')
-            for pnum, pnode in enumerate(paragraph_nodes):
-                sentences = nltk.sent_tokenize(pnode.text.strip())  # FIXME: use Moses instead
-                for snum, sent in enumerate(sentences):
-                    sent_id = '{}_{}_{}'.format(doc_id, pnum, snum)
-                    sent = re.sub('\s+', ' ', sent)  # make sure no tabs or newlines
-                    outfile.write('{}\t{}\n'.format(sent_id, sent))
-                    num_sentences += 1
-                    if num_sentences % 100000 == 0:
-                        sys.stderr.write('Wrote {} sentences\n'.format(num_sentences))
+        for file_sentences in pool.imap(extract_file_sentences, filenames):
+            for sent_id, sent in file_sentences:
+                outfile.write('{}\t{}\n'.format(sent_id, sent))
+                num_sentences += 1
+                if num_sentences % 100000 == 0:
+                    sys.stderr.write('Wrote {} sentences\n'.format(num_sentences))
             num_files += 1
             if num_files % 10 == 0:
                 sys.stderr.write('Processed {} files\n'.format(num_files))
+    pool.close()
+    pool.join()
+
+
+def sample_sentences(base_dir, outfilename, sample_size, seed=0, processes=None):
+    """Write a seeded random sample of sample_size sentences, in random order."""
+    filenames = get_filenames(base_dir)
+    key_threshold = RawValue('d', float('inf'))  # only written here, so no lock needed
+    pool = Pool(processes, initializer=_init_sample_worker, initargs=(key_threshold,))
+    # max-heap (via negated keys) of the sample_size smallest keys across all files seen so far
+    reservoir = []
+    num_sentences = 0
+    num_files = 0
+    tasks = [(filename, sample_size, seed) for filename in filenames]
+    for file_num_sentences, file_sample in pool.imap_unordered(sample_file_sentences, tasks):
+        num_sentences += file_num_sentences
+        for item in file_sample:
+            if len(reservoir) < sample_size:
+                heapq.heappush(reservoir, item)
+            elif item > reservoir[0]:
+                heapq.heapreplace(reservoir, item)
+        if len(reservoir) == sample_size:
+            key_threshold.value = -reservoir[0][0]
+        num_files += 1
+        if num_files % 10 == 0:
+            sys.stderr.write('Processed {} files ({} sentences)\n'.format(num_files, num_sentences))
+    pool.close()
+    pool.join()
+    sample = sorted((-neg_key, sent_id, sent) for neg_key, sent_id, sent in reservoir)
+    with open(outfilename, 'w') as outfile:
+        for _, sent_id, sent in sample:
+            outfile.write('{}\t{}\n'.format(sent_id, sent))
+    sys.stderr.write('Wrote {} of {} sentences to {}\n'.format(
+        len(sample), num_sentences, os.path.abspath(outfilename)))
+
 
 if __name__ == '__main__':
-    extract_sentences(GIGAWORD_BASE_DIR)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--base_dir', default=GIGAWORD_BASE_DIR, help='Gigaword data directory')
+    parser.add_argument('--outfile', default='sentences.txt', help='Sentences will be written here')
+    parser.add_argument('--sample_size', type=int,
+                        help='If given, write a random sample of this many sentences instead of all of them')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed used for sampling')
+    parser.add_argument('--processes', type=int, help='Number of worker processes (default: number of CPUs)')
+    args = parser.parse_args()
+    if args.sample_size:
+        sample_sentences(args.base_dir, args.outfile, args.sample_size, seed=args.seed,
+                         processes=args.processes)
+    else:
+        extract_sentences(args.base_dir, args.outfile, processes=args.processes)
@@ -0,0 +1,213 @@
+"""
+Parse a large sentence file to DMRS by splitting it into shards and running several parser
+processes at once.
+
+Replaces the split + background job steps in run.sh. Shards and their parses are kept in a
+work directory along with a manifest that records which shards are done, so an interrupted run
+can be restarted with the same command and will only parse shards that haven't finished. Failed
+shards are retried, and when every shard is done the parses are concatenated in shard order.
+
+Usage:
+> python parse_shards.py sentences1M_text.txt parsed.txt --workdir data --workers 8
+
+The parser command is a template where {input} is replaced with the shard filename. Its stdout
+is saved as the shard's parse. To check the pipeline without ACE, use a stand-in parser:
+> python parse_shards.py sentences.txt parsed.txt --workdir /tmp/shards --parser_cmd "cat {input}"
+
+"""
+
+from multiprocessing.pool import ThreadPool
+
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+import threading
+import time
+
+DEFAULT_PARSER_CMD = (
+    'python3 ../mrs-to-penman/mrs_to_penman.py '
+    '--ace-binary ../mrs-to-penman/ace-0.9.25/ace '
+    '-g ../mrs-to-penman/erg-1214-x86-64-0.9.25.dat '
+    '-i {input} '
+    '-p ../mrs-to-penman/parameters.json'
+)
+
+
+def get_manifest_filename(workdir):
+    return os.path.join(workdir, 'manifest.json')
+
+
+def get_shard_filename(workdir, shard_num):
+    return os.path.join(workdir, 'sentences.{:05d}'.format(shard_num))
+
+
+def get_parse_filename(shard_filename):
+    return shard_filename + '.mrs'
+
+
+def load_manifest(workdir):
+    manifest_filename = get_manifest_filename(workdir)
+    if not os.path.exists(manifest_filename):
+        return None
+    with open(manifest_filename) as infile:
+        return json.load(infile)
+
+
+def save_manifest(workdir, manifest):
+    """Write manifest to a temp file and rename it so a crash never leaves it half-written."""
+    manifest_filename = get_manifest_filename(workdir)
+    with open(manifest_filename + '.tmp', 'w') as outfile:
+        json.dump(manifest, outfile, indent=4, sort_keys=True)
+    os.replace(manifest_filename + '.tmp', manifest_filename)
+
+
+def split_into_shards(infilename, workdir, lines_per_shard):
+    """Split infilename into shards of lines_per_shard lines. Returns list of shard filenames."""
+    shard_filenames = []
+    outfile = None
+    with open(infilename) as infile:
+        for i, line in enumerate(infile):
+            if i % lines_per_shard == 0:
+                if outfile:
+                    outfile.close()
+                shard_filenames.append(get_shard_filename(workdir, len(shard_filenames)))
+                outfile = open(shard_filenames[-1], 'w')
+            outfile.write(line)
+    if outfile:
+        outfile.close()
+    sys.stderr.write('Split {} into {} shards in {}\n'.format(
+        infilename, len(shard_filenames), os.path.abspath(workdir)))
+    return shard_filenames
+
+
+def init_manifest(infilename, workdir, lines_per_shard):
+    """Load the manifest for a previous run of the same input, or shard the input and create one."""
+    manifest = load_manifest(workdir)
+    if manifest is not None:
+        if (manifest['input'], manifest['lines_per_shard']) != (os.path.abspath(infilename), lines_per_shard):
+            raise ValueError(
+                'Work dir {} was created for {} with {} lines per shard. Use a different '
+                '--workdir or remove it to start over.'.format(
+                    workdir, manifest['input'], manifest['lines_per_shard']))
+        sys.stderr.write('Resuming from {}\n'.format(get_manifest_filename(workdir)))
+        return manifest
+    shard_filenames = split_into_shards(infilename, workdir, lines_per_shard)
+    manifest = {
+        'input': os.path.abspath(infilename),
+        'lines_per_shard': lines_per_shard,
+        'shards': {
+            os.path.basename(shard_filename): {'status': 'pending', 'attempts': 0}
+            for shard_filename in shard_filenames
+        },
+    }
+    save_manifest(workdir, manifest)
+    return manifest
+
+
+def parse_shard(shard_filename, parser_cmd):
+    """Run parser on one shard, writing its stdout to the shard's parse file.
+
+    Output goes to a temp file that is only renamed once the parser exits successfully, so a
+    parse file never exists for a shard that didn't finish.
+
+    """
+    parse_filename = get_parse_filename(shard_filename)
+    cmd = shlex.split(parser_cmd.format(input=shlex.quote(shard_filename)))
+    with open(parse_filename + '.tmp', 'w') as outfile, \
+         open(shard_filename + '.log', 'w') as logfile:
+        returncode = subprocess.call(cmd, stdout=outfile, stderr=logfile)
+    if returncode != 0:
+        raise RuntimeError('Parser exited with status {} (see {}.log)'.format(returncode, shard_filename))
+    os.replace(parse_filename + '.tmp', parse_filename)
+
+
+def run_shards(workdir, manifest, parser_cmd, workers=None, max_attempts=3):
+    """Parse every shard that isn't done yet, retrying failures. Returns number of failed shards."""
+    lock = threading.Lock()
+    todo = sorted(name for name, shard in manifest['shards'].items()
+                  if shard['status'] != 'done'
+                  or not os.path.exists(get_parse_filename(os.path.join(workdir, name))))
+    num_shards = len(manifest['shards'])
+    num_done = [num_shards - len(todo)]
+    sys.stderr.write('{} of {} shards already done, parsing {}\n'.format(num_done[0], num_shards, len(todo)))
+
+    def run_one(name):
+        shard = manifest['shards'][name]
+        shard_filename = os.path.join(workdir, name)
+        for attempt in range(1, max_attempts + 1):
+            with lock:
+                shard['status'] = 'running'
+                shard['attempts'] += 1
+                save_manifest(workdir, manifest)
+            start_time = time.time()
+            try:
+                parse_shard(shard_filename, parser_cmd)
+            except Exception as e:
+                with lock:
+                    shard['status'] = 'failed'
+                    shard['error'] = str(e)
+                    save_manifest(workdir, manifest)
+                sys.stderr.write('Shard {} failed on attempt {}: {}\n'.format(name, attempt, e))
+                continue
+            with lock:
+                shard['status'] = 'done'
+                shard['seconds'] = round(time.time() - start_time, 3)
+                shard.pop('error', None)
+                save_manifest(workdir, manifest)
+                num_done[0] += 1
+                sys.stderr.write('Finished shard {} in {:.1f}s ({} of {} done)\n'.format(
+                    name, shard['seconds'], num_done[0], num_shards))
+            return
+
+    # each worker just waits on a parser subprocess, so threads are enough
+    pool = ThreadPool(workers or os.cpu_count())
+    pool.map(run_one, todo, chunksize=1)
+    pool.close()
+    pool.join()
+    return sum(1 for shard in manifest['shards'].values() if shard['status'] != 'done')
+
+
+def merge_parses(workdir, manifest, outfilename):
+    """Concatenate shard parses in shard order."""
+    with open(outfilename, 'w') as outfile:
+        for name in sorted(manifest['shards']):
+            with open(get_parse_filename(os.path.join(workdir, name))) as infile:
+                for line in infile:
+                    outfile.write(line)
+    sys.stderr.write('Merged {} shard parses into {}\n'.format(
+        len(manifest['shards']), os.path.abspath(outfilename)))
+
+
+def parse_sharded(infilename, outfilename, workdir, parser_cmd=DEFAULT_PARSER_CMD,
+                  lines_per_shard=50000, workers=None, max_attempts=3):
+    if not os.path.exists(workdir):
+        os.makedirs(workdir)
+    manifest = init_manifest(infilename, workdir, lines_per_shard)
+    num_failed = run_shards(workdir, manifest, parser_cmd, workers=workers, max_attempts=max_attempts)
+    if num_failed:
+        sys.stderr.write('{} shards failed after {} attempts. Rerun the same command to retry '
+                         'them.\n'.format(num_failed, max_attempts))
+        return False
+    merge_parses(workdir, manifest, outfilename)
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('infile', help='Sentences to parse, one per line')
+    parser.add_argument('outfile', help='Merged parses will be written here')
+    parser.add_argument('--workdir', default='data', help='Shards, parses and manifest are stored here')
+    parser.add_argument('--parser_cmd', default=DEFAULT_PARSER_CMD,
+                        help='Parser command template; {input} is replaced with the shard filename '
+                             'and stdout is saved as the parse')
+    parser.add_argument('--lines_per_shard', type=int, default=50000)
+    parser.add_argument('--workers', type=int, help='Number of parsers to run at once (default: number of CPUs)')
+    parser.add_argument('--max_attempts', type=int, default=3, help='Times to try each shard before giving up')
+    args = parser.parse_args()
+    ok = parse_sharded(args.infile, args.outfile, args.workdir, parser_cmd=args.parser_cmd,
+                       lines_per_shard=args.lines_per_shard, workers=args.workers,
+                       max_attempts=args.max_attempts)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,247 @@
+"""
+Export parallel files as token ids, so training and length statistics don't re-parse text.
+
+For each side (src and tgt) of a parallel-file prefix created by preprocessing.py, writes:
+* {out_prefix}-{side}.ids.npy: int32 word id of every token, all lines concatenated
+* {out_prefix}-{side}.feats.npy: int32 feature ids, shape (num_tokens, num_features), for
+  sides whose tokens carry word features (e.g. "_open_v_1￨mood=INDICATIVE|sf=PROP")
+* {out_prefix}-{side}.offsets.npy: int64 start of each line in the id arrays, plus the end
+  of the last line, so line i is ids[offsets[i]:offsets[i + 1]] (blank lines are empty)
+* {out_prefix}-{side}.vocab.txt and {out_prefix}-{side}.feat{n}.vocab.txt: one token per line
+  with its frequency (same format as build_vocab); a token's id is its line number
+and a summary of counts and filenames in {out_prefix}-numeric.json.
+
+Ids 0-3 are reserved for <unk>, <blank>, <s> and </s>, in the same order as OpenNMT. The
+arrays are .npy files, so they can be memory-mapped with np.load(filename, mmap_mode='r') (see
+load_numericalized). Line lengths are just np.diff(offsets). Compressed (.gz or .zst) parallel
+files are found by prefix and read as they are.
+
+Usage:
+> python numericalize.py --prefix data/train/train --out_prefix data/train/train
+> python numericalize.py --prefix data/dev/dev --out_prefix data/dev/dev --vocab_prefix data/train/train
+
+"""
+
+from collections import Counter
+import argparse
+import io
+import json
+import os
+import sys
+
+import numpy as np
+
+import fileio
+import preprocessing
+
+SPECIALS = ['<unk>', '<blank>', '<s>', '</s>']
+UNK_ID = 0
+FEATURE_SEPARATOR = '￨'  # N.B. '￨' not '|'
+SIDES = {
+    'src': preprocessing.get_src_filename,
+    'tgt': preprocessing.get_tgt_filename,
+}
+# number of token ids buffered before being copied into the memory-mapped arrays
+WRITE_CHUNK_SIZE = 1000000
+
+
+def get_ids_filename(prefix, side):
+    return '{}-{}.ids.npy'.format(prefix, side)
+
+
+def get_feats_filename(prefix, side):
+    return '{}-{}.feats.npy'.format(prefix, side)
+
+
+def get_offsets_filename(prefix, side):
+    return '{}-{}.offsets.npy'.format(prefix, side)
+
+
+def get_vocab_filename(prefix, side, feature_num=None):
+    if feature_num is None:
+        return '{}-{}.vocab.txt'.format(prefix, side)
+    return '{}-{}.feat{}.vocab.txt'.format(prefix, side, feature_num)
+
+
+def get_summary_filename(prefix):
+    return '{}-numeric.json'.format(prefix)
+
+
+def count_tokens(infilename):
+    """Count words and the values of each word feature in a file.
+
+    Returns tuple of (num_lines, num_tokens, word_counts, feature_counts), where feature_counts
+    has one Counter per feature position.
+
+    """
+    num_lines = 0
+    num_tokens = 0
+    word_counts = Counter()
+    feature_counts = None
+    with fileio.open_file(infilename, encoding='utf8') as infile:
+        for line in infile:
+            num_lines += 1
+            for token in line.split():
+                parts = token.split(FEATURE_SEPARATOR)
+                if feature_counts is None:
+                    feature_counts = [Counter() for _ in parts[1:]]
+                if len(parts) != len(feature_counts) + 1:
+                    raise ValueError('Line {} of {} has token {} with {} features, expected {}'.format(
+                        num_lines, infilename, token, len(parts) - 1, len(feature_counts)))
+                word_counts[parts[0]] += 1
+                for counts, value in zip(feature_counts, parts[1:]):
+                    counts[value] += 1
+                num_tokens += 1
+    return num_lines, num_tokens, word_counts, feature_counts or []
+
+
+def make_vocab(counts):
+    """List of (token, freq), specials first and then by descending frequency."""
+    return [(token, 0) for token in SPECIALS] + \
+        [(token, freq) for token, freq in counts.most_common() if token not in SPECIALS]
+
+
+def write_vocab(vocab, vocab_filename):
+    with io.open(vocab_filename, 'w', encoding='utf8') as outfile:
+        for token, freq in vocab:
+            outfile.write(u'{}\t{}\n'.format(token, freq))
+
+
+def read_vocab(vocab_filename):
+    """Read a vocab written by write_vocab. Returns list of (token, freq) in id order."""
+    vocab = []
+    with io.open(vocab_filename, encoding='utf8') as infile:
+        for line in infile:
+            token, freq = line.rstrip('\n').split('\t')
+            vocab.append((token, int(freq)))
+    return vocab
+
+
+def numericalize_file(infilename, out_prefix, side, vocab_prefix=None, min_word_freq=0):
+    """Write id, feature, offset and vocab files for one side of a parallel-file prefix.
+
+    Vocabs are built from infilename unless vocab_prefix is given, in which case the vocabs
+    written for that prefix are reused (e.g., so dev data gets the ids of the training data).
+    Words seen fewer than min_word_freq times map to <unk>.
+
+    Returns dict of counts and filenames.
+
+    """
+    num_lines, num_tokens, word_counts, feature_counts = count_tokens(infilename)
+    if vocab_prefix:
+        vocab = read_vocab(get_vocab_filename(vocab_prefix, side))
+        feature_vocabs = [read_vocab(get_vocab_filename(vocab_prefix, side, n))
+                          for n in range(len(feature_counts))]
+    else:
+        vocab = make_vocab(word_counts)
+        feature_vocabs = [make_vocab(counts) for counts in feature_counts]
+    word_ids = {token: i for i, (token, freq) in enumerate(vocab)
+                if i < len(SPECIALS) or freq >= min_word_freq}
+    feature_ids = [{token: i for i, (token, _) in enumerate(feature_vocab)} for feature_vocab in feature_vocabs]
+    num_features = len(feature_ids)
+
+    ids = np.lib.format.open_memmap(
+        get_ids_filename(out_prefix, side), mode='w+', dtype=np.int32, shape=(num_tokens,))
+    feats = None
+    if num_features:
+        feats = np.lib.format.open_memmap(
+            get_feats_filename(out_prefix, side), mode='w+', dtype=np.int32, shape=(num_tokens, num_features))
+    offsets = np.zeros(num_lines + 1, dtype=np.int64)
+    num_unk = 0
+    start = 0  # position in ids of first buffered token
+    id_buffer = []
+    feat_buffer = []
+    with fileio.open_file(infilename, encoding='utf8') as infile:
+        for i, line in enumerate(infile):
+            for token in line.split():
+                parts = token.split(FEATURE_SEPARATOR)
+                word_id = word_ids.get(parts[0], UNK_ID)
+                num_unk += word_id == UNK_ID
+                id_buffer.append(word_id)
+                if num_features:
+                    feat_buffer.append([ids_map.get(value, UNK_ID) for ids_map, value in zip(feature_ids, parts[1:])])
+            offsets[i + 1] = start + len(id_buffer)
+            if len(id_buffer) >= WRITE_CHUNK_SIZE:
+                start = _flush(ids, feats, start, id_buffer, feat_buffer)
+    _flush(ids, feats, start, id_buffer, feat_buffer)
+    ids.flush()
+    np.save(get_offsets_filename(out_prefix, side), offsets)
+    if feats is not None:
+        feats.flush()
+    if not vocab_prefix:
+        write_vocab(vocab, get_vocab_filename(out_prefix, side))
+        for n, feature_vocab in enumerate(feature_vocabs):
+            write_vocab(feature_vocab, get_vocab_filename(out_prefix, side, n))
+    vocab_source = vocab_prefix or out_prefix
+    summary = {
+        'infile': os.path.abspath(infilename),
+        'lines': num_lines,
+        'tokens': num_tokens,
+        'unk_tokens': int(num_unk),
+        'vocab_size': len(vocab),
+        'feature_vocab_sizes': [len(feature_vocab) for feature_vocab in feature_vocabs],
+        'ids': get_ids_filename(out_prefix, side),
+        'feats': get_feats_filename(out_prefix, side) if num_features else None,
+        'offsets': get_offsets_filename(out_prefix, side),
+        'vocab': get_vocab_filename(vocab_source, side),
+        'feature_vocabs': [get_vocab_filename(vocab_source, side, n) for n in range(num_features)],
+    }
+    sys.stderr.write('Wrote {} ids for {} lines of {} ({} <unk>, {} features) to {}\n'.format(
+        num_tokens, num_lines, infilename, num_unk, num_features, summary['ids']))
+    return summary
+
+
+def _flush(ids, feats, start, id_buffer, feat_buffer):
+    """Copy buffered ids into the memory-mapped arrays and empty the buffers. Returns new start."""
+    end = start + len(id_buffer)
+    ids[start:end] = id_buffer
+    if feats is not None and feat_buffer:
+        feats[start:end] = feat_buffer
+    del id_buffer[:]
+    del feat_buffer[:]
+    return end
+
+
+def numericalize(prefix, out_prefix, vocab_prefix=None, min_word_freq=0):
+    """Export both sides of the parallel files at prefix. (See module docstring.)"""
+    summary = {side: numericalize_file(fileio.find_file(get_filename(prefix)), out_prefix, side,
+                                       vocab_prefix=vocab_prefix, min_word_freq=min_word_freq)
+               for side, get_filename in sorted(SIDES.items())}
+    if summary['src']['lines'] != summary['tgt']['lines']:
+        raise ValueError('Parallel files have different numbers of lines: {} src, {} tgt'.format(
+            summary['src']['lines'], summary['tgt']['lines']))
+    with open(get_summary_filename(out_prefix), 'w') as outfile:
+        json.dump(summary, outfile, indent=4, sort_keys=True)
+    return summary
+
+
+def load_numericalized(prefix, side):
+    """Memory-map one side of an export.
+
+    Returns dict with ids, feats (or None), offsets, and the vocab and feature_vocabs as lists
+    of tokens in id order.
+
+    """
+    with open(get_summary_filename(prefix)) as infile:
+        summary = json.load(infile)[side]
+    return {
+        'ids': np.load(summary['ids'], mmap_mode='r'),
+        'feats': np.load(summary['feats'], mmap_mode='r') if summary['feats'] else None,
+        'offsets': np.load(summary['offsets'], mmap_mode='r'),
+        'vocab': [token for token, _ in read_vocab(summary['vocab'])],
+        'feature_vocabs': [[token for token, _ in read_vocab(filename)] for filename in summary['feature_vocabs']],
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--prefix', required=True, help='Prefix of parallel files created by preprocessing.py')
+    parser.add_argument('--out_prefix', help='Exported files will be named using this prefix (default: --prefix)')
+    parser.add_argument('--vocab_prefix',
+                        help='Reuse the vocabs exported for this prefix (e.g., the training data) instead of '
+                             'building new ones')
+    parser.add_argument('--min_word_freq', type=int, default=0,
+                        help='Words seen fewer times than this in the vocab map to <unk>')
+    args = parser.parse_args()
+    numericalize(args.prefix, args.out_prefix or args.prefix, vocab_prefix=args.vocab_prefix,
+                 min_word_freq=args.min_word_freq)
@@ -5,9 +5,34 @@ import json
 import os
 import sys
 
+import fileio
+
 detokenizer = moses.MosesDetokenizer()  # must match what's used in preprocessing.py
 
 
+def load_replacement_map(replacements_map_filename):
+    """Load mapping from predicate values to surface form most often seen in training data."""
+    with open(replacements_map_filename) as infile:
+        return json.load(infile)
+
+
+def get_replacements(replacement_dicts, rmap):
+    """Map each placeholder in one line's anonymization dicts to the string that should replace it.
+
+    If replacements map has a "best" value for the given placeholder, use it,
+    otherwise copy the predicate exactly. Note that for special cases like _UNK0,
+    placeholder is not added to the replacement map so predicate is always copied.
+
+    """
+    return {d['ph']: rmap[d['value']] if d['value'] in rmap else d['value'] for d in replacement_dicts}
+
+
+def postprocess_tokens(anonymized_tokens, repdict):
+    """De-anonymize and detokenize one predicted line. Returns the final string."""
+    tokens = [repdict.get(t, t) for t in anonymized_tokens]
+    return detokenizer.detokenize(tokens, return_str=True)
+
+
 def postprocess(infilename, outfilename, replacements_filename, replacements_map_filename):
     """De-anonymize and detokenize results (reverses what was done by preprocessing.py)
 
@@ -20,33 +45,22 @@ def postprocess(infilename, outfilename, replacements_filename, replacements_map
         nodes (e.g., named0, card0) to the surface form they should be replaced with
 
     """
-    # Load mapping from predicate values to surface form most often seen in training data
-    rmap = json.load(open(replacements_map_filename))
+    rmap = load_replacement_map(replacements_map_filename)
     # Generate list of replacements
     replacements = []
-    with open(replacements_filename) as infile:
+    with fileio.open_file(replacements_filename) as infile:
         for line in infile:
-            replacement_dicts = json.loads(line.strip())
-            temp = {}
-            # If replacements map has a "best" value for the given placeholder, use it,
-            # otherwise copy the predicate exactly. Note that for special cases like _UNK0,
-            # placeholder is not added to the replacement map so predicate is always copied.
-            for d in replacement_dicts:
-                temp[d['ph']] = rmap[d['value']] if d['value'] in rmap else d['value']
-            replacements.append(temp)
+            replacements.append(get_replacements(json.loads(line.strip()), rmap))
     # De-anonymize and detokenize each line of input file and write to outfile
-    with open(infilename) as infile, open(outfilename, 'w') as outfile:
+    with fileio.open_file(infilename) as infile, fileio.open_file(outfilename, 'w') as outfile:
         num_written = 0
         for i, line in enumerate(infile):
-            repdict = replacements[i]
-            anonymized_tokens = line.strip().split()
-            tokens = [repdict.get(t, t) for t in anonymized_tokens]
-            s = detokenizer.detokenize(tokens, return_str=True)
+            s = postprocess_tokens(line.strip().split(), replacements[i])
             outfile.write('{}\n'.format(s))
             num_written += 1
         sys.stderr.write(
             'Wrote {} deanonymized, detokenized lines to {}\n'.format(
-                num_written, os.path.abspath(outfile.name)))
+                num_written, os.path.abspath(outfilename)))
 
 
 if __name__ == '__main__':
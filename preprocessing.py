@@ -12,22 +12,40 @@ python preprocessing.py data/sample/sample.txt data/sample
 Expected input data format is the output of mrs-to-penman/convert-redwoods.sh, with some
 modifications to the parameters file. (See setup.sh and https://github.com/goodmami/mrs-to-penman)
 
+Parallel files can also be created straight from [incr tsdb()] profiles, without writing
+Penman files in between. (See create_parallel_files_from_profiles and profiles_to_parallel.py)
+
 """
 
 from collections import Counter
 import argparse
+import heapq
 import io
 import json
 import os
 import re
 import shutil
 import sys
+import threading
+import time
 
 from nltk.tokenize.moses import MosesTokenizer
 
 from delphin.mrs import xmrs, simplemrs, penman
 from penman import PENMANCodec, Triple
 
+import fileio
+from profiles import read_profile
+
+DEFAULT_CONVERSION_PARAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                         'config', 'convert_redwoods_params.json')
+
+# unknown words are parsed with predicates like _nonexecutive/jj_u_unknown
+UNKNOWN_PRED_RE = re.compile(r'_([^\s]+)\/(.*?_unknown)')
+# punctuation trimmed from the start and end of spans before they're anonymized
+SPAN_LEADING_PUNCTUATION = frozenset(['(', '[', '"', '`', "'"])
+SPAN_TRAILING_PUNCTUATION = frozenset(['.', ',', '!', '?', '"', '`', "'", '(', ')', '[', ']', ';', ':'])
+
 
 class PenmanToLinearCodec(PENMANCodec):
     """Reads PENMAN-serialized DMRS graph and serializes to simplified linear representation.
@@ -122,6 +140,147 @@ def get_orig_filename(prefix):
     return prefix + '-orig.txt'
 
 
+def get_stats_filename(prefix):
+    return prefix + '-stats.json'
+
+
+def get_parallel_filenames(prefix, compression=None):
+    """The -src, -tgt, -anon and -orig filenames for prefix, in that order."""
+    return [fileio.with_compression(get_filename(prefix), compression)
+            for get_filename in (get_src_filename, get_tgt_filename, get_anon_filename, get_orig_filename)]
+
+
+def find_parallel_files(prefix):
+    """Like get_parallel_filenames, but picks up compressed versions of the files that exist."""
+    return [fileio.find_file(filename) for filename in get_parallel_filenames(prefix)]
+
+
+def read_parallel_lines(prefix):
+    """Generate (src, tgt, anon, orig) line tuples, checking that the files have the same length.
+
+    Every line ends with a newline, even the last line of a file that doesn't, so lines can be
+    reordered or written out without running into the next one.
+
+    """
+    filenames = find_parallel_files(prefix)
+    infiles = [fileio.open_file(filename, encoding='utf8') for filename in filenames]
+    try:
+        num_lines = 0
+        while True:
+            lines = tuple(infile.readline() for infile in infiles)
+            if not any(lines):
+                break
+            if not all(lines):
+                raise ValueError('Parallel files are not aligned: line {} missing from {}'.format(
+                    num_lines + 1, ', '.join(f for f, line in zip(filenames, lines) if not line)))
+            num_lines += 1
+            yield tuple(line if line.endswith('\n') else line + '\n' for line in lines)
+    finally:
+        for infile in infiles:
+            infile.close()
+
+
+def write_parallel_lines(parallel_lines, outfile_prefix, compression=None):
+    """Write (src, tgt, anon, orig) line tuples to the parallel files at outfile_prefix. Returns number written."""
+    outfiles = [fileio.open_file(filename, 'w', encoding='utf8')
+                for filename in get_parallel_filenames(outfile_prefix, compression)]
+    num_written = 0
+    try:
+        for lines in parallel_lines:
+            for outfile, line in zip(outfiles, lines):
+                outfile.write(line)
+            num_written += 1
+    finally:
+        for outfile in outfiles:
+            outfile.close()
+    return num_written
+
+
+class PreprocessingStats(object):
+    """Collects per-stage timings, slowest graphs, and failure types during preprocessing.
+
+    Pass an instance as the stats argument of preprocess_penman/preprocess_sentence (or use
+    create_parallel_files(..., collect_stats=True)) to fill it in. When stats is None, the
+    stages aren't timed at all.
+
+    Latency histograms use power-of-two microsecond buckets: bucket i counts calls that took
+    less than 2**i microseconds (and at least 2**(i-1)).
+
+    """
+    def __init__(self, num_slowest=20, num_error_examples=5):
+        self.num_slowest = num_slowest
+        self.num_error_examples = num_error_examples
+        self.stage_seconds = Counter()
+        self.stage_calls = Counter()
+        self.stage_histograms = {}
+        self.slowest = []  # min-heap of (seconds, label) for the slowest graphs
+        self.error_counts = Counter()
+        self.error_examples = {}
+        self.num_graphs = 0
+
+    def add_time(self, stage, seconds):
+        self.stage_seconds[stage] += seconds
+        self.stage_calls[stage] += 1
+        bucket = int(seconds * 1e6).bit_length()
+        histogram = self.stage_histograms.setdefault(stage, [])
+        if len(histogram) <= bucket:
+            histogram.extend([0] * (bucket + 1 - len(histogram)))
+        histogram[bucket] += 1
+
+    def add_graph(self, label, seconds):
+        self.num_graphs += 1
+        self.add_time('total', seconds)
+        if len(self.slowest) < self.num_slowest:
+            heapq.heappush(self.slowest, (seconds, label))
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (seconds, label))
+
+    def add_error(self, label, error):
+        error_type = type(error).__name__
+        self.error_counts[error_type] += 1
+        examples = self.error_examples.setdefault(error_type, [])
+        if len(examples) < self.num_error_examples:
+            examples.append({'label': label, 'error': str(error)})
+
+    def to_dict(self):
+        return {
+            'graphs': self.num_graphs,
+            'stages': {
+                stage: {
+                    'calls': self.stage_calls[stage],
+                    'seconds': self.stage_seconds[stage],
+                    'mean_ms': 1000.0 * self.stage_seconds[stage] / self.stage_calls[stage],
+                    'histogram_us': {
+                        '<{}'.format(2 ** i): count
+                        for i, count in enumerate(self.stage_histograms[stage]) if count
+                    },
+                }
+                for stage in self.stage_calls
+            },
+            'slowest': [{'seconds': seconds, 'label': label}
+                        for seconds, label in sorted(self.slowest, reverse=True)],
+            'errors': {
+                error_type: {'count': count, 'examples': self.error_examples[error_type]}
+                for error_type, count in self.error_counts.most_common()
+            },
+        }
+
+    def write(self, filename):
+        with io.open(filename, 'w', encoding='utf8') as outfile:
+            outfile.write(json.dumps(self.to_dict(), indent=4, ensure_ascii=False))
+        sys.stderr.write('Wrote preprocessing stats to {}\n'.format(os.path.abspath(filename)))
+
+
+def _timed(stats, stage, fn, *args, **kwargs):
+    """Call fn, adding its run time to stats under stage if stats is not None."""
+    if stats is None:
+        return fn(*args, **kwargs)
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    stats.add_time(stage, time.perf_counter() - start)
+    return result
+
+
 def anonymize_graph(g):
     """Anonymize graph by replacing nodes of certain named types with tokens like "named0".
 
@@ -162,7 +321,96 @@ def anonymize_graph(g):
     return replacements
 
 
-def combine_attributes(g):
+class FeatureEncoder(object):
+    """Dictionary encoder for the predicates and attribute bundles that combine_attributes joins.
+
+    Assigns each distinct predicate and each distinct normalized attribute bundle (e.g.
+    "mood=INDICATIVE|perf=-|sf=PROP|tense=PAST") an integer id and keeps one copy of the string,
+    so a bundle is normalized, sorted and joined only the first time it's seen, and the combined
+    node labels (e.g. "_open_v_1￨mood=INDICATIVE|...") are built once and shared by every graph
+    that uses them. Lookups are lock-free; adding a new value takes a lock, so one encoder can be
+    shared by several threads.
+
+    Nothing is ever evicted, so an encoder grows with every distinct predicate and bundle it sees
+    (one new predicate per unknown word). That's bounded by the corpus for batch preprocessing,
+    but a long-running caller should own its encoder and replace it with a new one when len()
+    gets too big, between uses (see serve.MicroBatcher). Ids aren't kept, only labels are
+    output, so a new encoder gives the same output; it's just slower until it's warm again.
+
+    """
+    def __init__(self):
+        self.predicate_ids = {}
+        self.predicates = []
+        self.bundle_ids = {}
+        self.bundles = []
+        self._bundle_keys = {}  # raw attributes tuple -> bundle id
+        self._labels = {}  # (predicate id, bundle id) -> combined label
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Number of cached values (predicates, bundles, bundle keys and labels)."""
+        return len(self.predicates) + len(self.bundles) + len(self._bundle_keys) + len(self._labels)
+
+    def encode_predicate(self, predicate):
+        try:
+            return self.predicate_ids[predicate]
+        except KeyError:
+            with self._lock:
+                return self._add(predicate, self.predicate_ids, self.predicates)
+
+    def encode_bundle(self, attributes):
+        """Id of the bundle for a node's (relation, target) attribute pairs, in graph order.
+
+        Values are uppercased and the pairs sorted by attribute name. lnk (span info, only
+        needed for anonymization) and tense=UNTENSED (doesn't provide much info) are left out,
+        so the bundle may be empty ('').
+
+        """
+        key = tuple((relation, target, type(target)) for relation, target in attributes)  # type: 1 == 1.0
+        try:
+            return self._bundle_keys[key]
+        except KeyError:
+            pass
+        features = []
+        for relation, target in attributes:
+            target = target.upper() if isinstance(target, str) else target
+            if relation != 'lnk' and (relation, target) != ('tense', 'UNTENSED'):
+                features.append('{}={}'.format(relation, target))
+        bundle = '|'.join(sorted(features))  # sort by attribute name
+        with self._lock:
+            bundle_id = self._add(bundle, self.bundle_ids, self.bundles)
+            self._bundle_keys[key] = bundle_id
+        return bundle_id
+
+    def label(self, predicate, bundle_id):
+        """Predicate with its bundle appended as word features."""
+        key = (self.encode_predicate(predicate), bundle_id)
+        try:
+            return self._labels[key]
+        except KeyError:
+            label = predicate + '￨' + self.bundles[bundle_id]  # N.B. '￨' not '|'
+            with self._lock:
+                return self._labels.setdefault(key, label)
+
+    @staticmethod
+    def _add(value, ids, values):
+        """Add value if it's new (caller holds the lock). Returns its id."""
+        if value not in ids:
+            values.append(value)  # before the id, so any id a reader sees is valid
+            ids[value] = len(values) - 1
+        return ids[value]
+
+
+class _NodeAttributes(object):
+    """Where a node's instance triple is in the graph, and its other attributes."""
+    __slots__ = ('instance_index', 'attributes')
+
+    def __init__(self):
+        self.instance_index = None
+        self.attributes = []
+
+
+def combine_attributes(g, encoder=None):
     """Group all attribute nodes into one.
 
     Attribute list is normalized by uppercasing the value and sorting
@@ -175,29 +423,43 @@ def combine_attributes(g):
     will be required to make sure all tokens have a feature. (See _layout
     in PenmanToLinearCodec)
 
+    Bundles and labels are interned through encoder (a FeatureEncoder), which defaults to the
+    shared combine_attributes.encoder. Makes one pass over the triples.
+
     """
-    for variable in g.variables():
-        old_attributes = [
-            attr for attr in g.attributes(source=variable) if attr.relation != 'instance'
-        ]
-        new_targets = []
-        for old_attr in old_attributes:
-            old_relation = old_attr.relation
-            old_target = old_attr.target.upper() if isinstance(old_attr.target, str) else old_attr.target
-            # don't store span info (only needed for anonymization) or untensed (doesn't provide much info)
-            if old_relation != 'lnk' and (old_relation, old_target) != ('tense', 'UNTENSED'):
-                new_targets.append('{}={}'.format(old_relation, old_target))
-            g._triples.remove(old_attr)
-        if new_targets:
-            attr_features = '|'.join(sorted(new_targets))  # sort by attribute name
-            instance = g.attributes(source=variable, relation='instance')[0]
-            new_instance = Triple(
-                source=instance.source,
-                relation=instance.relation,
-                target=instance.target + '￨' + attr_features  # N.B. '￨' not '|'
-            )
-            g._triples.insert(g._triples.index(instance), new_instance)
-            g._triples.remove(instance)
+    encoder = encoder if encoder is not None else combine_attributes.encoder  # an empty encoder is falsy
+    variables = g.variables()
+    nodes = {}
+    triples = []
+    for t in g._triples:  # gotcha: accessing private member var
+        if t.target in variables:  # edge
+            triples.append(t)
+            continue
+        node = nodes.get(t.source)
+        if node is None:
+            node = nodes[t.source] = _NodeAttributes()
+        if t.relation == 'instance':
+            if node.instance_index is None:
+                node.instance_index = len(triples)
+            triples.append(t)
+        elif t.relation != 'lnk':  # spans are dropped anyway, and would make every bundle key unique
+            node.attributes.append((t.relation, t.target))
+    for node in nodes.values():
+        if not node.attributes:
+            continue
+        bundle_id = encoder.encode_bundle(node.attributes)
+        if not encoder.bundles[bundle_id]:
+            continue
+        if node.instance_index is None:
+            raise IndexError('Node with attributes has no instance')
+        instance = triples[node.instance_index]
+        triples[node.instance_index] = Triple(
+            source=instance.source,
+            relation=instance.relation,
+            target=encoder.label(instance.target, bundle_id)
+        )
+    g._triples[:] = triples
+combine_attributes.encoder = FeatureEncoder()
 
 
 def load_serialized_from_file(infilename):
@@ -208,8 +470,15 @@ def load_serialized_from_file(infilename):
     Returns list of (label, serialized_graph) tuples.
 
     """
-    serialized = []
-    with open(infilename) as infile:
+    serialized = list(iter_serialized_from_file(infilename))
+    print('Loaded {} serialized graphs from {}'.format(len(serialized),
+                                                       os.path.abspath(infilename)))
+    return serialized
+
+
+def iter_serialized_from_file(infilename):
+    """Generate the same (label, serialized_graph) tuples as load_serialized_from_file, one at a time."""
+    with fileio.open_file(infilename) as infile:
         heading = ''
         partial = []
         for line in infile:
@@ -219,7 +488,7 @@ def load_serialized_from_file(infilename):
             if line.startswith('#'):
                 if partial:
                     serialized_graph = ' ' .join(partial)
-                    serialized.append((heading, serialized_graph))
+                    yield heading, serialized_graph
                     partial = []
                     heading = line.strip()
                 else:
@@ -227,34 +496,238 @@ def load_serialized_from_file(infilename):
             else:
                 partial.append(line.strip())
         serialized_graph = ' '.join(partial)
-        serialized.append((heading, serialized_graph))
-        print('Loaded {} serialized graphs from {}'.format(len(serialized),
-                                                           os.path.abspath(infile.name)))
-    return serialized
+        yield heading, serialized_graph
 
 
-def preprocess_penman(serialized):
+def preprocess_penman(serialized, stats=None, codec=None, encoder=None):
     """Given a Penman-serialized graph, simplify, anonymize, and linearize it.
 
     Anonymization replaces nodes of specific classes with placeholders like named0, named1
     and stores a mapping that can be used to recover original values.
 
+    If stats (a PreprocessingStats) is given, the time spent in each stage is added to it.
+    codec and encoder default to the shared preprocess_penman.codec and
+    combine_attributes.encoder. (See Preprocessor)
+
     Returns tuple of (preprocessed_graph, anonymization_mapping)
 
     """
-    codec = preprocess_penman.codec
-    g = codec.decode(serialized)
-    anon_map = anonymize_graph(g)
-    combine_attributes(g)
-    linearized = codec.encode(g)
-    return linearized, anon_map
+    codec = codec or preprocess_penman.codec
+    g = _timed(stats, 'decode', codec.decode, serialized)
+    return preprocess_graph(g, stats=stats, codec=codec, encoder=encoder)
 preprocess_penman.codec = PenmanToLinearCodec()
 
 
-def preprocess_sentence(sentence, anon_map):
-    """Tokenize sentence and replace known tokens with placeholders."""
+def preprocess_graph(g, stats=None, codec=None, encoder=None):
+    """Simplify, anonymize, and linearize an already decoded graph. (Modifies g.)
+
+    Returns tuple of (preprocessed_graph, anonymization_mapping)
+
+    """
+    codec = codec or preprocess_penman.codec
+    anon_map = _timed(stats, 'anonymize_graph', anonymize_graph, g)
+    _timed(stats, 'combine_attributes', combine_attributes, g, encoder=encoder)
+    linearized = _timed(stats, 'layout', codec.encode, g)
+    return linearized, anon_map
+
+
+def preprocess_serialized(penman_serialized, stats=None, codec=None, encoder=None):
+    """preprocess_penman for graphs read from a Penman file."""
+    # treat unknowns same as named tokens so they'll be copied exactly
+    penman_serialized = UNKNOWN_PRED_RE.sub(r'UNK\1 :carg "\1"', penman_serialized)
+    return preprocess_penman(penman_serialized, stats=stats, codec=codec, encoder=encoder)
+
+
+class _DecodeOrderCodec(penman.XMRSCodec):
+    """Lays out DMRS triples the way they'd be serialized, without writing a string.
+
+    encode() returns the triples in the order (and orientation) that PenmanToLinearCodec.decode
+    would read them back from the serialized graph: node types in pre-order, then relations
+    in pre-order. Unknown-word predicates are rewritten the same way preprocess_serialized
+    rewrites them in the serialized text. Building a graph from these triples gives the same
+    result as serializing with mrs-to-penman and decoding the text.
+
+    """
+    def _layout(self, g, src, offset, seen):
+        nodes, edges = [], []
+        self._collect(g, src, seen, nodes, edges)
+        return nodes + edges
+
+    def _collect(self, g, src, seen, nodes, edges):
+        if src not in g or len(g.get(src, [])) == 0 or src in seen:
+            return
+        seen.add(src)
+        outedges = self.relation_sort(g[src])
+        nodetype = next((t.target for t in outedges if t.relation == self.TYPE_REL), None)
+        match = UNKNOWN_PRED_RE.match(nodetype) if isinstance(nodetype, str) else None
+        if match:
+            nodetype = 'UNK' + match.group(1) + nodetype[match.end():]
+        nodes.append((src, PENMANCodec.TYPE_REL, nodetype))
+        if match:
+            edges.append((src, 'carg', '"{}"'.format(match.group(1))))
+        for t in outedges:
+            if t.relation == self.TYPE_REL:
+                continue
+            if t.inverted:
+                tgt = t.source
+                rel = self.invert_relation(t.relation)
+            else:
+                tgt = t.target
+                rel = t.relation or ''
+            edges.append((src, rel, tgt))
+            self._collect(g, tgt, seen, nodes, edges)
+
+
+def load_conversion_params(params_filename=DEFAULT_CONVERSION_PARAMS):
+    with open(params_filename) as infile:
+        return json.load(infile)
+
+
+def filter_dmrs_triples(triples, params):
+    """Keep only the nodes and relations allowed by mrs-to-penman conversion parameters.
+
+    :triples: (source, relation, target) triples from Dmrs.to_triples()
+    :params: dict in the format of config/convert_redwoods_params.json
+
+    Nodes whose predicate is in drop_nodes are removed along with their links. A relation
+    is kept if it is allowed for all nodes, for the node's variable sort (e.g. "x" or "e"),
+    or for the node's predicate. Values are then filled in or rewritten according to
+    default_attribute_value and substitute_attribute_value.
+
+    """
+    allowed = params.get('allow_relations', {})
+    allowed_global = set(allowed.get('global', []))
+    allowed_by_pred = allowed.get('predicate', {})
+    substitutions = dict(
+        (relation, [(re.compile(pattern), repl) for pattern, repl in subs])
+        for relation, subs in params.get('substitute_attribute_value', {}).items()
+    )
+    default_value = params.get('default_attribute_value')
+    preds, sorts = {}, {}
+    for src, rel, tgt in triples:
+        if rel == 'predicate':
+            preds[src] = tgt
+        elif rel == 'cvarsort':
+            sorts[src] = tgt
+    drop_preds = set(params.get('drop_nodes', []))
+    dropped = set(nodeid for nodeid, pred in preds.items() if pred in drop_preds)
+    filtered = []
+    for src, rel, tgt in triples:
+        if src in dropped or tgt in dropped:
+            continue
+        if rel != 'top' and not (
+                rel in allowed_global
+                or (sorts.get(src) in ('x', 'e') and rel in allowed.get(sorts[src], []))
+                or rel in allowed_by_pred.get(preds.get(src), [])):
+            continue
+        if tgt is None or tgt == '':
+            tgt = default_value
+        for pattern, repl in substitutions.get(rel, []):
+            tgt = pattern.sub(repl, tgt)
+        filtered.append((src, rel, tgt))
+    return filtered
+
+
+def mrs_to_graph(mrs, params):
+    """Convert an MRS to the DMRS graph preprocess_penman would decode from mrs-to-penman output.
+
+    :mrs: a pydelphin Xmrs, e.g. from simplemrs.loads_one()
+    :params: conversion parameters (see load_conversion_params)
+
+    """
+    triples = xmrs.Dmrs.to_triples(xmrs.Dmrs.from_xmrs(mrs), properties=True)
+    layout_codec = mrs_to_graph.layout_codec
+    g = layout_codec.triples_to_graph(filter_dmrs_triples(triples, params))
+    return preprocess_penman.codec.triples_to_graph(layout_codec.encode(g), top=g.top)
+mrs_to_graph.layout_codec = _DecodeOrderCodec()
+
+
+def preprocess_sentence(sentence, anon_map, stats=None, tokenizer=None):
+    """Tokenize sentence and replace known tokens with placeholders.
+
+    If stats (a PreprocessingStats) is given, the time spent in each stage is added to it.
+    tokenizer defaults to the shared preprocess_sentence.tokenizer. (See Preprocessor)
+
+    """
+    tokenizer = tokenizer or preprocess_sentence.tokenizer
     # spans correspond to detokenized position so do anonymization before tokenization
+    sentence = _timed(stats, 'adjust_spans', _anonymize_sentence, sentence, anon_map)
+    # clean up sentence (same normalization must be applied the original used in eval)
+    sentence = _normalize_sentence(sentence)
+    # tokenize
+    raw_tokens = _timed(stats, 'tokenize', tokenizer.tokenize, sentence, escape=False)
+    return ' '.join(raw_tokens)
+preprocess_sentence.tokenizer = MosesTokenizer()  # must match what's used in postprocessing
+
+
+class Preprocessor(object):
+    """Preprocesses (Penman graph, sentence) pairs into the lines of the four parallel files.
+
+    Gives the same output as create_parallel_files, but each instance owns its codec, feature
+    encoder and tokenizer instead of sharing the module-level ones, and process()
+    builds a new graph and anonymization map for every call and doesn't modify its arguments.
+    So one instance can be called from many threads at once (e.g., from a thread pool or
+    inside another service). A PreprocessingStats passed as stats isn't thread-safe, though,
+    so use one per thread.
+
+    Usage:
+    > preprocessor = Preprocessor()
+    > src, tgt, anon_map, orig = preprocessor.process(penman_serialized, 'The window opened.')
+    > results = preprocessor.process_batch(pairs, executor=ThreadPoolExecutor(8))
+
+    """
+    def __init__(self):
+        self.codec = PenmanToLinearCodec()
+        self.encoder = FeatureEncoder()
+        self.tokenizer = MosesTokenizer()  # must match what's used in postprocessing
+
+    def process(self, penman_serialized, sentence, stats=None):
+        """Preprocess one graph read from a Penman file and its (untokenized) sentence.
+
+        Returns tuple of (linearized_graph, tokenized_sentence, anonymization_mapping,
+        normalized_sentence): the -src, -tgt, -anon (before JSON encoding) and -orig lines,
+        without newlines. Raises an exception if the graph can't be processed.
+
+        """
+        linearized, anon_map = preprocess_serialized(penman_serialized, stats=stats, codec=self.codec,
+                                                     encoder=self.encoder)
+        tokenized = preprocess_sentence(sentence, anon_map, stats=stats, tokenizer=self.tokenizer)
+        return linearized, tokenized, anon_map, _normalize_sentence(sentence)
+
+    def process_batch(self, pairs, executor=None):
+        """Preprocess a list of (penman_serialized, sentence) pairs.
+
+        If executor (e.g., a concurrent.futures.ThreadPoolExecutor) is given, the pairs are
+        processed with executor.map. Returns a list with the result of process() for each
+        pair, in order, or None for pairs that couldn't be processed (where
+        create_parallel_files --with_blanks would write blank lines).
+
+        """
+        if executor is None:
+            return [self._process_or_none(pair) for pair in pairs]
+        return list(executor.map(self._process_or_none, pairs))
+
+    def _process_or_none(self, pair):
+        penman_serialized, sentence = pair
+        try:
+            return self.process(penman_serialized, sentence)
+        except Exception as e:
+            sys.stderr.write('Preprocessing failed for "{}", skipping. Error was: {}\n'.format(sentence, e))
+            return None
+
+
+def _anonymize_sentence(sentence, anon_map):
+    """Replace the span of each anon_map entry in sentence with its placeholder.
+
+    Modifies anon_map, adjusting spans and adding the "realized" surface form.
+
+    Spans are visited from last to first, but no edit depends on text changed by an edit after
+    it, so edits are recorded in original sentence positions and the anonymized sentence is
+    built in a single pass at the end instead of being rebuilt for every placeholder.
+
+    """
     to_replace = sorted(anon_map, key=lambda x: x['span'], reverse=True)
+    edits = []  # (start, end, replacement) in original sentence positions, last to first
     start, end = [sys.maxsize - 1, sys.maxsize]
     for i, anon_dict in enumerate(to_replace):
         prev_start, prev_end = start, end
@@ -262,11 +735,11 @@ def preprocess_sentence(sentence, anon_map):
         # Special case multi-part entities like number sequences or compounds (555-5555 or Ekorråa/Ikornåa) -
         # the lnk field of each word in a compound is set to span of the full compound and we don't want to
         # accidentally learn that every instance of "555" should be realized as "555-5555".
-        if sorted([prev_end, prev_start, end, start], reverse=True) != [prev_end, prev_start, end, start]:
+        if not prev_end >= prev_start >= end >= start:
             # Omit "realized" field for all components. Postprocessing will fall back to using predicate.
             del to_replace[i - 1]['realized']
             # Don't replace anything when inserting placeholder (since full span has already been replaced.)
-            sentence = sentence[:start] + anon_dict['ph'] + sentence[start:]
+            edits.append((start, start, anon_dict['ph']))
             sys.stderr.write('Handled overlapping replacement: {}\n'.format(anon_dict))
             continue
         # If named node contains a hyphen, do search-replace within span
@@ -275,7 +748,7 @@ def preprocess_sentence(sentence, anon_map):
             updated_span = full_span.replace(anon_dict['value'], anon_dict['ph'] + " ")
             if full_span == updated_span:
                 sys.stderr.write('Substr with hyphen ({}) not found in span: {}\n'.format(anon_dict['value'], full_span))
-            sentence = sentence[:start] + updated_span + sentence[end:]
+            edits.append((start, end, updated_span))
             continue
         # Otherwise, handle common replacement case
         # adjust span so it doesn't include punctuation
@@ -284,24 +757,35 @@ def preprocess_sentence(sentence, anon_map):
         # strip wikipedia links from realized text (later preprocessing removes them and this should match)
         anon_dict['realized'] = re.sub("(\[|\])", "", sentence[start:end])
         # replace contents of adjusted span with placeholder
-        sentence = sentence[:start] + anon_dict['ph'] + sentence[end:]
-    # clean up sentence (same normalization must be applied the original used in eval)
-    sentence = _normalize_sentence(sentence)
-    # tokenize
-    raw_tokens = preprocess_sentence.tokenizer.tokenize(sentence, escape=False)
-    return ' '.join(raw_tokens)
-preprocess_sentence.tokenizer = MosesTokenizer()  # must match what's used in postprocessing
+        edits.append((start, end, anon_dict['ph']))
+    return _apply_edits(sentence, reversed(edits))
+
+
+def _apply_edits(sentence, edits):
+    """Build a new sentence by replacing sentence[start:end] with replacement for each edit.
+
+    Edits must be in order, first to last, and not overlap. (An insertion, where start == end,
+    goes before any other edit at the same position that comes after it in the list.)
+
+    """
+    pieces = []
+    pos = 0
+    for start, end, replacement in edits:
+        pieces.append(sentence[pos:start])
+        pieces.append(replacement)
+        pos = end
+    pieces.append(sentence[pos:])
+    return ''.join(pieces)
 
 
 def _adjust_span_boundaries(sentence, anon_dict):
     """Shrinks span boundary so it doesn't include punctuation.
 
-    Gotcha: assumes adjustments are being done in order from last to first, so
-    one adjustment doesn't affect the next.
+    Gotcha: assumes the span hasn't been changed by earlier replacements. (See _anonymize_sentence)
     """
     start, end = anon_dict['span']
     # adjust beginning of replacement span to exclude punc
-    while start < end and sentence[start] in {'(', '[', '"', '`', "'"}:
+    while start < end and sentence[start] in SPAN_LEADING_PUNCTUATION:
         if sentence[start] == "'":  # allow single quote but not double
             if end - start > 1 and sentence[start + 1] == "'":
                 start += 2
@@ -310,9 +794,9 @@ def _adjust_span_boundaries(sentence, anon_dict):
                 break
         start += 1
     # adjust end of replacement span to exclude punctuation
-    while end > start and sentence[end - 1] in {'.', ',', '!', '?', '"', '`', "'", '(', ')', '[', ']', ';', ':'}:
+    while end > start and sentence[end - 1] in SPAN_TRAILING_PUNCTUATION:
         # don't remove period after acronym
-        if end - start > 1 and re.match(r'[A-Z]', sentence[end - 2]) and sentence[end - 1] == '.':
+        if end - start > 1 and 'A' <= sentence[end - 2] <= 'Z' and sentence[end - 1] == '.':
             break
         # walk back until final char is not punc
         end -= 1
@@ -331,7 +815,8 @@ def _normalize_sentence(sentence):
     return sentence
 
 
-def create_parallel_files(infilename, outfile_prefix, output_blank_for_failure=False):
+def create_parallel_files(infilename, outfile_prefix, output_blank_for_failure=False, collect_stats=False,
+                          compression=None):
     """Convert Penman serialized graphs to format that can be used for training.
 
     Reads Penman-serialized graphs from infilename, where infile was created by
@@ -341,56 +826,117 @@ def create_parallel_files(infilename, outfile_prefix, output_blank_for_failure=F
     tokenized sentences to {outfile_prefix}-tgt.txt, and anonymization map
     (map of placeholders to original strings) to {outfile_prefix}-anon.txt
 
+    If collect_stats is True, per-stage timings, the slowest graphs, and the errors
+    behind skipped graphs are written to {outfile_prefix}-stats.json
+
+    infilename may be gzip or zstandard compressed (.gz or .zst). If compression is 'gz' or
+    'zst', the parallel files are compressed and named with that extension.
+
     """
     data = load_serialized_from_file(infilename)
     sys.stderr.write('Deserializing and processing {} graphs.'.format(len(data)))
+    write_parallel_files(data, preprocess_serialized, outfile_prefix,
+                         output_blank_for_failure=output_blank_for_failure, collect_stats=collect_stats,
+                         compression=compression)
+
+
+def create_parallel_files_from_profiles(profile_dirs, outfile_prefix, params_filename=DEFAULT_CONVERSION_PARAMS,
+                                        output_blank_for_failure=False, collect_stats=False, compression=None):
+    """Convert MRSs in [incr tsdb()] profiles directly to parallel training files.
+
+    Same output as converting the profiles with mrs-to-penman (using the same parameters
+    file) and running create_parallel_files on the result, but each MRS goes straight to
+    a DMRS graph in memory instead of being serialized and parsed again.
+
+    """
+    params = load_conversion_params(params_filename)
+
+    def read_items():
+        for profile_dir in profile_dirs:
+            for item_id, snt, mrss in read_profile(profile_dir, None):
+                yield '# ::id {} # ::snt {}'.format(item_id, snt), mrss
+
+    def preprocess_mrss(mrss, stats=None):
+        if not mrss:
+            raise ValueError('No MRS for item')
+        g = _timed(stats, 'mrs_to_dmrs', mrs_to_graph, mrss[0], params)
+        return preprocess_graph(g, stats=stats)
+
+    sys.stderr.write('Converting MRSs from {} profiles.'.format(len(profile_dirs)))
+    write_parallel_files(read_items(), preprocess_mrss, outfile_prefix,
+                         output_blank_for_failure=output_blank_for_failure, collect_stats=collect_stats,
+                         compression=compression)
+
+
+def write_parallel_files(examples, preprocess_fn, outfile_prefix, output_blank_for_failure=False,
+                         collect_stats=False, compression=None):
+    """Write parallel training files for (label, graph) examples.
+
+    :examples: iterable of (label, graph) tuples, where label holds the sentence after "# ::snt "
+    :preprocess_fn: called as preprocess_fn(graph, stats=stats) and returns the same
+        (linearized, anon_map) tuple as preprocess_penman
+
+    Returns tuple of (num_written, num_skipped).
+
+    """
+    stats = PreprocessingStats() if collect_stats else None
     sys.stderr.write('Using Moses tokenization from the nltk package.\n')
-    with io.open(get_src_filename(outfile_prefix), 'w', encoding='utf8') as outfile_src, \
-         io.open(get_tgt_filename(outfile_prefix), 'w', encoding='utf8') as outfile_tgt, \
-         io.open(get_anon_filename(outfile_prefix), 'w', encoding='utf8') as outfile_anon, \
-         io.open(get_orig_filename(outfile_prefix), 'w', encoding='utf8') as outfile_orig:
+    src_filename, tgt_filename, anon_filename, orig_filename = [
+        fileio.with_compression(get_filename(outfile_prefix), compression)
+        for get_filename in (get_src_filename, get_tgt_filename, get_anon_filename, get_orig_filename)]
+    with fileio.open_file(src_filename, 'w', encoding='utf8') as outfile_src, \
+         fileio.open_file(tgt_filename, 'w', encoding='utf8') as outfile_tgt, \
+         fileio.open_file(anon_filename, 'w', encoding='utf8') as outfile_anon, \
+         fileio.open_file(orig_filename, 'w', encoding='utf8') as outfile_orig:
         sys.stderr.write(
-            'Writing serialized graphs to {}.\n'.format(os.path.abspath(outfile_src.name)))
+            'Writing serialized graphs to {}.\n'.format(os.path.abspath(src_filename)))
         sys.stderr.write(
-            'Writing tokenized sentences to {}.\n'.format(os.path.abspath(outfile_tgt.name)))
+            'Writing tokenized sentences to {}.\n'.format(os.path.abspath(tgt_filename)))
         sys.stderr.write(
-            'Writing anonymization map to {}.\n'.format(os.path.abspath(outfile_anon.name)))
+            'Writing anonymization map to {}.\n'.format(os.path.abspath(anon_filename)))
         sys.stderr.write(
-            'Writing original sentences to {}.\n'.format(os.path.abspath(outfile_orig.name)))
+            'Writing original sentences to {}.\n'.format(os.path.abspath(orig_filename)))
         num_written = 0
         num_skipped = 0
-        for label, penman_serialized in data:
+        for label, graph in examples:
+            if stats:
+                start_time = time.perf_counter()
             try:
-                # treat unknowns same as named tokens so they'll be copied exactly
-                penman_serialized = re.sub(r'_([^\s]+)\/(.*?_unknown)', r'UNK\1 :carg "\1"', penman_serialized)
                 # simplify, linearize, and anonymize graphs
-                linearized, anon_map = preprocess_penman(penman_serialized)
+                linearized, anon_map = preprocess_fn(graph, stats=stats)
                 # tokenize and anonymize sentences (assumes last comment is sentence)
                 sentence = label.split('# ::snt ')[-1].strip()
-                outfile_tgt.write('{}\n'.format(preprocess_sentence(sentence, anon_map)))  # modifies anon_map
+                outfile_tgt.write('{}\n'.format(preprocess_sentence(sentence, anon_map, stats=stats)))  # modifies anon_map
                 outfile_src.write('{}\n'.format(linearized))
                 # store anonymization info for use in  postprocessing
                 outfile_anon.write('{}\n'.format(json.dumps(anon_map)))
                 # also write original sentence, which will be compared against during eval
                 outfile_orig.write('{}\n'.format(_normalize_sentence(sentence)))
                 num_written += 1
+                if stats:
+                    stats.add_graph(label, time.perf_counter() - start_time)
             except Exception as e:
                 sys.stderr.write(
                     'Deserialization failed for {}, skipping. Error was: {}\n'.format(label, e))
                 num_skipped += 1
+                if stats:
+                    stats.add_error(label, e)
                 if output_blank_for_failure:
                     outfile_src.write('\n')
                     outfile_tgt.write('\n')
                     outfile_anon.write('[]\n')
                     outfile_orig.write('\n')
-        ratio_skipped = float(num_skipped) / num_written
+        ratio_skipped = float(num_skipped) / max(num_written, 1)
         sys.stderr.write(
             'Linearized {} graphs. Skipped {} due to deserialization errors ({}).\n'.format(
                 num_written, num_skipped, ratio_skipped))
+    if stats:
+        stats.write(get_stats_filename(outfile_prefix))
+    return num_written, num_skipped
 
 def build_vocab(target_filename, vocab_filename):
     vocab = Counter()
-    with open(target_filename) as infile:
+    with fileio.open_file(fileio.find_file(target_filename)) as infile:
         for line in infile:
             vocab.update(line.strip().split())
     sorted_vocab = vocab.most_common(1000000)
@@ -413,17 +959,46 @@ def load_vocab(vocab_filename, min_word_freq=0):
     return vocab
 
 
+def replace_rare_line(tgt_line, src_line, anon_dicts, vocab):
+    """Replace rare unknown placeholders in one line of the parallel files.
+
+    Modifies anon_dicts. Returns tuple of (tgt_line, src_line, num_replaced).
+
+    """
+    num_replaced = 0
+    ph_num = 0
+    for token in tgt_line.split():
+        if token not in vocab:
+            # replace rare unknown token like UNKfoxes0 with _UNK0
+            if token.startswith('UNK'):
+                old_placeholder = token
+                new_placeholder = '_UNK{}'.format(ph_num)
+                ph_num += 1
+                # update anon dict
+                for d in anon_dicts:
+                    if d['ph'] == old_placeholder:
+                        d['ph'] = new_placeholder
+                # update target line
+                # note: assumes placeholder is unique enough to never be substring of another token
+                tgt_line = tgt_line.replace(old_placeholder, new_placeholder)
+                # update src line
+                src_line = src_line.replace(old_placeholder, new_placeholder)
+                # update placeholder counter
+                num_replaced += 1
+    return tgt_line, src_line, num_replaced
+
+
 def replace_rare_tokens(parallel_files_prefix, vocab_filename, min_word_freq=2):
     # matching updates will need to be made in all parallel files
-    anon_filename = get_anon_filename(parallel_files_prefix)
-    src_filename = get_src_filename(parallel_files_prefix)
-    tgt_filename = get_tgt_filename(parallel_files_prefix)
+    anon_filename = fileio.find_file(get_anon_filename(parallel_files_prefix))
+    src_filename = fileio.find_file(get_src_filename(parallel_files_prefix))
+    tgt_filename = fileio.find_file(get_tgt_filename(parallel_files_prefix))
     # load list of valid vocab words
     vocab = load_vocab(vocab_filename, min_word_freq=min_word_freq)
     # make copies of files that will be modified
-    backup_anon_filename = anon_filename + '.full'
-    backup_src_filename = src_filename + '.full'
-    backup_tgt_filename = tgt_filename + '.full'
+    backup_anon_filename = fileio.add_suffix(anon_filename, '.full')
+    backup_src_filename = fileio.add_suffix(src_filename, '.full')
+    backup_tgt_filename = fileio.add_suffix(tgt_filename, '.full')
     sys.stderr.write('Backing up anon file {} to {}\n'.format(anon_filename, backup_anon_filename))
     shutil.copyfile(anon_filename, backup_anon_filename)
     sys.stderr.write('Backing up src file {} to {}\n'.format(src_filename, backup_src_filename))
@@ -433,37 +1008,17 @@ def replace_rare_tokens(parallel_files_prefix, vocab_filename, min_word_freq=2):
     # iterate through lines and replace rare UNK___# placeholders with simpler UNK# in all files
     num_replaced = 0
     num_lines_processed = 0
-    with open(backup_anon_filename) as anon_file_orig, \
-         open(anon_filename, 'w') as anon_file_new, \
-         open(backup_tgt_filename) as tgt_file_orig, \
-         open(tgt_filename, 'w') as tgt_file_new, \
-         open(backup_src_filename) as src_file_orig, \
-         open(src_filename, 'w') as src_file_new:
+    with fileio.open_file(backup_anon_filename) as anon_file_orig, \
+         fileio.open_file(anon_filename, 'w') as anon_file_new, \
+         fileio.open_file(backup_tgt_filename) as tgt_file_orig, \
+         fileio.open_file(tgt_filename, 'w') as tgt_file_new, \
+         fileio.open_file(backup_src_filename) as src_file_orig, \
+         fileio.open_file(src_filename, 'w') as src_file_new:
         for i, line in enumerate(tgt_file_orig):
-            tgt_line = line.strip()
-            tokens_orig = tgt_line.split()
-            anon_serialized = anon_file_orig.readline()
-            anon_dicts = json.loads(anon_serialized)
-            src_line = src_file_orig.readline().strip()
-            ph_num = 0
-            for token in tokens_orig:
-                if token not in vocab:
-                    # replace rare unknown token like UNKfoxes0 with _UNK0
-                    if token.startswith('UNK'):
-                        old_placeholder = token
-                        new_placeholder = '_UNK{}'.format(ph_num)
-                        ph_num += 1
-                        # update anon dict
-                        for d in anon_dicts:
-                            if d['ph'] == old_placeholder:
-                                d['ph'] = new_placeholder
-                        # update target line
-                        # note: assumes placeholder is unique enough to never be substring of another token
-                        tgt_line = tgt_line.replace(old_placeholder, new_placeholder)
-                        # update src line
-                        src_line = src_line.replace(old_placeholder, new_placeholder)
-                        # update placeholder counter
-                        num_replaced += 1
+            anon_dicts = json.loads(anon_file_orig.readline())
+            tgt_line, src_line, line_num_replaced = replace_rare_line(
+                line.strip(), src_file_orig.readline().strip(), anon_dicts, vocab)
+            num_replaced += line_num_replaced
             anon_file_new.write(json.dumps(anon_dicts) + '\n')
             src_file_new.write(src_line + '\n')
             tgt_file_new.write(tgt_line + '\n')
@@ -473,6 +1028,56 @@ def replace_rare_tokens(parallel_files_prefix, vocab_filename, min_word_freq=2):
     sys.stderr.write('Replaced {} rare placeholder tokens\n'.format(num_replaced))
 
 
+def write_rare_token_variants(parallel_files_prefix, vocab_filename, variants):
+    """Run replace_rare_tokens with several min_word_freq values in a single pass.
+
+    :variants: list of (min_word_freq, outfile_prefix) tuples
+
+    Each outfile_prefix gets the parallel files that replace_rare_tokens would have left at
+    parallel_files_prefix with that min_word_freq. The files at parallel_files_prefix are not
+    changed (so no .full backups are made). Output files are compressed the same way as the
+    input files.
+
+    """
+    vocabs = [load_vocab(vocab_filename, min_word_freq=min_word_freq) for min_word_freq, _ in variants]
+    num_replaced = [0] * len(variants)
+    input_filenames = [fileio.find_file(get_filename(parallel_files_prefix))
+                       for get_filename in (get_anon_filename, get_src_filename, get_tgt_filename, get_orig_filename)]
+    compression = fileio.get_compression(input_filenames[0])
+    outfiles = []
+    try:
+        for _, outfile_prefix in variants:
+            outfiles.append([fileio.open_file(fileio.with_compression(get_filename(outfile_prefix), compression), 'w')
+                             for get_filename in (get_anon_filename, get_src_filename, get_tgt_filename)])
+            shutil.copyfile(input_filenames[3], fileio.with_compression(
+                get_orig_filename(outfile_prefix), fileio.get_compression(input_filenames[3])))
+        with fileio.open_file(input_filenames[0]) as anon_file_orig, \
+             fileio.open_file(input_filenames[2]) as tgt_file_orig, \
+             fileio.open_file(input_filenames[1]) as src_file_orig:
+            for i, line in enumerate(tgt_file_orig):
+                tgt_line_orig = line.strip()
+                src_line_orig = src_file_orig.readline().strip()
+                anon_serialized = anon_file_orig.readline()
+                for v, vocab in enumerate(vocabs):
+                    anon_dicts = json.loads(anon_serialized)
+                    tgt_line, src_line, line_num_replaced = replace_rare_line(
+                        tgt_line_orig, src_line_orig, anon_dicts, vocab)
+                    num_replaced[v] += line_num_replaced
+                    anon_file_new, src_file_new, tgt_file_new = outfiles[v]
+                    anon_file_new.write(json.dumps(anon_dicts) + '\n')
+                    src_file_new.write(src_line + '\n')
+                    tgt_file_new.write(tgt_line + '\n')
+                if (i + 1) % 50000 == 0:
+                    sys.stderr.write('processed {} lines\n'.format(i + 1))
+    finally:
+        for files in outfiles:
+            for f in files:
+                f.close()
+    for (min_word_freq, outfile_prefix), n in zip(variants, num_replaced):
+        sys.stderr.write('Replaced {} rare placeholder tokens with min freq {} in {}\n'.format(
+            n, min_word_freq, outfile_prefix))
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('infile', help='Name of Penman-serialized graph file to preprocess')
@@ -484,6 +1089,13 @@ if __name__ == '__main__':
         '--with_blanks', action='store_true',
         help='If True, output blank line when deserialization fails. (Useful for preserving line '
         'positions so output from different sources can be compared.)')
+    parser.add_argument(
+        '--stats', action='store_true',
+        help='If True, write per-stage timings, slowest graphs, and error types to {outfile_prefix}-stats.json')
+    parser.add_argument(
+        '--compress', choices=['gz', 'zst'],
+        help='Compress the parallel files, naming them e.g. {outfile_prefix}-src.txt.gz')
     args = parser.parse_args()
-    create_parallel_files(args.infile, args.outfile_prefix, output_blank_for_failure=args.with_blanks)
+    create_parallel_files(args.infile, args.outfile_prefix, output_blank_for_failure=args.with_blanks,
+                          collect_stats=args.stats, compression=args.compress)
 
@@ -0,0 +1,42 @@
+"""
+Read MRSs from [incr tsdb()] profiles.
+
+Shared by generate.py (which regenerates text from them with ACE) and preprocessing.py (which
+converts them straight to parallel files), so neither has to import the other.
+
+Usage:
+> for item_id, sentence, mrss in read_profile('mrs-to-penman/profiles/cb'):
+>     ...
+
+"""
+from delphin.mrs import simplemrs
+from delphin import itsdb
+
+
+def read_profile(f, args=None):
+    """Load MRS from tsdb. (Copied from mrs_to_penman.py)
+
+    Generates (item id, sentence, list of MRSs) for each parsed item. The list is None if
+    one of the item's MRSs couldn't be read. (args isn't used.)
+
+    """
+    p = itsdb.ItsdbProfile(f)
+    inputs = dict((r['i-id'], r['i-input']) for r in p.read_table('item'))
+    cur_id, mrss = None, []
+    for row in p.join('parse', 'result'):
+        try:
+            mrs = simplemrs.loads_one(row['result:mrs'])
+
+            if cur_id is None:
+                cur_id = row['parse:i-id']
+
+            if cur_id == row['parse:i-id']:
+                mrss.append(mrs)
+            else:
+                yield (cur_id, inputs[cur_id], mrss)
+                cur_id, mrss = row['parse:i-id'], [mrs]
+        except Exception as ex:
+            print('Could not read profile from file {}, row: {}\n'.format(f, row))
+            mrss = None  # error case, must be handled by caller
+
+    yield (cur_id, inputs[cur_id], mrss)
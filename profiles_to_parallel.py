@@ -0,0 +1,36 @@
+"""
+Create parallel training files straight from [incr tsdb()] profiles.
+
+Equivalent to converting the profiles to Penman with mrs-to-penman (convert-redwoods.sh)
+and then running preprocessing.py on the result, but without writing or re-parsing the
+intermediate Penman file. Uses the same conversion parameters as setup.sh.
+
+e.g. to create the test set from the gold profiles:
+
+> python profiles_to_parallel.py --with_blanks \
+    --profiles mrs-to-penman/profiles/cb mrs-to-penman/profiles/cf04 ... \
+    --outfile_prefix data/test/test
+
+"""
+import argparse
+import preprocessing
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--profiles', nargs='+', required=True, help='One or more tsdb profile directories')
+    parser.add_argument('--outfile_prefix', required=True,
+                        help='Output files will be named using this prefix. Please make sure dir already exists.')
+    parser.add_argument('--params', default=preprocessing.DEFAULT_CONVERSION_PARAMS,
+                        help='mrs-to-penman conversion parameters (default: config/convert_redwoods_params.json)')
+    parser.add_argument(
+        '--with_blanks', action='store_true',
+        help='If True, output blank line when conversion fails. (Useful for preserving line '
+        'positions so output from different sources can be compared.)')
+    parser.add_argument(
+        '--stats', action='store_true',
+        help='If True, write per-stage timings, slowest graphs, and error types to {outfile_prefix}-stats.json')
+    args = parser.parse_args()
+    preprocessing.create_parallel_files_from_profiles(
+        args.profiles, args.outfile_prefix, params_filename=args.params,
+        output_blank_for_failure=args.with_blanks, collect_stats=args.stats)
@@ -3,6 +3,8 @@ import argparse
 import json
 import sys
 
+import fileio
+
 
 def build_replacement_map_most_common(anon_filenames, outfilename):
     """Create mapping from predicate to surface form to use in replacement.
@@ -18,7 +20,7 @@ def build_replacement_map_most_common(anon_filenames, outfilename):
     """
     replacement_counts = {}
     for replacements_filename in anon_filenames:
-        with open(replacements_filename) as infile:
+        with fileio.open_file(replacements_filename) as infile:
             for line in infile:
                 replacement_dicts = json.loads(line.strip())
                 # d is like: [{"ph": "mofy0", "realized": "November", "value": "Nov", "span": [0, 8]}]
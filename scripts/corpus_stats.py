@@ -0,0 +1,257 @@
+"""
+Report length and content statistics for parallel files, reading each file once.
+
+For each prefix, the four parallel files are read in parallel worker processes, and each file
+is read in a single pass:
+* -src: tokens per line, graph depth (nesting of parentheses), nodes per graph, and the
+  number of features in each node's feature bundle, plus the number of distinct bundles
+* -tgt and -orig: tokens per line
+* -anon: placeholders per line, and how often each type of placeholder (named, card,
+  UNK, _UNK, ...) appears and on how many lines
+* all files: number of lines and blank lines (a blank -src line is a graph that failed
+  preprocessing and was written with --with_blanks)
+
+Integer values are counted in NumPy histograms (np.bincount over chunks of lines), so memory
+depends on the largest value rather than the number of lines, and the quantiles read off
+them are exact. Lines longer than each --seq_length are counted too, to see what OpenNMT's
+-src_seq_length/-tgt_seq_length would drop.
+
+Usage:
+> python scripts/corpus_stats.py --prefixes data/train/train data_gw/train/train \
+    --json results/corpus-stats.json
+
+"""
+
+from collections import Counter
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import fileio
+import preprocessing
+
+SIDES = {
+    'src': preprocessing.get_src_filename,
+    'tgt': preprocessing.get_tgt_filename,
+    'anon': preprocessing.get_anon_filename,
+    'orig': preprocessing.get_orig_filename,
+}
+QUANTILES = [0.5, 0.9, 0.95, 0.99, 0.999]
+SEQ_LENGTHS = [50, 100, 200, 400]  # 400 is the -src_seq_length used by the run_*.sh scripts
+CHUNK_SIZE = 100000  # values buffered before being added to a histogram
+FEATURE_SEPARATOR = '￨'  # N.B. '￨' not '|'
+PLACEHOLDER_NUM_RE = re.compile(r'\d+$')
+
+
+class Histogram(object):
+    """Counts of non-negative integer values, filled in chunks with np.bincount."""
+    def __init__(self):
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.buffer = []
+
+    def add(self, value):
+        self.buffer.append(value)
+        if len(self.buffer) >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        chunk = np.bincount(np.asarray(self.buffer, dtype=np.int64))
+        if len(chunk) > len(self.counts):
+            self.counts = np.concatenate([self.counts, np.zeros(len(chunk) - len(self.counts), dtype=np.int64)])
+        self.counts[:len(chunk)] += chunk
+        self.buffer = []
+
+    def quantile(self, q):
+        """Smallest value with at least a q fraction of the values at or below it."""
+        cumulative = np.cumsum(self.counts)
+        return int(np.searchsorted(cumulative, q * cumulative[-1]))
+
+    def to_dict(self, seq_lengths=None):
+        self.flush()
+        total = int(self.counts.sum())
+        if not total:
+            return {'count': 0}
+        values = np.arange(len(self.counts))
+        summary = {
+            'count': total,
+            'mean': float((values * self.counts).sum()) / total,
+            'min': int(np.flatnonzero(self.counts)[0]),
+            'max': len(self.counts) - 1,
+            'quantiles': {'p{:g}'.format(100 * q): self.quantile(q) for q in QUANTILES},
+            'histogram': {str(value): int(count) for value, count in enumerate(self.counts) if count},
+        }
+        if seq_lengths:
+            summary['longer_than'] = {str(n): int(self.counts[n + 1:].sum()) for n in seq_lengths}
+        return summary
+
+
+def src_stats(infile):
+    """Token counts, graph depths, node counts and feature bundle sizes of linearized graphs."""
+    tokens = Histogram()
+    depths = Histogram()
+    nodes = Histogram()
+    bundle_sizes = Histogram()
+    bundles = set()
+    for line in infile:
+        line_tokens = line.split()
+        tokens.add(len(line_tokens))
+        if not line_tokens:
+            continue
+        depth = 0
+        max_depth = 0
+        num_nodes = 0
+        after_paren = False
+        for token in line_tokens:
+            word, _, features = token.partition(FEATURE_SEPARATOR)
+            if word == '(':
+                depth += 1
+                max_depth = max(depth, max_depth)
+                after_paren = True
+                continue
+            if word == ')':
+                depth -= 1
+            elif after_paren:  # node labels always follow "(", edge labels never do
+                num_nodes += 1
+                bundle_sizes.add(0 if features in ('', '_') else features.count('|') + 1)
+                bundles.add(features)
+            after_paren = False
+        depths.add(max_depth)
+        nodes.add(num_nodes)
+    return {
+        'tokens': tokens,
+        'depth': depths,
+        'nodes': nodes,
+        'feature_bundle_size': bundle_sizes,
+        'distinct_feature_bundles': len(bundles),
+    }
+
+
+def token_stats(infile):
+    tokens = Histogram()
+    for line in infile:
+        tokens.add(len(line.split()))
+    return {'tokens': tokens}
+
+
+def get_placeholder_type(placeholder):
+    """Placeholder without its number, e.g. named0 -> named. Unknown words like UNKfoxes0 are all UNK."""
+    if placeholder.startswith('UNK'):
+        return 'UNK'
+    return PLACEHOLDER_NUM_RE.sub('', placeholder)
+
+
+def anon_stats(infile):
+    """Placeholders per line, and occurrences and lines of each placeholder type."""
+    per_line = Histogram()
+    type_counts = Counter()
+    type_lines = Counter()
+    for line in infile:
+        anon_dicts = json.loads(line) if line.strip() else []
+        per_line.add(len(anon_dicts))
+        types = [get_placeholder_type(d['ph']) for d in anon_dicts]
+        type_counts.update(types)
+        type_lines.update(set(types))
+    return {
+        'placeholders': per_line,
+        'placeholder_types': {
+            ph_type: {'count': type_counts[ph_type], 'lines': type_lines[ph_type]}
+            for ph_type in sorted(type_counts)
+        },
+    }
+
+
+SIDE_STATS = {
+    'src': src_stats,
+    'tgt': token_stats,
+    'anon': anon_stats,
+    'orig': token_stats,
+}
+
+
+class LineCounter(object):
+    """Counts lines and blank lines of a file as they're read by one of the SIDE_STATS functions."""
+    def __init__(self, lines):
+        self.lines = lines
+        self.num_lines = 0
+        self.num_blank = 0
+
+    def __iter__(self):
+        for line in self.lines:
+            self.num_lines += 1
+            if not line.strip():
+                self.num_blank += 1
+            yield line
+
+
+def count_file(task):
+    """Compute the stats for one side of a prefix. Returns tuple of (prefix, side, stats dict)."""
+    prefix, side, seq_lengths = task
+    filename = fileio.find_file(SIDES[side](prefix))
+    with fileio.open_file(filename, encoding='utf8') as infile:
+        lines = LineCounter(infile)
+        stats = SIDE_STATS[side](lines)
+    result = {'file': filename, 'lines': lines.num_lines, 'blank_lines': lines.num_blank}
+    for name, value in stats.items():
+        if isinstance(value, Histogram):
+            value = value.to_dict(seq_lengths=seq_lengths if name == 'tokens' else None)
+        result[name] = value
+    return prefix, side, result
+
+
+def _describe(histogram_dict):
+    if not histogram_dict['count']:
+        return 'none'
+    return 'p50 {} p99 {} max {}'.format(
+        histogram_dict['quantiles']['p50'], histogram_dict['quantiles']['p99'], histogram_dict['max'])
+
+
+def corpus_stats(prefixes, seq_lengths=SEQ_LENGTHS, processes=None):
+    """Stats for each prefix, as {prefix: {side: stats, ...}}. (See module docstring.)"""
+    tasks = [(prefix, side, seq_lengths) for prefix in prefixes for side in sorted(SIDES)]
+    # the files are read independently, so fan them out and collect the results afterwards
+    if processes == 1:
+        results = list(map(count_file, tasks))
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.map(count_file, tasks, chunksize=1)
+        pool.close()
+        pool.join()
+    report = {prefix: {} for prefix in prefixes}
+    for prefix, side, stats in results:
+        report[prefix][side] = stats
+    for prefix, sides in report.items():
+        line_counts = set(stats['lines'] for stats in sides.values())
+        sides['aligned'] = len(line_counts) == 1
+        sides['failed_lines'] = sides['src']['blank_lines']
+        sys.stderr.write('{}: {} lines{}, {} failed. src tokens {}, tgt tokens {}, max depth {}\n'.format(
+            prefix, sides['src']['lines'], '' if sides['aligned'] else ' (NOT ALIGNED)', sides['failed_lines'],
+            _describe(sides['src']['tokens']), _describe(sides['tgt']['tokens']), sides['src']['depth'].get('max')))
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--prefixes', nargs='+', required=True,
+                        help='Prefixes of parallel files created by preprocessing.py')
+    parser.add_argument('--json', help='Write the stats to this JSON file (default: stdout)')
+    parser.add_argument('--seq_length', nargs='+', type=int, default=SEQ_LENGTHS,
+                        help='Count lines with more tokens than each of these')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='number of worker processes (default: number of CPUs)')
+    args = parser.parse_args()
+    report = corpus_stats(args.prefixes, seq_lengths=args.seq_length, processes=args.processes)
+    if args.json:
+        with open(args.json, 'w') as outfile:
+            json.dump(report, outfile, indent=4, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=4, sort_keys=True)
+        sys.stdout.write('\n')
@@ -0,0 +1,89 @@
+"""
+Translate each distinct source line only once.
+
+After anonymization many source lines are identical (e.g., the graphs of short silver sentences
+like "named0 said ."), and translation is deterministic, so every copy gets the same prediction.
+'dedup' writes the unique source lines and a map with the unique line id of each original line;
+'expand' uses the map to copy each unique prediction back to every line it came from. Expanded
+predictions are in the original line order, so postprocessing.py still applies each line's own
+-anon replacements (which is where identical anonymized lines differ).
+
+Usage:
+> python scripts/dedup_src.py dedup --infile data/test/test-src.txt.safe \
+    --outfile data/test/test-src.txt.unique --map data/test/test-src.txt.map
+> python OpenNMT-py/translate.py -src data/test/test-src.txt.unique -output pred.tokens.unique ...
+> python scripts/dedup_src.py expand --infile pred.tokens.unique \
+    --outfile pred.tokens --map data/test/test-src.txt.map
+
+"""
+
+import argparse
+import os
+import sys
+
+
+def get_map_filename(infilename):
+    return infilename + '.map'
+
+
+def dedup_lines(infilename, outfilename, map_filename=None):
+    """Write the distinct lines of infilename in order of first appearance.
+
+    Writes the unique line id (line number in outfilename) of each input line to map_filename.
+
+    Returns tuple of (num_lines, num_unique).
+
+    """
+    map_filename = map_filename or get_map_filename(infilename)
+    unique_ids = {}
+    num_lines = 0
+    with open(infilename, 'rb') as infile, \
+         open(outfilename, 'wb') as outfile, \
+         open(map_filename, 'w') as mapfile:
+        for line in infile:
+            line = line.rstrip(b'\n')
+            unique_id = unique_ids.get(line)
+            if unique_id is None:
+                unique_id = unique_ids[line] = len(unique_ids)
+                outfile.write(line + b'\n')
+            mapfile.write('{}\n'.format(unique_id))
+            num_lines += 1
+    num_unique = len(unique_ids)
+    sys.stderr.write('Wrote {} unique of {} lines to {} (dedup ratio {:.3f}, {:.1f}% fewer to translate)\n'.format(
+        num_unique, num_lines, os.path.abspath(outfilename),
+        float(num_unique) / num_lines if num_lines else 1.0,
+        100.0 * (num_lines - num_unique) / num_lines if num_lines else 0))
+    return num_lines, num_unique
+
+
+def expand_lines(infilename, outfilename, map_filename):
+    """Write the line of infilename for each unique id in map_filename, undoing dedup_lines."""
+    with open(infilename, 'rb') as infile:
+        unique_lines = [line.rstrip(b'\n') for line in infile]
+    num_lines = 0
+    with open(map_filename) as mapfile, open(outfilename, 'wb') as outfile:
+        for line in mapfile:
+            unique_id = int(line)
+            if unique_id >= len(unique_lines):
+                raise ValueError('{} has {} lines but map {} refers to line {}'.format(
+                    infilename, len(unique_lines), map_filename, unique_id))
+            outfile.write(unique_lines[unique_id] + b'\n')
+            num_lines += 1
+    sys.stderr.write('Expanded {} unique lines to {} lines in {}\n'.format(
+        len(unique_lines), num_lines, os.path.abspath(outfilename)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('mode', choices=['dedup', 'expand'],
+                        help='dedup a source file, or expand predictions for the unique lines')
+    parser.add_argument('--infile', required=True)
+    parser.add_argument('--outfile', required=True)
+    parser.add_argument('--map', help='Unique line id of each original line (default: {infile}.map for dedup)')
+    args = parser.parse_args()
+    if args.mode == 'dedup':
+        dedup_lines(args.infile, args.outfile, args.map)
+    else:
+        if not args.map:
+            parser.error('--map is required to expand')
+        expand_lines(args.infile, args.outfile, args.map)
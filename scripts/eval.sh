@@ -50,7 +50,17 @@ text_filename="results/$MODEL_NAME.$EVAL_FILE_ID.pred.text"
 eval_filename="results/$MODEL_NAME.$EVAL_FILE_ID.sacrebleu"
 echo "Loading model from $MODEL_PATH"
 echo "Using $MODEL_PATH to generate predictions, writing to $pred_filename..."
-python OpenNMT-py/translate.py -model $MODEL_PATH -src $SOURCE_FILENAME_SAFE -output $pred_filename -replace_unk -gpu $GPU
+# Translate each distinct source line once, sorted by length so batches need less padding, then
+# put predictions back in corpus order so they line up with the replacements file again
+SOURCE_FILENAME_UNIQUE="$SOURCE_FILENAME_SAFE.unique"
+SOURCE_MAP_FILENAME="$SOURCE_FILENAME_SAFE.map"
+SOURCE_FILENAME_SORTED="$SOURCE_FILENAME_UNIQUE.sorted"
+SOURCE_ORDER_FILENAME="$SOURCE_FILENAME_UNIQUE.order"
+python scripts/dedup_src.py dedup --infile $SOURCE_FILENAME_SAFE --outfile $SOURCE_FILENAME_UNIQUE --map $SOURCE_MAP_FILENAME
+python scripts/length_sort.py sort --infile $SOURCE_FILENAME_UNIQUE --outfile $SOURCE_FILENAME_SORTED --index $SOURCE_ORDER_FILENAME
+python OpenNMT-py/translate.py -model $MODEL_PATH -src $SOURCE_FILENAME_SORTED -output $pred_filename.sorted -replace_unk -gpu $GPU
+python scripts/length_sort.py restore --infile $pred_filename.sorted --outfile $pred_filename.unique --index $SOURCE_ORDER_FILENAME
+python scripts/dedup_src.py expand --infile $pred_filename.unique --outfile $pred_filename --map $SOURCE_MAP_FILENAME
 echo "Postprocessing and writing text to $text_filename"
 python postprocessing.py --infile $pred_filename --outfile $text_filename_tmp \
 	--replacements $REPLACEMENTS_FILENAME --replacements_map $ANON_REPLACEMENTS_MAP_FILENAME
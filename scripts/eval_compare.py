@@ -1,47 +1,116 @@
-###
-# Compute sacrebleu for just those lines that appear in both NN output and ACE output.
-###
+"""
+Compute sacrebleu for just those lines that appear in the output of every system being compared.
 
-import os
+Reference and hypothesis files are streamed together in a single pass. A line is kept only if
+the reference and all hypotheses are non-blank (and not "BLANK") at that position, and BLEU for
+each system is computed in-process on that common subset.
+
+Usage:
+python scripts/eval_compare.py \
+    --ref data/test/test-orig.txt \
+    --hyps results/v10_acc_92.76_ppl_1.49_e22.pt.data_test_test.pred.text results/ace.pred.test.text
+
+"""
+
+from itertools import zip_longest
+import argparse
+import sys
+
+import sacrebleu
 
 
 def get_overlap_filename(infilename):
     return infilename + '.overlap'
 
 
-def get_overlapping_lines(eval_filename, nn_filename, ace_filename):
-    """Create dev and test sets including only lines for which both methods succeeded."""
-    infile_eval = open(eval_filename)
-    infile_nn = open(nn_filename)
-    infile_ace = open(ace_filename)
-    outfile_eval = open(get_overlap_filename(eval_filename), 'w')
-    outfile_nn = open(get_overlap_filename(nn_filename), 'w')
-    outfile_ace = open(get_overlap_filename(ace_filename), 'w')
-    line_tups = zip(infile_eval.readlines(), infile_nn.readlines(), infile_ace.readlines())
-    for tup in line_tups:
-        is_complete = True
-        for source in tup:
-            line = source.strip()
-            if not line or line == 'BLANK':
-                is_complete = False
-                break
-        if is_complete:
-            line_eval, line_nn, line_ace = tup
-            outfile_eval.write(line_eval)
-            outfile_nn.write(line_nn)
-            outfile_ace.write(line_ace)
-    for f in [infile_eval, infile_nn, infile_ace, outfile_eval, outfile_nn, outfile_ace]:
-        f.close()
+def is_blank(line):
+    """True if line is missing, empty, or the BLANK marker written for failed inputs."""
+    line = line.strip()
+    return not line or line == 'BLANK'
+
+
+def read_overlapping_lines(ref_filename, hyp_filenames):
+    """Stream reference and hypothesis files together, keeping lines where all systems succeeded.
+
+    Returns tuple of (mask, ref_lines, hyp_lines), where mask is a bytearray with a 1 for each
+    line position that was kept, ref_lines is the list of kept reference lines, and hyp_lines
+    has one list of kept lines per hypothesis file (in the same order as hyp_filenames).
+
+    """
+    infiles = [open(filename) for filename in [ref_filename] + list(hyp_filenames)]
+    mask = bytearray()
+    ref_lines = []
+    hyp_lines = [[] for _ in hyp_filenames]
+    num_lines = 0
+    try:
+        # files of different lengths are padded with blanks so they can't add to the overlap
+        for tup in zip_longest(*infiles, fillvalue=''):
+            num_lines += 1
+            if any(is_blank(line) for line in tup):
+                mask.append(0)
+                continue
+            mask.append(1)
+            ref_lines.append(tup[0].strip())
+            for i, line in enumerate(tup[1:]):
+                hyp_lines[i].append(line.strip())
+    finally:
+        for f in infiles:
+            f.close()
+    sys.stderr.write('Found {} of {} lines present in all {} files\n'.format(
+        len(ref_lines), num_lines, len(infiles)))
+    return mask, ref_lines, hyp_lines
+
+
+def score_lines(ref_lines, hyp_lines):
+    """Compute corpus BLEU of each list in hyp_lines against ref_lines."""
+    return [sacrebleu.corpus_bleu(lines, [ref_lines]) for lines in hyp_lines]
+
+
+def compare_systems(ref_filename, hyp_filenames, write_overlap=False):
+    """Compute corpus BLEU for each hypothesis file on the lines where every system succeeded.
+
+    If write_overlap is True, the kept lines are also written to *.overlap copies of each file.
+    Returns list of (hyp_filename, bleu) tuples, where bleu is the sacrebleu result object.
+
+    """
+    _, ref_lines, hyp_lines = read_overlapping_lines(ref_filename, hyp_filenames)
+    if write_overlap:
+        write_overlap_files([ref_filename] + list(hyp_filenames), [ref_lines] + hyp_lines)
+    return list(zip(hyp_filenames, score_lines(ref_lines, hyp_lines)))
+
+
+def write_overlap_files(filenames, lines_per_file):
+    """Write kept lines for each file to a copy named by get_overlap_filename."""
+    for filename, lines in zip(filenames, lines_per_file):
+        with open(get_overlap_filename(filename), 'w') as outfile:
+            for line in lines:
+                outfile.write(line + '\n')
+
+
+def get_overlapping_lines(eval_filename, *hyp_filenames):
+    """Create copies of eval and hypothesis files including only lines for which all methods succeeded."""
+    mask, ref_lines, hyp_lines = read_overlapping_lines(eval_filename, hyp_filenames)
+    write_overlap_files([eval_filename] + list(hyp_filenames), [ref_lines] + hyp_lines)
+    return mask
 
 
 if __name__ == '__main__':
-    ace_filename = 'results/ace.pred.test.text'
-    eval_filename = 'data/test/test-orig.txt'
-    nn_filename = 'results/v10_acc_92.76_ppl_1.49_e22.pt.data_test_test.pred.text'
-    get_overlapping_lines(eval_filename, nn_filename, ace_filename)
-    cmd1 = "cat {} | sacrebleu {} > results/{}.overlap.sacrebleu".format(get_overlap_filename(nn_filename), get_overlap_filename(eval_filename), 'nn')
-    cmd2 = "cat {} | sacrebleu {} > results/{}.overlap.sacrebleu".format(get_overlap_filename(ace_filename), get_overlap_filename(eval_filename), 'ace')
-    print(cmd1)
-    os.system(cmd1)
-    print(cmd2)
-    os.system(cmd2)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ref', default='data/test/test-orig.txt',
+                        help='Reference (gold) sentences, one per line.')
+    parser.add_argument('--hyps', nargs='+',
+                        default=['results/v10_acc_92.76_ppl_1.49_e22.pt.data_test_test.pred.text',
+                                 'results/ace.pred.test.text'],
+                        help='One or more system output files, line-aligned with the reference.')
+    parser.add_argument('--outfile', help='If given, BLEU for each system is also written here.')
+    parser.add_argument('--write_overlap', action='store_true',
+                        help='Also write *.overlap copies of the reference and hypothesis files.')
+    args = parser.parse_args()
+    results = compare_systems(args.ref, args.hyps, write_overlap=args.write_overlap)
+    result_lines = ['{}\t{}'.format(hyp_filename, bleu) for hyp_filename, bleu in results]
+    for result_line in result_lines:
+        print(result_line)
+    if args.outfile:
+        with open(args.outfile, 'w') as outfile:
+            for result_line in result_lines:
+                outfile.write(result_line + '\n')
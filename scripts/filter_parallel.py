@@ -0,0 +1,134 @@
+"""
+Remove training pairs that are too long or whose source and target lengths are too far apart.
+
+Streams the parallel files at --prefix and writes the pairs that pass to --out_prefix, keeping
+-src, -tgt, -anon and -orig aligned. A pair is removed if it has more -src tokens than
+--max_src_tokens, more -tgt tokens than --max_tgt_tokens, or a -src/-tgt token ratio outside
+--min_ratio..--max_ratio. (Linearized graphs have several tokens per word, so typical ratios
+are well above 1. See scripts/corpus_stats.py for the distributions.) Removed pairs are left
+out, or written as blank lines with --blank, the same way preprocessing.py --with_blanks marks
+graphs that failed, so line numbers still match the input. Blank input lines are passed through.
+
+A summary of what was removed, and why, is written to stderr and to --report if given. A pair
+that breaks several limits is counted under each of them, but only once in the totals.
+
+Usage:
+> python scripts/filter_parallel.py --prefix data_gw/train/train --out_prefix data_gw/filtered/train \
+    --max_src_tokens 400 --max_tgt_tokens 100 --max_ratio 12 --report data_gw/filtered/filter-report.json
+
+"""
+
+from collections import Counter
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import fileio
+import preprocessing
+
+BLANK_LINES = ('\n', '\n', '[]\n', '\n')  # as written by preprocessing.py --with_blanks
+NUM_EXAMPLES = 10  # line numbers of removed pairs kept in the report for each reason
+
+
+def get_removal_reasons(num_src, num_tgt, max_src_tokens=None, max_tgt_tokens=None, min_ratio=None,
+                        max_ratio=None):
+    """List of the limits broken by a pair with these token counts (empty if it passes)."""
+    reasons = []
+    if max_src_tokens is not None and num_src > max_src_tokens:
+        reasons.append('max_src_tokens')
+    if max_tgt_tokens is not None and num_tgt > max_tgt_tokens:
+        reasons.append('max_tgt_tokens')
+    ratio = float(num_src) / num_tgt if num_tgt else float('inf')
+    if min_ratio is not None and ratio < min_ratio:
+        reasons.append('min_ratio')
+    if max_ratio is not None and ratio > max_ratio:
+        reasons.append('max_ratio')
+    return reasons
+
+
+def filter_parallel_files(prefix, out_prefix, output_blank=False, report_filename=None, **limits):
+    """Write the pairs at prefix that are within limits to out_prefix. (See module docstring.)
+
+    :limits: max_src_tokens, max_tgt_tokens, min_ratio and max_ratio, as in get_removal_reasons
+
+    Returns the report dict.
+
+    """
+    if os.path.abspath(prefix) == os.path.abspath(out_prefix):
+        raise ValueError('--out_prefix must be different from --prefix, since the files are streamed')
+    reason_counts = Counter()
+    examples = {}
+    totals = Counter()
+
+    def filtered_lines():
+        for i, lines in enumerate(preprocessing.read_parallel_lines(prefix)):
+            src_line, tgt_line = lines[:2]
+            totals['lines'] += 1
+            if not src_line.strip():  # already blank
+                totals['blank_lines'] += 1
+                yield lines
+                continue
+            num_src = len(src_line.split())
+            num_tgt = len(tgt_line.split())
+            totals['src_tokens'] += num_src
+            totals['tgt_tokens'] += num_tgt
+            reasons = get_removal_reasons(num_src, num_tgt, **limits)
+            if not reasons:
+                yield lines
+                continue
+            totals['removed'] += 1
+            totals['removed_src_tokens'] += num_src
+            totals['removed_tgt_tokens'] += num_tgt
+            for reason in reasons:
+                reason_counts[reason] += 1
+                reason_examples = examples.setdefault(reason, [])
+                if len(reason_examples) < NUM_EXAMPLES:
+                    reason_examples.append({'line': i + 1, 'src_tokens': num_src, 'tgt_tokens': num_tgt})
+            if output_blank:
+                yield BLANK_LINES
+
+    compression = fileio.get_compression(preprocessing.find_parallel_files(prefix)[0])
+    num_written = preprocessing.write_parallel_lines(filtered_lines(), out_prefix, compression)
+    report = {
+        'prefix': prefix,
+        'out_prefix': out_prefix,
+        'limits': limits,
+        'lines': totals['lines'],
+        'blank_lines': totals['blank_lines'],
+        'written_lines': num_written,
+        'removed': totals['removed'],
+        'removed_by_limit': dict(reason_counts),
+        'examples': examples,
+        'src_tokens': totals['src_tokens'],
+        'tgt_tokens': totals['tgt_tokens'],
+        'removed_src_tokens': totals['removed_src_tokens'],
+        'removed_tgt_tokens': totals['removed_tgt_tokens'],
+    }
+    sys.stderr.write('Removed {} of {} pairs ({}) from {}, {} of {} source tokens. Wrote {} lines to {}\n'.format(
+        totals['removed'], totals['lines'], ', '.join('{} {}'.format(count, reason)
+                                                     for reason, count in sorted(reason_counts.items())) or 'none',
+        prefix, totals['removed_src_tokens'], totals['src_tokens'], num_written, out_prefix))
+    if report_filename:
+        with open(report_filename, 'w') as outfile:
+            json.dump(report, outfile, indent=4, sort_keys=True)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--prefix', required=True, help='Prefix of parallel files created by preprocessing.py')
+    parser.add_argument('--out_prefix', required=True, help='Filtered files will be named using this prefix')
+    parser.add_argument('--max_src_tokens', type=int, help='Remove pairs with more source tokens than this')
+    parser.add_argument('--max_tgt_tokens', type=int, help='Remove pairs with more target tokens than this')
+    parser.add_argument('--min_ratio', type=float, help='Remove pairs with fewer source tokens per target token')
+    parser.add_argument('--max_ratio', type=float, help='Remove pairs with more source tokens per target token')
+    parser.add_argument('--blank', action='store_true',
+                        help='Write blank lines in place of removed pairs, instead of leaving them out')
+    parser.add_argument('--report', help='Write a JSON summary of the removed pairs here')
+    args = parser.parse_args()
+    filter_parallel_files(args.prefix, args.out_prefix, output_blank=args.blank, report_filename=args.report,
+                          max_src_tokens=args.max_src_tokens, max_tgt_tokens=args.max_tgt_tokens,
+                          min_ratio=args.min_ratio, max_ratio=args.max_ratio)
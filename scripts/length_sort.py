@@ -0,0 +1,115 @@
+"""
+Reorder a source file by length before translation, and put the predictions back in order after.
+
+Linearized graphs range from a handful of tokens to several hundred, so translating them in
+corpus order pads most of each batch out to its longest line. Sorting the source lines into
+length buckets first means each batch holds lines of about the same length. The sort writes an
+index with the original line number of each sorted line, which is used to restore the
+predictions to corpus order before postprocessing.py, so they still line up with the -anon and
+-orig files. Lines in the same bucket keep their corpus order.
+
+Files are read through byte offsets, so only the offsets and lengths are held in memory.
+
+Usage:
+> python scripts/length_sort.py sort --infile data/test/test-src.txt.safe \
+    --outfile data/test/test-src.txt.sorted --index data/test/test-src.txt.order
+> python OpenNMT-py/translate.py -src data/test/test-src.txt.sorted -output pred.tokens.sorted ...
+> python scripts/length_sort.py restore --infile pred.tokens.sorted \
+    --outfile pred.tokens --index data/test/test-src.txt.order
+
+"""
+
+import argparse
+import os
+import sys
+
+TRANSLATE_BATCH_SIZE = 30  # OpenNMT translate.py default, only used to report padding
+
+
+def get_index_filename(infilename):
+    return infilename + '.order'
+
+
+def read_line_offsets(infilename):
+    """Return tuple of (offsets, lengths), the byte offset and token count of each line."""
+    offsets = []
+    lengths = []
+    with open(infilename, 'rb') as infile:
+        offset = 0
+        for line in infile:
+            offsets.append(offset)
+            lengths.append(len(line.split()))
+            offset += len(line)
+    return offsets, lengths
+
+
+def length_order(lengths, bucket_width=1):
+    """Line numbers ordered by length bucket (longest first), keeping corpus order within a bucket."""
+    return sorted(range(len(lengths)), key=lambda i: (-(lengths[i] // bucket_width), i))
+
+
+def padded_tokens(lengths, batch_size=TRANSLATE_BATCH_SIZE):
+    """Number of tokens (including padding) in batches of consecutive lines."""
+    return sum(max(lengths[i:i + batch_size]) * len(lengths[i:i + batch_size])
+               for i in range(0, len(lengths), batch_size))
+
+
+def write_lines_in_order(infilename, outfilename, offsets, order):
+    """Write the lines of infilename at the given line numbers, in that order."""
+    with open(infilename, 'rb') as infile, open(outfilename, 'wb') as outfile:
+        for i in order:
+            infile.seek(offsets[i])
+            line = infile.readline()
+            outfile.write(line if line.endswith(b'\n') else line + b'\n')
+
+
+def sort_by_length(infilename, outfilename, index_filename=None, bucket_width=1):
+    """Write the lines of infilename sorted into length buckets, and the index needed to undo it."""
+    index_filename = index_filename or get_index_filename(infilename)
+    offsets, lengths = read_line_offsets(infilename)
+    order = length_order(lengths, bucket_width=bucket_width)
+    write_lines_in_order(infilename, outfilename, offsets, order)
+    with open(index_filename, 'w') as outfile:
+        for i in order:
+            outfile.write('{}\n'.format(i))
+    before = padded_tokens(lengths)
+    after = padded_tokens([lengths[i] for i in order])
+    sys.stderr.write('Sorted {} lines into {}. Tokens per {}-line batch including padding: {} -> {} '
+                     '({:.1f}% fewer)\n'.format(len(order), os.path.abspath(outfilename), TRANSLATE_BATCH_SIZE,
+                                              before, after, 100.0 * (before - after) / before if before else 0))
+    sys.stderr.write('Wrote original line order to {}\n'.format(os.path.abspath(index_filename)))
+
+
+def restore_order(infilename, outfilename, index_filename):
+    """Put lines of infilename (e.g., predictions for a sorted source file) back in corpus order."""
+    with open(index_filename) as infile:
+        order = [int(line) for line in infile]
+    offsets, _ = read_line_offsets(infilename)
+    if len(offsets) != len(order):
+        raise ValueError('{} has {} lines but index {} has {}'.format(
+            infilename, len(offsets), index_filename, len(order)))
+    # position in the sorted file of each original line
+    sorted_position = [0] * len(order)
+    for position, i in enumerate(order):
+        sorted_position[i] = position
+    write_lines_in_order(infilename, outfilename, offsets, sorted_position)
+    sys.stderr.write('Restored {} lines to original order in {}\n'.format(
+        len(order), os.path.abspath(outfilename)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('mode', choices=['sort', 'restore'],
+                        help='sort a source file by length, or restore predictions to original order')
+    parser.add_argument('--infile', required=True)
+    parser.add_argument('--outfile', required=True)
+    parser.add_argument('--index', help='Original line numbers of sorted lines (default: {infile}.order for sort)')
+    parser.add_argument('--bucket_width', type=int, default=1,
+                        help='Lines whose lengths differ by less than this may share a bucket (sort only)')
+    args = parser.parse_args()
+    if args.mode == 'sort':
+        sort_by_length(args.infile, args.outfile, args.index, bucket_width=args.bucket_width)
+    else:
+        if not args.index:
+            parser.error('--index is required to restore')
+        restore_order(args.infile, args.outfile, args.index)
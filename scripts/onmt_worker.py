@@ -0,0 +1,75 @@
+"""
+Translate batches of linearized graphs with an OpenNMT-py model that stays loaded, for
+serve.py --translator worker.
+
+Reads batches from stdin: lines to translate, each batch ended by an empty line. For each batch,
+writes one line of predicted tokens per input line to stdout and flushes. Anything OpenNMT
+prints goes to stderr instead, so stdout only carries predictions. Exits when stdin is closed.
+
+Takes the same options as OpenNMT-py's translate.py, except -src and -output, and uses the
+Translator API of the OpenNMT-py version pinned in setup.sh (checked out in OpenNMT-py/).
+
+Usage:
+> python serve.py --translator worker \
+    --worker_cmd "python scripts/onmt_worker.py -model models/model.pt -replace_unk -gpu 0"
+
+"""
+
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'OpenNMT-py'))
+
+import onmt.opts
+from onmt.translate.Translator import make_translator
+
+
+def read_batches(infile):
+    """Yield lists of lines, one per batch (lines up to the next empty line)."""
+    batch = []
+    for line in infile:
+        line = line.rstrip('\n')
+        if line:
+            batch.append(line)
+        elif batch:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def translate_batch(translator, opt, batch, workdir):
+    """One tokenized prediction line per line of batch."""
+    src_filename = os.path.join(workdir, 'src.txt')
+    with io.open(src_filename, 'w', encoding='utf8') as outfile:
+        for line in batch:
+            outfile.write(line + '\n')
+    translator.out_file = io.StringIO()
+    translator.translate(opt.src_dir, src_filename, None, opt.batch_size, opt.attn_debug)
+    predictions = translator.out_file.getvalue().splitlines()
+    if len(predictions) != len(batch) * opt.n_best:
+        raise RuntimeError('Translator returned {} lines for a batch of {}'.format(len(predictions), len(batch)))
+    return predictions[::opt.n_best]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='onmt_worker.py')
+    onmt.opts.translate_opts(parser)
+    # -src and -output are per batch, but translate_opts requires -src
+    opt = parser.parse_args(sys.argv[1:] + ['-src', os.devnull, '-output', os.devnull])
+    infile = io.TextIOWrapper(sys.stdin.buffer, encoding='utf8')
+    outfile = io.TextIOWrapper(sys.stdout.buffer, encoding='utf8')
+    sys.stdout = sys.stderr  # OpenNMT reports scores and progress with print
+    translator = make_translator(opt, report_score=False, out_file=io.StringIO())
+    workdir = tempfile.mkdtemp(prefix='onmt-worker-')
+    try:
+        for batch in read_batches(infile):
+            for prediction in translate_batch(translator, opt, batch, workdir):
+                outfile.write(prediction + '\n')
+            outfile.flush()
+    finally:
+        shutil.rmtree(workdir)
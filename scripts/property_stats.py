@@ -1,6 +1,11 @@
 #!/usr/bin/env python3
 
 import argparse
+import csv
+import json
+import multiprocessing
+
+import numpy as np
 
 from delphin import itsdb
 from delphin.mrs import simplemrs
@@ -22,15 +27,62 @@ X_PROPERTIES = [
 ]
 
 
-def _make_counters():
-    make = lambda d: {prop: {val: 0 for val in vals} for prop, vals in d}
+VARTYPE_PROPERTIES = [
+    ('e', E_PROPERTIES),
+    ('x', X_PROPERTIES),
+    ('i', X_PROPERTIES),
+]
+
+
+def _make_index():
+    """Assign each (vartype, property, value) a fixed position in a flat count array."""
+    index = {}
+    for vartype, props in VARTYPE_PROPERTIES:
+        for prop, vals in props:
+            for val in vals:
+                index[(vartype, prop, val)] = len(index)
+    return index
+
+
+PROPERTY_INDEX = _make_index()
+
+
+def _make_counts():
+    return np.zeros(len(PROPERTY_INDEX), dtype=np.int64)
+
+
+def _make_counters(counts=None):
+    """Build nested {vartype: {prop: {val: count}}} dicts, optionally filled from a count array."""
+    if counts is None:
+        counts = _make_counts()
     return {
-        'e': make(E_PROPERTIES),
-        'x': make(X_PROPERTIES),
-        'i': make(X_PROPERTIES)
+        vartype: {
+            prop: {val: int(counts[PROPERTY_INDEX[(vartype, prop, val)]]) for val in vals}
+            for prop, vals in props
+        }
+        for vartype, props in VARTYPE_PROPERTIES
     }
 
 
+def count_profile(profile):
+    """Count property values over every MRS in a profile's result table.
+
+    Returns tuple of (profile, record_count, counts) where counts is indexed by PROPERTY_INDEX.
+
+    """
+    ts = itsdb.TestSuite(profile)
+    counts = _make_counts()
+    record_count = 0
+    for record in ts['result']:
+        record_count += 1
+        mrs = simplemrs.loads_one(record['mrs'])
+        for var in mrs.variables():
+            vartype = var_sort(var)
+            for prop, val in mrs.properties(var).items():
+                counts[PROPERTY_INDEX[(vartype, prop.upper(), val.lower())]] += 1
+    return profile, record_count, counts
+
+
 def report(sums):
     for vartype, props in sums.items():
         for prop, vals in props.items():
@@ -46,36 +98,65 @@ def report(sums):
     print()
 
 
-def main(args):
-    total_sums = _make_counters()
-    total_record_count = 0
+def export_json(results, total_record_count, total_counts, filename):
+    """Write per-profile and total counts as nested dicts."""
+    data = {
+        'profiles': [
+            {'profile': profile, 'records': record_count, 'counts': _make_counters(counts)}
+            for profile, record_count, counts in results
+        ],
+        'total': {'records': total_record_count, 'counts': _make_counters(total_counts)},
+    }
+    with open(filename, 'w') as outfile:
+        json.dump(data, outfile, indent=4)
 
-    for profile in args.PROFILE:
-        ts = itsdb.TestSuite(profile)
-        sums = _make_counters()
-        record_count = 0
 
-        for record in ts['result']:
-            record_count += 1
-            total_record_count += 1
-            mrs = simplemrs.loads_one(record['mrs'])
+def export_csv(results, total_record_count, total_counts, filename):
+    """Write one row per (profile, vartype, property, value), with TOTAL rows last."""
+    rows = [(profile, counts) for profile, _, counts in results] + [('TOTAL', total_counts)]
+    with open(filename, 'w', newline='') as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(['profile', 'vartype', 'property', 'value', 'count', 'pct'])
+        for profile, counts in rows:
+            for vartype, props in _make_counters(counts).items():
+                for prop, vals in props.items():
+                    prop_count = sum(vals.values())
+                    for val, count in vals.items():
+                        pct = count / float(prop_count) if prop_count else ''
+                        writer.writerow([profile, vartype, prop, val, count, pct])
 
-            for var in mrs.variables():
-                vartype = var_sort(var)
 
-                for prop, val in mrs.properties(var).items():
-                    sums[vartype][prop.upper()][val.lower()] += 1
+def main(args):
+    total_counts = _make_counts()
+    total_record_count = 0
+    results = []
+
+    # profiles are counted independently, so fan them out and merge the arrays afterwards
+    if args.processes == 1:
+        profile_counts = map(count_profile, args.PROFILE)
+    else:
+        pool = multiprocessing.Pool(args.processes)
+        profile_counts = pool.imap(count_profile, args.PROFILE)
+
+    for profile, record_count, counts in profile_counts:
+        results.append((profile, record_count, counts))
+        total_record_count += record_count
+        total_counts += counts
 
         print('{} ({} MRSs):'.format(profile, record_count))
-        report(sums)
+        report(_make_counters(counts))
 
-        for vartype, props in sums.items():
-            for prop, vals in props.items():
-                for val, count in vals.items():
-                    total_sums[vartype][prop][val] += count
+    if args.processes != 1:
+        pool.close()
+        pool.join()
 
     print('TOTAL ({} MRSs):'.format(total_record_count))
-    report(total_sums)
+    report(_make_counters(total_counts))
+
+    if args.json:
+        export_json(results, total_record_count, total_counts, args.json)
+    if args.csv:
+        export_csv(results, total_record_count, total_counts, args.csv)
 
 
 if __name__ == '__main__':
@@ -83,5 +164,9 @@ if __name__ == '__main__':
         description='Compute morphosemantic property statistics')
     parser.add_argument('PROFILE', nargs='+',
                         help='profile to compute statistics over')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--json', help='also write counts to this JSON file')
+    parser.add_argument('--csv', help='also write counts to this CSV file')
     args = parser.parse_args()
     main(args)
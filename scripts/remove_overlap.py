@@ -23,6 +23,10 @@ import argparse
 import os
 import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import fileio
+
 DEBUG = False
 PARALLEL_FILE_SUFFIXES = ['src.txt', 'tgt.txt', 'anon.txt', 'orig.txt']
 
@@ -42,12 +46,12 @@ def find_overlapping_lines(filename1, filename2, blacklist_filename='blacklist.t
     num_overlapping = 0
     num_lines = 0
     lines1 = set()
-    with open(filename1) as infile1:
+    with fileio.open_file(filename1) as infile1:
         for line1 in infile1:
             line1 = line1.strip()
             if line1:
                 lines1.add(line1)
-    with open(filename2) as infile2, open(blacklist_filename, 'a' if append else 'w') as blacklist:
+    with fileio.open_file(filename2) as infile2, open(blacklist_filename, 'a' if append else 'w') as blacklist:
         for line2 in infile2:
             line2 = line2.strip()
             if line2 and (line2 in lines1):
@@ -70,22 +74,22 @@ def apply_blacklist(fileprefix, blacklist_filename, output_blank=False):
         skip the line and output nothing.
 
     """
-    src_filename = fileprefix + '-src.txt'
-    tgt_filename = fileprefix + '-tgt.txt'
-    orig_filename = fileprefix + '-orig.txt'
-    anon_filename = fileprefix + '-anon.txt'
+    src_filename = fileio.find_file(fileprefix + '-src.txt')
+    tgt_filename = fileio.find_file(fileprefix + '-tgt.txt')
+    orig_filename = fileio.find_file(fileprefix + '-orig.txt')
+    anon_filename = fileio.find_file(fileprefix + '-anon.txt')
     blacklist = set(open(blacklist_filename).readlines())
     # identify line numbers of sentences that should be removed
     bad_line_nums = set()
-    with open(tgt_filename) as infile:
+    with fileio.open_file(tgt_filename) as infile:
         for i, line in enumerate(infile):
             if line in blacklist:
                 bad_line_nums.add(i)
     # replace bad line numbers with blank lines in all parallel files
     for filename in [src_filename, tgt_filename, orig_filename, anon_filename]:
-        with open(filename, 'r') as infile:
+        with fileio.open_file(filename, 'r') as infile:
             lines = infile.readlines()
-        with open(filename, 'w') as outfile:
+        with fileio.open_file(filename, 'w') as outfile:
             for i, line in enumerate(lines):
                 if i in bad_line_nums:
                     if DEBUG:
@@ -135,7 +139,7 @@ if __name__ == '__main__':
         print('Checking parallel files for {}.'.format(train_file))
         prefix = train_file.rsplit('-', 1)[0]
         for suffix in PARALLEL_FILE_SUFFIXES:
-            filename = '-'.join([prefix, suffix])
+            filename = fileio.find_file('-'.join([prefix, suffix]))
             if os.path.exists(filename):
                 print('Found {}'.format(filename))
             else:
@@ -145,10 +149,12 @@ if __name__ == '__main__':
 
     # find lines that appear in both test and train data and store them in blacklist file
     for i, train_file in enumerate(args.train_files):
-        for test_file in args.test_files:
-            append = True if i == 0 else False  # create new list on first file, append for others
+        for j, test_file in enumerate(args.test_files):
+            append = i > 0 or j > 0  # create new list on first pair of files, append for others
             print('Checking {} for lines that overlap with {}'.format(train_file, test_file))
-            find_overlapping_lines(test_file, train_file, args.blacklist_file, append=append)
+            # like apply_blacklist, pick up compressed versions of the files
+            find_overlapping_lines(fileio.find_file(test_file), fileio.find_file(train_file), args.blacklist_file,
+                                   append=append)
 
     # for any -tgt line that was found in the test set, remove it from parallel files
     for train_file in args.train_files:
@@ -0,0 +1,311 @@
+"""
+Run the data preparation pipeline (see scripts/prep.sh) as a graph of stages.
+
+Each stage declares the files it reads (inputs), the files it creates (outputs), and the files
+it rewrites in place (updates). Stages that would rewrite their own inputs in place, like
+remove_overlap.py blanking lines in the training files, instead copy the untouched files written
+by an earlier stage and change the copies, so that rerunning them alone gives the same result.
+A stage depends on every earlier stage that writes a file it reads or writes, and stages whose
+dependencies are done run in parallel, up to --jobs at a time.
+
+A stage is skipped if it finished before with the same command and none of its files have
+changed since: every input has the same content hash as when the stage last ran, every update
+has the content it was left with, and every output exists. Hashes are cached by file size and
+modification time, so unchanged files aren't re-read. The state is kept in --state.
+
+After a run, the time of each stage and the critical path (the chain of dependent stages that
+took longest, which bounds the run time however many jobs are used) are printed.
+
+Usage (from the repo root):
+> python scripts/run_pipeline.py --jobs 4
+> python scripts/run_pipeline.py --dry_run
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import argparse
+import fnmatch
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+HASH_CHUNK_SIZE = 1 << 20
+PARALLEL_FILE_SUFFIXES = ['src.txt', 'tgt.txt', 'anon.txt', 'orig.txt']
+# preprocessing.py and the modules and config it loads
+LINEARIZE_INPUTS = ['preprocessing.py', 'fileio.py', 'profiles.py', 'config/convert_redwoods_params.json']
+
+
+def parallel_files(prefix):
+    return ['{}-{}'.format(prefix, suffix) for suffix in PARALLEL_FILE_SUFFIXES]
+
+
+def stage(name, cmd, inputs=(), outputs=(), updates=()):
+    """Declare a stage. cmd is run with the shell from the repo root; inputs may be globs."""
+    return {'name': name, 'cmd': cmd, 'inputs': list(inputs), 'outputs': list(outputs), 'updates': list(updates)}
+
+
+def linearize(name, infilename, prefix, with_blanks=False):
+    # "--with_blanks" inserts blank lines when the input can't be parsed
+    # to make sure line numbers don't change (useful for comparison with parser)
+    return stage(name,
+                 'python preprocessing.py {}{} {}'.format('--with_blanks ' if with_blanks else '', infilename, prefix),
+                 inputs=LINEARIZE_INPUTS + [infilename], outputs=parallel_files(prefix))
+
+
+def remove_overlap(name, unfiltered_prefix, prefix, blacklist_filename):
+    # remove_overlap.py blanks lines in place, so it runs on fresh copies of the linearized files;
+    # otherwise a rerun would start from files that were already filtered
+    copies = ' && '.join('cp {} {}'.format(unfiltered, filtered)
+                         for unfiltered, filtered in zip(parallel_files(unfiltered_prefix), parallel_files(prefix)))
+    return stage(name,
+                 '{} && python scripts/remove_overlap.py --train_files {}-tgt.txt '
+                 '--test_files data/dev/dev-tgt.txt data/test/test-tgt.txt --blacklist_file {}'.format(
+                     copies, prefix, blacklist_filename),
+                 inputs=['scripts/remove_overlap.py', 'fileio.py', 'data/dev/dev-tgt.txt', 'data/test/test-tgt.txt']
+                 + parallel_files(unfiltered_prefix),
+                 outputs=[blacklist_filename] + parallel_files(prefix))
+
+
+PREP_PIPELINE = [
+    # Create dev set of only wsj examples (since these most closely match the silver domain)
+    stage('dev_wsj', 'cat data_penman/dev/wsj*.txt > data_penman/dev_wsj.txt',
+          inputs=['data_penman/dev/wsj*.txt'], outputs=['data_penman/dev_wsj.txt']),
+    stage('test_wsj', 'cat data_penman/test/wsj*.txt > data_penman/test_wsj.txt',
+          inputs=['data_penman/test/wsj*.txt'], outputs=['data_penman/test_wsj.txt']),
+    # Linearize train, dev, test data
+    linearize('linearize_train', 'data_penman/train.txt', 'data/train/unfiltered/train'),
+    linearize('linearize_dev', 'data_penman/dev.txt', 'data/dev/dev', with_blanks=True),
+    linearize('linearize_test', 'data_penman/test.txt', 'data/test/test', with_blanks=True),
+    linearize('linearize_dev_wsj', 'data_penman/dev_wsj.txt', 'data_wsj/dev/dev', with_blanks=True),
+    linearize('linearize_test_wsj', 'data_penman/test_wsj.txt', 'data_wsj/test/test', with_blanks=True),
+    linearize('linearize_gw', 'data_gw/parsed.txt', 'data_gw/train/unfiltered/train'),
+    # Overwrite lines in gold and silver training data that overlap with dev set, to avoid
+    # leaking answers to the model. (See scripts/prep.sh)
+    remove_overlap('remove_overlap_train', 'data/train/unfiltered/train', 'data/train/train', 'data/blacklist.txt'),
+    remove_overlap('remove_overlap_gw', 'data_gw/train/unfiltered/train', 'data_gw/train/train',
+                   'data/blacklist_gw.txt'),
+    # Create file mapping anonymization tokens to most common surface form, computed across one
+    # copy of gold + one copy of silver data. (Used by eval.sh during de-anonymization.)
+    stage('replacements',
+          'python replacements.py --infiles data/train/train-anon.txt data_gw/train/train-anon.txt '
+          '--outfile data/anon-replacements.json',
+          inputs=['replacements.py', 'data/train/train-anon.txt', 'data_gw/train/train-anon.txt'],
+          outputs=['data/anon-replacements.json']),
+    # New opennmt files cannot be created unless old ones are removed first
+    stage('clear_opennmt', 'rm -f data/opennmt.* data_gw/opennmt.*',
+          inputs=parallel_files('data/train/train') + parallel_files('data_gw/train/train')),
+]
+
+
+def expand_inputs(patterns):
+    filenames = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            filenames.extend(sorted(glob.glob(pattern)))
+        else:
+            filenames.append(pattern)
+    return filenames
+
+
+class FileHasher(object):
+    """Content hashes of files, cached by (size, mtime) across runs."""
+    def __init__(self, cache=None):
+        self.cache = cache if cache is not None else {}
+
+    def hash(self, filename):
+        """sha1 of the file's content, or None if it doesn't exist."""
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return None
+        key = [st.st_size, st.st_mtime_ns]
+        cached = self.cache.get(filename)
+        if cached and cached['key'] == key:
+            return cached['sha1']
+        sha1 = hashlib.sha1()
+        with open(filename, 'rb') as infile:
+            for chunk in iter(lambda: infile.read(HASH_CHUNK_SIZE), b''):
+                sha1.update(chunk)
+        self.cache[filename] = {'key': key, 'sha1': sha1.hexdigest()}
+        return sha1.hexdigest()
+
+    def hash_all(self, filenames):
+        return {filename: self.hash(filename) for filename in filenames}
+
+
+def load_state(state_filename):
+    if not os.path.exists(state_filename):
+        return {'stages': {}, 'hashes': {}}
+    with open(state_filename) as infile:
+        return json.load(infile)
+
+
+def save_state(state_filename, state):
+    """Write state to a temp file and rename it so a crash never leaves it half-written."""
+    with open(state_filename + '.tmp', 'w') as outfile:
+        json.dump(state, outfile, indent=4, sort_keys=True)
+    os.replace(state_filename + '.tmp', state_filename)
+
+
+def get_dependencies(stages):
+    """Map each stage name to the names of earlier stages that write a file it reads or writes."""
+    dependencies = {}
+    writers = {}  # filename -> name of last stage to write it
+    for s in stages:
+        deps = set()
+        for filename in s['inputs'] + s['updates'] + s['outputs']:
+            if filename in writers:
+                deps.add(writers[filename])
+        for pattern in s['inputs']:
+            if glob.has_magic(pattern):
+                deps.update(writer for filename, writer in writers.items() if fnmatch.fnmatch(filename, pattern))
+        dependencies[s['name']] = deps
+        for filename in s['outputs'] + s['updates']:
+            writers[filename] = s['name']
+    return dependencies
+
+
+def is_up_to_date(s, record, hasher):
+    """True if stage s last ran with the same command and none of its files have changed since."""
+    if record is None or record['cmd'] != s['cmd']:
+        return False
+    if any(not os.path.exists(filename) for filename in s['outputs']):
+        return False
+    return (hasher.hash_all(expand_inputs(s['inputs'])) == record['inputs']
+            and hasher.hash_all(s['updates']) == record['updates'])
+
+
+def run_stage(s):
+    """Run a stage's command. Returns tuple of (returncode, start_time, end_time)."""
+    for filename in s['outputs'] + s['updates']:
+        dirname = os.path.dirname(filename)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname, exist_ok=True)
+    start_time = time.time()
+    returncode = subprocess.call(s['cmd'], shell=True)
+    return returncode, start_time, time.time()
+
+
+def run_pipeline(stages, state_filename, jobs=1, force=False, dry_run=False):
+    """Run stages in dependency order, skipping those that are up to date.
+
+    Returns dict mapping stage name to a result dict with status (ran, skipped, failed, or
+    blocked if a dependency failed), start and end times relative to the start of the run.
+
+    """
+    state = load_state(state_filename)
+    hasher = FileHasher(state['hashes'])
+    dependencies = get_dependencies(stages)
+    by_name = {s['name']: s for s in stages}
+    results = {}
+    pending = [s['name'] for s in stages]
+    running = {}
+    run_start = time.time()
+    pool = ThreadPoolExecutor(max_workers=jobs)
+
+    def finish(name, status, start, end):
+        results[name] = {'status': status, 'start': start - run_start, 'end': end - run_start}
+
+    while pending or running:
+        # start every pending stage whose dependencies are done
+        for name in list(pending):
+            deps = dependencies[name]
+            if any(results.get(dep, {}).get('status') in ('failed', 'blocked') for dep in deps):
+                pending.remove(name)
+                now = time.time()
+                finish(name, 'blocked', now, now)
+                sys.stderr.write('[{}] blocked by a failed dependency\n'.format(name))
+                continue
+            if not all(dep in results for dep in deps):
+                continue
+            pending.remove(name)
+            s = by_name[name]
+            now = time.time()
+            # in a dry run, a stage's inputs aren't regenerated, so it can't tell it's out of date
+            would_rerun = any(results[dep]['status'] == 'would run' for dep in deps)
+            if not force and not would_rerun and is_up_to_date(s, state['stages'].get(name), hasher):
+                finish(name, 'skipped', now, now)
+                sys.stderr.write('[{}] up to date, skipping\n'.format(name))
+                continue
+            if dry_run:
+                finish(name, 'would run', now, now)
+                sys.stderr.write('[{}] would run: {}\n'.format(name, s['cmd']))
+                continue
+            sys.stderr.write('[{}] running: {}\n'.format(name, s['cmd']))
+            # inputs are hashed before running so changes made while the stage runs are noticed next time
+            input_hashes = hasher.hash_all(expand_inputs(s['inputs']))
+            running[pool.submit(run_stage, s)] = (name, input_hashes)
+        if not running:
+            continue
+        done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+        for future in done:
+            name, input_hashes = running.pop(future)
+            returncode, start, end = future.result()
+            seconds = end - start
+            if returncode != 0:
+                finish(name, 'failed', start, end)
+                sys.stderr.write('[{}] failed with status {}\n'.format(name, returncode))
+                state['stages'].pop(name, None)
+            else:
+                finish(name, 'ran', start, end)
+                sys.stderr.write('[{}] done in {:.1f}s\n'.format(name, seconds))
+                state['stages'][name] = {
+                    'cmd': by_name[name]['cmd'],
+                    'inputs': input_hashes,
+                    'updates': hasher.hash_all(by_name[name]['updates']),
+                    'seconds': seconds,
+                }
+            if not dry_run:
+                save_state(state_filename, state)
+    pool.shutdown()
+    if not dry_run:
+        save_state(state_filename, state)
+    return results
+
+
+def critical_path(stages, results):
+    """Chain of dependent stages with the longest total run time. Returns (names, seconds)."""
+    dependencies = get_dependencies(stages)
+    longest = {}  # name -> (seconds, path) of longest chain ending with this stage
+    for s in stages:  # stages are declared in dependency order
+        name = s['name']
+        r = results[name]
+        seconds = r['end'] - r['start']
+        best = max((longest[dep] for dep in dependencies[name]), key=lambda x: x[0], default=(0.0, []))
+        longest[name] = (best[0] + seconds, best[1] + [name])
+    seconds, path = max(longest.values(), key=lambda x: x[0])
+    return path, seconds
+
+
+def print_summary(stages, results):
+    print('{:<22} {:<10} {:>9} {:>9} {:>9}'.format('stage', 'status', 'start', 'end', 'seconds'))
+    for s in stages:
+        r = results[s['name']]
+        print('{:<22} {:<10} {:>9.1f} {:>9.1f} {:>9.1f}'.format(
+            s['name'], r['status'], r['start'], r['end'], r['end'] - r['start']))
+    path, seconds = critical_path(stages, results)
+    total = max(r['end'] for r in results.values())
+    work = sum(r['end'] - r['start'] for r in results.values())
+    print('Wall time {:.1f}s for {:.1f}s of stage time. Critical path {:.1f}s: {}'.format(
+        total, work, seconds, ' -> '.join(path)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='Number of stages to run at once')
+    parser.add_argument('--state', default='data/pipeline-state.json',
+                        help='Content hashes of each stage\'s files from its last run are stored here')
+    parser.add_argument('--force', action='store_true', help='Run every stage, even if it is up to date')
+    parser.add_argument('--dry_run', action='store_true', help='Only show which stages would run')
+    args = parser.parse_args()
+    state_dir = os.path.dirname(args.state)
+    if state_dir and not os.path.exists(state_dir):
+        os.makedirs(state_dir)
+    results = run_pipeline(PREP_PIPELINE, args.state, jobs=args.jobs, force=args.force, dry_run=args.dry_run)
+    print_summary(PREP_PIPELINE, results)
+    sys.exit(1 if any(r['status'] in ('failed', 'blocked') for r in results.values()) else 0)
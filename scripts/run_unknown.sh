@@ -18,10 +18,8 @@ preprocess_include_all_unknowns() {
     # (In reality, if the surface form is "cat" we replace it with "UNKcat" to
     # make it easier to track parser-unknowns in final output, but the effect
     # on the model is the same since there is a unique token for each word.)
+    # (parallel files were created by scripts/unknowns/prep_all_variants.sh)
     DATA_DIR=data_unk_include
-    mkdir -p $DATA_DIR
-
-    sh scripts/unknowns/prep_include_all_unknowns.sh $DATA_DIR
 
     # preprocess data files
     rm $DATA_DIR/opennmt.*
@@ -43,10 +41,8 @@ preprocess_anonymize_all_unknowns() {
     # generic tokens like UNK0, UNK1. For a given sentence, the surface form
     # associated with the generic token will be remembered and copied back into
     # place during post-processing.
+    # (parallel files were created by scripts/unknowns/prep_all_variants.sh)
     DATA_DIR=data_unk_all
-    mkdir -p $DATA_DIR
-
-    sh scripts/unknowns/prep_anonymize_all_unknowns.sh $DATA_DIR
 
     # preprocess data files
     rm $DATA_DIR/opennmt.*
@@ -71,10 +67,8 @@ preprocess_anonymize_rare_unknowns() {
     #   Occurrences of these tokens in the generated text will be replaced
     #   with the original surface form during post-processing (pointing the
     #   unknown words)
+    # (parallel files were created by scripts/unknowns/prep_all_variants.sh)
     DATA_DIR=data_unk_rare
-    mkdir -p $DATA_DIR
-
-    sh scripts/unknowns/prep_anonymize_rare_unknowns.sh $DATA_DIR
 
     # preprocess data files
     rm $DATA_DIR/opennmt.*
@@ -149,7 +143,8 @@ run_data_checks() {
     cat data_unk_include/dev-tgt.txt | tr ' ' '\n' | grep -P "_UNK\d" | sort | uniq -c | sort -n
 }
 
-# preprocess data for all experiments
+# preprocess data for all experiments (decoding the Penman graphs only once)
+sh scripts/unknowns/prep_all_variants.sh data_unk
 preprocess_include_all_unknowns
 preprocess_anonymize_all_unknowns
 preprocess_anonymize_rare_unknowns
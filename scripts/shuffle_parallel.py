@@ -0,0 +1,240 @@
+"""
+Shuffle or sample the four parallel files of a prefix together, without loading them into memory.
+
+Both modes keep -src, -tgt, -anon and -orig aligned, and give the same output for the same
+--seed no matter how much memory they're given.
+
+shuffle: gives every line a random key, sorts chunks of lines that fit in --memory_mb by key,
+writes each sorted chunk to a temporary file, and then merges the chunks into the output files.
+At most MAX_MERGE_RUNS chunk files are open at once: if there are more, groups of them are first
+merged into larger chunk files, in as many passes as needed.
+
+sample: picks --num_samples lines without replacement in one pass after counting line lengths.
+With --bucket_width, lines are grouped by the number of -src tokens (0-9, 10-19, ... for a width
+of 10) and each group gets its share of the sample, either in proportion to its size in the
+input or, with --reference_prefix, in proportion to its size in another corpus (e.g., to draw
+silver data with the same source lengths as the gold data). The sample is in input order
+unless --shuffle is also given.
+
+Compressed (.gz or .zst) parallel files are found by prefix, and the output files are
+compressed the same way.
+
+Usage:
+> python scripts/shuffle_parallel.py shuffle --prefix data_gw/train/train \
+    --out_prefix data_gw/shuffled/train --seed 1 --memory_mb 2000
+> python scripts/shuffle_parallel.py sample --prefix data_gw/train/train \
+    --out_prefix data_v17/silver --num_samples 60000 --bucket_width 10 \
+    --reference_prefix data/train/train --seed 1
+
+"""
+
+from collections import Counter
+import argparse
+import heapq
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import fileio
+import preprocessing
+
+# rough per-line cost of holding a record (four str objects and a tuple) in memory, on top of its text
+RECORD_OVERHEAD_BYTES = 300
+# most sorted chunk files merged (and so held open) at once
+MAX_MERGE_RUNS = 256
+
+
+def _write_run(run_filename, keyed_records):
+    with open(run_filename, 'w', encoding='utf8') as outfile:
+        for key, index, record in keyed_records:
+            outfile.write('{} {}\n'.format(key, index))
+            for line in record:
+                outfile.write(line)
+
+
+def _read_run(run_filename):
+    with open(run_filename, encoding='utf8') as infile:
+        while True:
+            header = infile.readline()
+            if not header:
+                break
+            key, index = header.split()
+            yield int(key), int(index), tuple(infile.readline() for _ in range(4))
+
+
+def _merge_run_files(run_filenames, run_dir, max_runs):
+    """Merge groups of up to max_runs run files into new run files until at most max_runs are left.
+
+    Returns the filenames of the remaining runs. Merged files are deleted as soon as they're read.
+
+    """
+    num_merged = 0
+    while len(run_filenames) > max_runs:
+        sys.stderr.write('Merging {} chunks in groups of {}.\n'.format(len(run_filenames), max_runs))
+        merged_filenames = []
+        for i in range(0, len(run_filenames), max_runs):
+            group = run_filenames[i:i + max_runs]
+            if len(group) == 1:
+                merged_filenames.append(group[0])
+                continue
+            merged_filenames.append(os.path.join(run_dir, 'merged{:05d}.txt'.format(num_merged)))
+            num_merged += 1
+            _write_run(merged_filenames[-1], heapq.merge(*[_read_run(run_filename) for run_filename in group]))
+            for run_filename in group:
+                os.remove(run_filename)
+        run_filenames = merged_filenames
+    return run_filenames
+
+
+def shuffle_records(records, rng, memory_bytes, tmpdir=None):
+    """Generate records in random order, sorting chunks of at most memory_bytes on disk.
+
+    Each record's key comes from rng in input order (ties broken by position), so the order
+    depends only on the rng's seed, not on memory_bytes.
+
+    """
+    buffer = []
+    buffer_bytes = 0
+    run_filenames = []
+    run_dir = tempfile.mkdtemp(prefix='shuffle-', dir=tmpdir)
+    try:
+        for index, record in enumerate(records):
+            buffer.append((rng.getrandbits(63), index, record))
+            buffer_bytes += sum(len(line) for line in record) + RECORD_OVERHEAD_BYTES
+            if buffer_bytes >= memory_bytes:
+                buffer.sort()
+                run_filenames.append(os.path.join(run_dir, 'run{:05d}.txt'.format(len(run_filenames))))
+                _write_run(run_filenames[-1], buffer)
+                buffer = []
+                buffer_bytes = 0
+        buffer.sort()
+        if not run_filenames:  # everything fit in memory
+            for _, _, record in buffer:
+                yield record
+            return
+        sys.stderr.write('Sorted {} chunks on disk in {}. Merging.\n'.format(len(run_filenames) + 1, run_dir))
+        # the last chunk stays in memory, so it doesn't count against the open files
+        run_filenames = _merge_run_files(run_filenames, run_dir, MAX_MERGE_RUNS)
+        runs = [_read_run(run_filename) for run_filename in run_filenames] + [iter(buffer)]
+        for _, _, record in heapq.merge(*runs):
+            yield record
+    finally:
+        shutil.rmtree(run_dir)
+
+
+def get_stratum(src_line, bucket_width):
+    return len(src_line.split()) // bucket_width if bucket_width else 0
+
+
+def count_strata(prefix, bucket_width):
+    """Counter of number of lines in each source length stratum."""
+    counts = Counter()
+    with fileio.open_file(preprocessing.find_parallel_files(prefix)[0], encoding='utf8') as infile:
+        for line in infile:
+            counts[get_stratum(line, bucket_width)] += 1
+    return counts
+
+
+def allocate_samples(num_samples, stratum_counts, target_counts=None):
+    """Number of lines to sample from each stratum.
+
+    Strata get shares of num_samples in proportion to target_counts (default: stratum_counts),
+    rounded by largest remainder so they add up to num_samples, but never more lines than the
+    stratum has.
+
+    """
+    target_counts = target_counts or stratum_counts
+    total = float(sum(target_counts[s] for s in stratum_counts))
+    if not total:
+        raise ValueError('No reference lines have the source lengths of the input')
+    shares = {s: num_samples * target_counts[s] / total for s in stratum_counts}
+    quotas = {s: int(share) for s, share in shares.items()}
+    by_remainder = sorted(shares, key=lambda s: (quotas[s] - shares[s], s))
+    for s in by_remainder[:num_samples - sum(quotas.values())]:
+        quotas[s] += 1
+    return {s: min(quota, stratum_counts[s]) for s, quota in quotas.items()}
+
+
+def sample_records(records, quotas, stratum_counts, bucket_width, rng):
+    """Select quotas[s] of the stratum_counts[s] records in each stratum, uniformly, in one pass.
+
+    Uses selection sampling: a record is kept with probability (number still needed from its
+    stratum) / (number of its stratum's records not yet seen).
+
+    """
+    needed = dict(quotas)
+    remaining = dict(stratum_counts)
+    for record in records:
+        s = get_stratum(record[0], bucket_width)
+        if rng.random() * remaining[s] < needed[s]:
+            needed[s] -= 1
+            yield record
+        remaining[s] -= 1
+
+
+def shuffle(prefix, out_prefix, seed=1, memory_mb=1000, tmpdir=None):
+    """Write the lines of the parallel files at prefix, in random order, to out_prefix."""
+    rng = random.Random(seed)
+    compression = fileio.get_compression(preprocessing.find_parallel_files(prefix)[0])
+    records = shuffle_records(preprocessing.read_parallel_lines(prefix), rng, memory_mb * 1000000, tmpdir=tmpdir)
+    num_written = preprocessing.write_parallel_lines(records, out_prefix, compression)
+    sys.stderr.write('Wrote {} shuffled lines to {}\n'.format(
+        num_written, ', '.join(preprocessing.get_parallel_filenames(out_prefix, compression))))
+
+
+def sample(prefix, out_prefix, num_samples, seed=1, bucket_width=0, reference_prefix=None, shuffle_sample=False,
+           memory_mb=1000, tmpdir=None):
+    """Write num_samples lines of the parallel files at prefix to out_prefix. (See module docstring.)"""
+    rng = random.Random(seed)
+    stratum_counts = count_strata(prefix, bucket_width)
+    target_counts = count_strata(reference_prefix, bucket_width) if reference_prefix else None
+    if num_samples > sum(stratum_counts.values()):
+        raise ValueError('Cannot sample {} lines from {} lines'.format(num_samples, sum(stratum_counts.values())))
+    quotas = allocate_samples(num_samples, stratum_counts, target_counts)
+    if bucket_width:
+        for s in sorted(quotas):
+            sys.stderr.write('Source length {}-{}: sampling {} of {} lines\n'.format(
+                s * bucket_width, (s + 1) * bucket_width - 1, quotas[s], stratum_counts[s]))
+    records = sample_records(preprocessing.read_parallel_lines(prefix), quotas, stratum_counts, bucket_width, rng)
+    if shuffle_sample:
+        records = shuffle_records(records, rng, memory_mb * 1000000, tmpdir=tmpdir)
+    compression = fileio.get_compression(preprocessing.find_parallel_files(prefix)[0])
+    num_written = preprocessing.write_parallel_lines(records, out_prefix, compression)
+    if num_written < num_samples:
+        sys.stderr.write('WARNING: only {} lines fit the reference length distribution\n'.format(num_written))
+    sys.stderr.write('Wrote {} sampled lines to {}\n'.format(
+        num_written, ', '.join(preprocessing.get_parallel_filenames(out_prefix, compression))))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('mode', choices=['shuffle', 'sample'])
+    parser.add_argument('--prefix', required=True, help='Prefix of parallel files created by preprocessing.py')
+    parser.add_argument('--out_prefix', required=True, help='Output files will be named using this prefix')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--memory_mb', type=int, default=1000,
+                        help='Approximate memory used for lines waiting to be sorted (shuffle, or sample --shuffle)')
+    parser.add_argument('--tmpdir', help='Where sorted chunks are written (default: system temp dir)')
+    parser.add_argument('--num_samples', type=int, help='sample: number of lines to sample')
+    parser.add_argument('--bucket_width', type=int, default=0,
+                        help='sample: stratify by number of source tokens in buckets of this width (default: '
+                             'don\'t stratify)')
+    parser.add_argument('--reference_prefix',
+                        help='sample: match the source length distribution of these parallel files instead of '
+                             'the input\'s (needs --bucket_width)')
+    parser.add_argument('--shuffle', action='store_true', help='sample: shuffle the sampled lines')
+    args = parser.parse_args()
+    if args.mode == 'shuffle':
+        shuffle(args.prefix, args.out_prefix, seed=args.seed, memory_mb=args.memory_mb, tmpdir=args.tmpdir)
+    else:
+        if args.num_samples is None:
+            parser.error('sample needs --num_samples')
+        if args.reference_prefix and not args.bucket_width:
+            parser.error('--reference_prefix needs --bucket_width')
+        sample(args.prefix, args.out_prefix, args.num_samples, seed=args.seed, bucket_width=args.bucket_width,
+               reference_prefix=args.reference_prefix, shuffle_sample=args.shuffle, memory_mb=args.memory_mb,
+               tmpdir=args.tmpdir)
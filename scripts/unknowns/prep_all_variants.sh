@@ -0,0 +1,27 @@
+###
+# Preprocessing script that creates the data for every unknown-handling experiment
+# (include all, anonymize all, and anonymize rare unknowns) from a single preprocessing
+# pass. Output matches running each of the other prep_*.sh scripts with
+# OUTDIR={prefix}_include, {prefix}_all and {prefix}_rare. The plain preprocessing output
+# (same as prep_ignore_unknowns.sh) is left in {prefix}_ignore.
+###
+
+PREFIX=$1
+
+# Linearize train and dev data once, then write each variant's parallel files together
+python unknown_variants.py \
+    --datasets train:data_penman/train.txt dev:data_penman/dev.txt \
+    --outdir_prefix $PREFIX --variants include all rare
+
+for OUTDIR in ${PREFIX}_include ${PREFIX}_all ${PREFIX}_rare; do
+    # Overwrite lines in training data that overlap with dev set
+    python scripts/remove_overlap.py \
+        --train_files $OUTDIR/train-tgt.txt \
+        --test_files $OUTDIR/dev-tgt.txt \
+        --blacklist_file $OUTDIR/blacklist.txt
+
+    # Create file mapping anonymization tokens to most common surface form
+    python replacements.py \
+        --infiles $OUTDIR/train-anon.txt \
+        --outfile $OUTDIR/anon-replacements.json
+done
@@ -0,0 +1,483 @@
+"""
+Serve DMRS-to-text generation one graph at a time, over HTTP or stdin/stdout.
+
+Each request is a single Penman-serialized DMRS graph (in the same format as the graphs read by
+preprocessing.py). The graph is preprocessed exactly as for training (see preprocess_penman),
+translated, and de-anonymized and detokenized as in postprocessing.py, so the response is the
+final sentence.
+
+Requests that arrive close together are gathered into micro-batches before being handed to the
+translator: a batch is sent as soon as it has --max_batch_size graphs or the oldest graph in it
+has waited --max_wait_ms. Any object with a translate(src_lines) method that returns one list of
+tokens per line can be used as the translator. Three are provided:
+* stub: deterministic, model-free output (predicate lemmas and placeholders in graph order),
+  for checking the service end to end
+* worker: feeds each batch to one long-running worker process (such as scripts/onmt_worker.py),
+  so the model is loaded once
+* command: writes each batch to a temp file and runs a command such as OpenNMT's translate.py.
+  The model is reloaded for every batch, which takes seconds, so only use it for testing a
+  translate command or when requests are rare
+
+Usage:
+> python serve.py --port 8000 --replacements_map data/anon-replacements.json --translator worker \
+    --worker_cmd "python scripts/onmt_worker.py -model models/model.pt -replace_unk -gpu 0"
+> curl -s localhost:8000/generate -d '{"penman": "(10002 / _sleep_v_1 :lnk \"<4:10>\" ...)"}'
+> curl -s localhost:8000/metrics
+
+Read graphs (separated by blank lines) from stdin and write one sentence per line to stdout:
+> python serve.py --stdio --translator stub < data/sample/sample.txt
+
+"""
+
+from collections import deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import argparse
+import json
+import os
+import queue
+import re
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from generate import percentile
+import postprocessing
+import preprocessing
+
+# Translator fails on blank lines (see scripts/eval.sh)
+BLANK = 'BLANK￨_'
+# number of recent requests kept for latency percentiles
+METRICS_WINDOW = 10000
+# how long a translation worker gets to exit after its stdin is closed
+WORKER_EXIT_SECONDS = 5
+# the batcher's feature encoder is replaced once it caches more values than this (see MicroBatcher)
+MAX_ENCODER_SIZE = 1000000
+
+
+class StubTranslator(object):
+    """Deterministic stand-in for a trained model.
+
+    "Translates" a linearized graph into the lemmas of its predicates and its placeholder
+    tokens, in graph order. Output only depends on the input line, never on batching.
+
+    """
+    def translate(self, src_lines):
+        return [self._translate_line(line) for line in src_lines]
+
+    def _translate_line(self, line):
+        tokens = []
+        for token in line.split():
+            pred = token.split('￨')[0]
+            if re.match(r'^[A-Za-z]+\d+$', pred):
+                # placeholder like named0 or UNKfoo0, copied so it can be de-anonymized
+                tokens.append(pred)
+            elif pred.startswith('_') and not pred.endswith('_q'):
+                tokens.append(pred.split('_')[1])
+        return tokens
+
+
+class WorkerTranslator(object):
+    """Translate batches with one long-running worker process, so the model is only loaded once.
+
+    worker_cmd is started on the first batch and kept running. Each batch's linearized graphs
+    are written to its stdin, one per line, followed by an empty line; it must write exactly one
+    tokenized line per graph to stdout (anything else goes to stderr) and flush. If the worker
+    exits, it's started again for the next batch. scripts/onmt_worker.py is such a worker for
+    OpenNMT-py models. Not thread-safe, but MicroBatcher only translates from one thread.
+
+    """
+    def __init__(self, worker_cmd):
+        self.worker_cmd = worker_cmd
+        self.process = None
+
+    def translate(self, src_lines):
+        if self.process is None or self.process.poll() is not None:
+            self.process = subprocess.Popen(shlex.split(self.worker_cmd), stdin=subprocess.PIPE,
+                                            stdout=subprocess.PIPE)
+        try:
+            self.process.stdin.write(''.join('{}\n'.format(line or BLANK) for line in src_lines).encode('utf8'))
+            self.process.stdin.write(b'\n')
+            self.process.stdin.flush()
+            predictions = []
+            for _ in src_lines:
+                line = self.process.stdout.readline()
+                if not line:
+                    raise RuntimeError('Translation worker exited after {} lines of a batch of {}'.format(
+                        len(predictions), len(src_lines)))
+                predictions.append(line.decode('utf8').strip().split())
+        except (OSError, RuntimeError):
+            self.close()  # out of step with the batch, so start over
+            raise
+        return predictions
+
+    def close(self):
+        """Stop the worker. It should exit when its stdin is closed, or it's killed after a while."""
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass  # already exited
+        try:
+            self.process.wait(timeout=WORKER_EXIT_SECONDS)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.process.stdout.close()
+        self.process = None
+
+
+class CommandTranslator(object):
+    """Translate each batch by running a command on it.
+
+    translate_cmd is a template where {src} is replaced with a file holding the batch's
+    linearized graphs, one per line, and {output} with the file where predictions, one
+    tokenized line per source line, should be written.
+
+    The command is started for every batch, so a model is loaded (and a GPU initialized) every
+    time, which takes far longer than translating a micro-batch, and latency metrics mostly
+    measure that startup. Use WorkerTranslator to keep one model loaded.
+
+    """
+    def __init__(self, translate_cmd):
+        self.translate_cmd = translate_cmd
+
+    def translate(self, src_lines):
+        workdir = tempfile.mkdtemp(prefix='dmrs-serve-')
+        src_filename = os.path.join(workdir, 'src.txt')
+        pred_filename = os.path.join(workdir, 'pred.txt')
+        try:
+            with open(src_filename, 'w') as outfile:
+                for line in src_lines:
+                    outfile.write('{}\n'.format(line or BLANK))
+            cmd = shlex.split(self.translate_cmd.format(
+                src=shlex.quote(src_filename), output=shlex.quote(pred_filename)))
+            subprocess.check_call(cmd, stdout=sys.stderr)
+            with open(pred_filename) as infile:
+                predictions = [line.strip().split() for line in infile]
+        finally:
+            for filename in (src_filename, pred_filename):
+                if os.path.exists(filename):
+                    os.remove(filename)
+            os.rmdir(workdir)
+        if len(predictions) != len(src_lines):
+            raise RuntimeError('Translator returned {} lines for a batch of {}'.format(
+                len(predictions), len(src_lines)))
+        return predictions
+
+
+class Request(object):
+    """One graph waiting to be generated. Call wait() to get the result dict."""
+    def __init__(self, penman_serialized):
+        self.penman_serialized = penman_serialized
+        self.enqueued = time.perf_counter()
+        self.result = None
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise RuntimeError('Timed out waiting for generation')
+        return self.result
+
+
+class Metrics(object):
+    """Counts and recent latencies of served requests and batches. Thread-safe."""
+    def __init__(self, window=METRICS_WINDOW):
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.num_requests = 0
+        self.num_failed = 0
+        self.num_batches = 0
+        self.latencies = deque(maxlen=window)
+        self.queue_waits = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.queue_depths = deque(maxlen=window)
+        self.batch_seconds = deque(maxlen=window)
+
+    def add_batch(self, requests, queue_depth, seconds):
+        with self.lock:
+            self.num_batches += 1
+            self.batch_sizes.append(len(requests))
+            self.queue_depths.append(queue_depth)
+            self.batch_seconds.append(seconds)
+            for request in requests:
+                self.num_requests += 1
+                self.num_failed += 0 if request.result['ok'] else 1
+                self.latencies.append(request.result['seconds'])
+                self.queue_waits.append(request.result['queue_seconds'])
+
+    def to_dict(self, current_queue_depth=0):
+        with self.lock:
+            return {
+                'uptime_seconds': time.time() - self.start_time,
+                'requests': self.num_requests,
+                'failed': self.num_failed,
+                'batches': self.num_batches,
+                'queue_depth': current_queue_depth,
+                'latency': self._summarize(self.latencies),
+                'queue_wait': self._summarize(self.queue_waits),
+                'batch_seconds': self._summarize(self.batch_seconds),
+                'batch_size': self._summarize(self.batch_sizes),
+                'queue_depth_at_batch': self._summarize(self.queue_depths),
+            }
+
+    @staticmethod
+    def _summarize(values):
+        values = sorted(values)
+        return {
+            'mean': sum(values) / float(len(values)) if values else None,
+            'p50': percentile(values, 50),
+            'p95': percentile(values, 95),
+            'p99': percentile(values, 99),
+            'max': values[-1] if values else None,
+        }
+
+
+class MicroBatcher(object):
+    """Gathers submitted graphs into batches and runs them through a single worker thread.
+
+    Graphs are preprocessed with the batcher's own Preprocessor rather than the module-level
+    codec and feature encoder. The encoder caches every predicate and attribute bundle it sees
+    and never evicts, so in a long-running service it grows with every unknown word; once it
+    holds more than max_encoder_size values it is replaced with an empty one before the next
+    batch. Only the worker thread uses it, so that's safe, and the output doesn't change: the
+    tradeoff is that bundles and labels are rebuilt, a little more slowly, until it's warm again.
+
+    Usage:
+    > batcher = MicroBatcher(StubTranslator(), rmap={})
+    > batcher.start()
+    > result = batcher.submit(penman_serialized).wait()
+
+    """
+    def __init__(self, translator, rmap, max_batch_size=32, max_wait=0.01, max_encoder_size=MAX_ENCODER_SIZE):
+        self.translator = translator
+        self.rmap = rmap
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_encoder_size = max_encoder_size
+        self.preprocessor = preprocessing.Preprocessor()
+        self.queue = queue.Queue()
+        self.metrics = Metrics()
+        self.thread = threading.Thread(target=self._run, name='micro-batcher')
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def submit(self, penman_serialized):
+        request = Request(penman_serialized)
+        self.queue.put(request)
+        return request
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = batch[0].enqueued + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            queue_depth = self.queue.qsize()
+            start_time = time.perf_counter()
+            try:
+                self.process_batch(batch, start_time)
+            except Exception as e:
+                # translator failed, so fail the whole batch
+                for request in batch:
+                    if request.result is None:
+                        request.result = {'ok': False, 'error': str(e)}
+            finished = time.perf_counter()
+            for request in batch:
+                request.result['queue_seconds'] = start_time - request.enqueued
+                request.result['seconds'] = finished - request.enqueued
+                request.result['batch_size'] = len(batch)
+            self.metrics.add_batch(batch, queue_depth, finished - start_time)
+            for request in batch:
+                request.done.set()
+
+    def process_batch(self, batch, start_time=None):
+        """Preprocess, translate, and postprocess a batch of requests, setting each one's result."""
+        if len(self.preprocessor.encoder) > self.max_encoder_size:
+            self.preprocessor.encoder = preprocessing.FeatureEncoder()
+        src_lines = []
+        anon_maps = []
+        to_translate = []
+        for request in batch:
+            try:
+                linearized, anon_map = preprocessing.preprocess_serialized(
+                    request.penman_serialized, codec=self.preprocessor.codec, encoder=self.preprocessor.encoder)
+            except Exception as e:
+                request.result = {'ok': False, 'error': 'Could not preprocess graph: {}'.format(e)}
+                continue
+            src_lines.append(linearized)
+            anon_maps.append(anon_map)
+            to_translate.append(request)
+        if not to_translate:
+            return
+        predictions = self.translator.translate(src_lines)
+        for request, src, anon_map, tokens in zip(to_translate, src_lines, anon_maps, predictions):
+            repdict = postprocessing.get_replacements(anon_map, self.rmap)
+            request.result = {
+                'ok': True,
+                'text': postprocessing.postprocess_tokens(tokens, repdict),
+                'src': src,
+                'tokens': tokens,
+            }
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # listen backlog; the default of 5 drops bursts of clients
+
+
+def make_handler(batcher, timeout=None):
+    class GenerationHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                self._send(200, batcher.metrics.to_dict(batcher.queue.qsize()))
+            elif self.path == '/health':
+                self._send(200, {'ok': True})
+            else:
+                self._send(404, {'ok': False, 'error': 'Not found'})
+
+        def do_POST(self):
+            if self.path != '/generate':
+                self._send(404, {'ok': False, 'error': 'Not found'})
+                return
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf8')
+            try:
+                penman_serialized = json.loads(body)['penman']
+            except (ValueError, KeyError, TypeError):
+                self._send(400, {'ok': False, 'error': 'Expected JSON body like {"penman": "(...)"}'})
+                return
+            try:
+                result = batcher.submit(penman_serialized).wait(timeout)
+            except RuntimeError as e:
+                self._send(503, {'ok': False, 'error': str(e)})
+                return
+            self._send(200 if result['ok'] else 422, result)
+
+        def _send(self, status, obj):
+            data = json.dumps(obj).encode('utf8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass  # per-request logging is too noisy; see /metrics
+    return GenerationHandler
+
+
+def iter_stdin_graphs(infile):
+    """Yield Penman graphs separated by blank lines, dropping comment lines."""
+    partial = []
+    for line in infile:
+        line = line.strip()
+        if not line:
+            if partial:
+                yield ' '.join(partial)
+                partial = []
+        elif not line.startswith('#'):
+            partial.append(line)
+    if partial:
+        yield ' '.join(partial)
+
+
+def serve_stdio(batcher, infile, outfile):
+    """Generate a sentence for each graph in infile, writing them in input order.
+
+    Failed graphs are written as blank lines. Up to two batches of graphs are kept in flight
+    so the batcher always has a full batch to work on.
+
+    """
+    pending = deque()
+    for penman_serialized in iter_stdin_graphs(infile):
+        pending.append(batcher.submit(penman_serialized))
+        if len(pending) >= 2 * batcher.max_batch_size:
+            _write_result(pending.popleft().wait(), outfile)
+    while pending:
+        _write_result(pending.popleft().wait(), outfile)
+
+
+def _write_result(result, outfile):
+    if not result['ok']:
+        sys.stderr.write('{}\n'.format(result['error']))
+    outfile.write('{}\n'.format(result.get('text', '')))
+    outfile.flush()
+
+
+def get_translator(args):
+    if args.translator == 'stub':
+        return StubTranslator()
+    if args.translator == 'worker':
+        if not args.worker_cmd:
+            raise ValueError('--worker_cmd is required with --translator worker')
+        return WorkerTranslator(args.worker_cmd)
+    if not args.translate_cmd:
+        raise ValueError('--translate_cmd is required with --translator command')
+    return CommandTranslator(args.translate_cmd)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--stdio', action='store_true',
+                        help='Read graphs from stdin and write sentences to stdout instead of serving HTTP')
+    parser.add_argument('--translator', choices=['stub', 'worker', 'command'], default='stub')
+    parser.add_argument('--worker_cmd',
+                        help='Command for --translator worker, started once and fed batches over stdin '
+                             '(e.g. "python scripts/onmt_worker.py -model models/model.pt -gpu 0")')
+    parser.add_argument('--translate_cmd',
+                        help='Command template for --translator command; {src} and {output} are replaced '
+                             'with the batch source and prediction filenames. It is run for every batch, '
+                             'so the model is reloaded every time; prefer --translator worker')
+    parser.add_argument('--replacements_map',
+                        help='Predicate->surface form replacements from training data (see replacements.py). '
+                             'If not given, placeholders are replaced with their predicate values.')
+    parser.add_argument('--max_batch_size', type=int, default=32)
+    parser.add_argument('--max_wait_ms', type=float, default=10.0,
+                        help='Longest a graph waits for other graphs to fill its batch')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Seconds before an HTTP request gives up')
+    parser.add_argument('--metrics', help='If given, metrics are written to this JSON file on exit')
+    args = parser.parse_args()
+
+    rmap = postprocessing.load_replacement_map(args.replacements_map) if args.replacements_map else {}
+    translator = get_translator(args)
+    batcher = MicroBatcher(translator, rmap, max_batch_size=args.max_batch_size,
+                           max_wait=args.max_wait_ms / 1000.0).start()
+    try:
+        if args.stdio:
+            serve_stdio(batcher, sys.stdin, sys.stdout)
+        else:
+            server = ThreadingHTTPServer((args.host, args.port), make_handler(batcher, timeout=args.timeout))
+            sys.stderr.write('Serving on http://{}:{}/generate\n'.format(args.host, args.port))
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            server.server_close()
+    finally:
+        if isinstance(translator, WorkerTranslator):
+            translator.close()
+        metrics = batcher.metrics.to_dict(batcher.queue.qsize())
+        sys.stderr.write('Served {requests} graphs ({failed} failed) in {batches} batches\n'.format(**metrics))
+        if args.metrics:
+            with open(args.metrics, 'w') as outfile:
+                json.dump(metrics, outfile, indent=4)
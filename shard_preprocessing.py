@@ -0,0 +1,314 @@
+"""
+Preprocess Penman files in hash-assigned shards, so several machines can share the work.
+
+Each graph goes to shard md5(label) % num_shards, which depends only on the graph's label
+(its comment lines), not on the machine, the number of workers, or the order of the inputs.
+The work is done in three steps:
+
+1. plan: read the input files once, write each shard's graphs (with their positions in the
+   inputs) to {outfile_prefix}-shards/shardNNNNN-input.jsonl, and write a manifest (JSON)
+   listing the inputs, the number of shards and the number of graphs in each.
+2. run: any number of nodes sharing a filesystem process shards into
+   {outfile_prefix}-shards/shardNNNNN-{src,tgt,anon,orig}.txt. A shard reads only its own
+   -input.jsonl file, so the inputs are read once in all, by plan. Each shard also gets an
+   -index.txt file with the position of each of its graphs in the inputs, and a -done.json
+   file once it's complete. Given no --shards, a node claims shards by creating
+   shardNNNNN.lock files, so nodes can be started without dividing up the shards first.
+3. merge: put the shards back together in input order as {outfile_prefix}-*.txt, the same
+   files preprocessing.py would have written, after checking that every shard is done, that
+   the four files of each shard have one line per graph in its index, and that together the
+   shards cover every graph in the inputs exactly once.
+
+The shard input files take about as much space as the inputs (compressed with --compress,
+like the shard and merged files), and can be deleted after the merge.
+
+Shards always keep a blank line for graphs that fail, to stay aligned with their index. The
+merge drops them unless the manifest was planned with --with_blanks.
+
+A lock left by a node that died can be removed by hand, or the shard rerun with --shards.
+
+Usage:
+> python shard_preprocessing.py plan --infiles data_gw/parsed00.txt data_gw/parsed01.txt.gz \
+    --outfile_prefix data_gw/train/train --num_shards 64 --manifest data_gw/train/manifest.json
+> python shard_preprocessing.py run --manifest data_gw/train/manifest.json --jobs 8  # on each node
+> python shard_preprocessing.py merge --manifest data_gw/train/manifest.json
+
+"""
+
+from multiprocessing import Pool
+import argparse
+import hashlib
+import heapq
+import json
+import os
+import sys
+
+import fileio
+import preprocessing
+
+SHARD_SUFFIXES = ['src', 'tgt', 'anon', 'orig']
+PLAN_BUFFER_BYTES = 64 * 1024 * 1024  # graphs held in memory by plan before being appended to shard input files
+
+
+def get_shard(label, num_shards):
+    """Shard a graph with this label belongs to. Stable across runs, machines and Python versions."""
+    return int(hashlib.md5(label.encode('utf8')).hexdigest()[:8], 16) % num_shards
+
+
+def get_shard_dir(outfile_prefix):
+    return outfile_prefix + '-shards'
+
+
+def get_shard_prefix(manifest, shard):
+    return os.path.join(get_shard_dir(manifest['outfile_prefix']), 'shard{:05d}'.format(shard))
+
+
+def get_input_filename(shard_prefix, compression=None):
+    return fileio.with_compression(shard_prefix + '-input.jsonl', compression)
+
+
+def get_index_filename(shard_prefix):
+    return shard_prefix + '-index.txt'
+
+
+def get_done_filename(shard_prefix):
+    return shard_prefix + '-done.json'
+
+
+def get_lock_filename(shard_prefix):
+    return shard_prefix + '.lock'
+
+
+def iter_inputs(infilenames):
+    """Generate (position, label, serialized_graph) for the graphs in all infiles, in order."""
+    position = 0
+    for infilename in infilenames:
+        for label, serialized in preprocessing.iter_serialized_from_file(infilename):
+            yield position, label, serialized
+            position += 1
+
+
+def _append_shard_inputs(manifest, buffers, mode):
+    """Add the buffered lines to each shard's input file (mode 'w' starts the files over). Empties buffers."""
+    for shard, lines in enumerate(buffers):
+        if lines or mode == 'w':
+            filename = get_input_filename(get_shard_prefix(manifest, shard), manifest['compression'])
+            with fileio.open_file(filename, mode, encoding='utf8') as outfile:
+                outfile.writelines(lines)
+            buffers[shard] = []
+
+
+def plan(infilenames, outfile_prefix, num_shards, manifest_filename, output_blank_for_failure=False,
+         compression=None):
+    """Split the graphs into shard input files and write the manifest. Returns the manifest dict.
+
+    Graphs are buffered in memory and appended to the shard input files PLAN_BUFFER_BYTES at a
+    time, so only one file is open at once however many shards there are.
+
+    """
+    manifest = {
+        'infiles': [os.path.abspath(infilename) for infilename in infilenames],
+        'outfile_prefix': os.path.abspath(outfile_prefix),
+        'num_shards': num_shards,
+        'num_graphs': 0,
+        'shard_sizes': [0] * num_shards,
+        'with_blanks': output_blank_for_failure,
+        'compression': compression,
+    }
+    shard_dir = get_shard_dir(manifest['outfile_prefix'])
+    if not os.path.exists(shard_dir):
+        os.makedirs(shard_dir)
+    buffers = [[] for _ in range(num_shards)]
+    buffer_bytes = 0
+    mode = 'w'
+    for position, label, serialized in iter_inputs(infilenames):
+        shard = get_shard(label, num_shards)
+        line = json.dumps([position, label, serialized]) + '\n'
+        buffers[shard].append(line)
+        buffer_bytes += len(line)
+        if buffer_bytes >= PLAN_BUFFER_BYTES:
+            _append_shard_inputs(manifest, buffers, mode)
+            buffer_bytes = 0
+            mode = 'a'
+        manifest['shard_sizes'][shard] += 1
+        manifest['num_graphs'] += 1
+    _append_shard_inputs(manifest, buffers, mode)
+    with open(manifest_filename, 'w') as outfile:
+        json.dump(manifest, outfile, indent=4, sort_keys=True)
+    sys.stderr.write('Planned {} graphs from {} files in {} shards (largest {}, smallest {}). Wrote {}\n'.format(
+        manifest['num_graphs'], len(infilenames), num_shards, max(manifest['shard_sizes']),
+        min(manifest['shard_sizes']), manifest_filename))
+    return manifest
+
+
+def load_manifest(manifest_filename):
+    with open(manifest_filename) as infile:
+        return json.load(infile)
+
+
+def claim_shard(manifest, shard):
+    """Atomically create the shard's lock file. Returns False if another node already has it."""
+    try:
+        fd = os.open(get_lock_filename(get_shard_prefix(manifest, shard)), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except OSError:
+        return False
+    os.write(fd, '{} {}\n'.format(os.uname()[1], os.getpid()).encode('utf8'))
+    os.close(fd)
+    return True
+
+
+def run_shard(manifest, shard):
+    """Preprocess the graphs of one shard. Returns the contents of its done file."""
+    shard_prefix = get_shard_prefix(manifest, shard)
+    positions = []
+
+    def examples():
+        with fileio.open_file(get_input_filename(shard_prefix, manifest['compression']), encoding='utf8') as infile:
+            for line in infile:
+                position, label, serialized = json.loads(line)
+                positions.append(position)
+                yield label, serialized
+
+    num_written, num_skipped = preprocessing.write_parallel_files(
+        examples(), preprocessing.preprocess_serialized, shard_prefix,
+        output_blank_for_failure=True, compression=manifest['compression'])
+    if len(positions) != manifest['shard_sizes'][shard]:
+        raise ValueError('Shard {} has {} graphs but the manifest expects {}. Was it planned again?'.format(
+            shard, len(positions), manifest['shard_sizes'][shard]))
+    with open(get_index_filename(shard_prefix), 'w') as outfile:
+        for position in positions:
+            outfile.write('{}\n'.format(position))
+    done = {'shard': shard, 'graphs': len(positions), 'written': num_written, 'skipped': num_skipped,
+            'host': os.uname()[1]}
+    # written last (and atomically) so a shard only counts as done once all its files are complete
+    done_filename = get_done_filename(shard_prefix)
+    with open(done_filename + '.tmp', 'w') as outfile:
+        json.dump(done, outfile, sort_keys=True)
+    os.replace(done_filename + '.tmp', done_filename)
+    return done
+
+
+def _run_shard_task(task):
+    manifest, shard, claim = task
+    if os.path.exists(get_done_filename(get_shard_prefix(manifest, shard))):
+        return None
+    if claim and not claim_shard(manifest, shard):
+        return None
+    return run_shard(manifest, shard)
+
+
+def run_shards(manifest_filename, shards=None, jobs=1):
+    """Process the given shards, or claim and process unclaimed ones if shards is None.
+
+    Shards that are already done are skipped. Returns the done dicts of the shards processed here.
+
+    """
+    manifest = load_manifest(manifest_filename)
+    claim = shards is None
+    if claim:
+        shards = range(manifest['num_shards'])
+    tasks = [(manifest, shard, claim) for shard in shards]
+    if jobs > 1:
+        pool = Pool(jobs)
+        results = pool.map(_run_shard_task, tasks, chunksize=1)
+        pool.close()
+        pool.join()
+    else:
+        results = [_run_shard_task(task) for task in tasks]
+    done = [result for result in results if result is not None]
+    sys.stderr.write('Processed {} shards ({} graphs) on this node\n'.format(
+        len(done), sum(d['graphs'] for d in done)))
+    return done
+
+
+def _read_shard(manifest, shard):
+    """Generate (position, src, tgt, anon, orig) lines of a shard, checking the files are aligned."""
+    shard_prefix = get_shard_prefix(manifest, shard)
+    filenames = [get_index_filename(shard_prefix)] + [
+        fileio.with_compression('{}-{}.txt'.format(shard_prefix, suffix), manifest['compression'])
+        for suffix in SHARD_SUFFIXES]
+    infiles = [fileio.open_file(filename, encoding='utf8') for filename in filenames]
+    try:
+        num_lines = 0
+        while True:
+            lines = [infile.readline() for infile in infiles]
+            if not any(lines):
+                break
+            if not all(lines):
+                raise ValueError('Files of shard {} are not aligned: line {} missing from {}'.format(
+                    shard, num_lines + 1, ', '.join(f for f, line in zip(filenames, lines) if not line)))
+            num_lines += 1
+            yield (int(lines[0]),) + tuple(lines[1:])
+        if num_lines != manifest['shard_sizes'][shard]:
+            raise ValueError('Shard {} has {} lines but the manifest expects {}'.format(
+                shard, num_lines, manifest['shard_sizes'][shard]))
+    finally:
+        for infile in infiles:
+            infile.close()
+
+
+def merge_shards(manifest_filename):
+    """Merge finished shards into {outfile_prefix}-*.txt in input order. (See module docstring.)"""
+    manifest = load_manifest(manifest_filename)
+    missing = [shard for shard in range(manifest['num_shards'])
+               if not os.path.exists(get_done_filename(get_shard_prefix(manifest, shard)))]
+    if missing:
+        raise ValueError('{} of {} shards are not done: {}'.format(
+            len(missing), manifest['num_shards'], ' '.join(str(shard) for shard in missing)))
+    outfile_prefix = manifest['outfile_prefix']
+    outfilenames = [fileio.with_compression('{}-{}.txt'.format(outfile_prefix, suffix), manifest['compression'])
+                    for suffix in SHARD_SUFFIXES]
+    outfiles = [fileio.open_file(filename, 'w', encoding='utf8') for filename in outfilenames]
+    num_written = 0
+    num_skipped = 0
+    try:
+        expected_position = 0
+        merged = heapq.merge(*[_read_shard(manifest, shard) for shard in range(manifest['num_shards'])])
+        for position, src, tgt, anon, orig in merged:
+            if position != expected_position:
+                raise ValueError('Shards have graph {} where graph {} was expected'.format(
+                    position, expected_position))
+            expected_position += 1
+            if src == '\n':  # preprocessing failed for this graph
+                num_skipped += 1
+                if not manifest['with_blanks']:
+                    continue
+            else:
+                num_written += 1
+            for outfile, line in zip(outfiles, [src, tgt, anon, orig]):
+                outfile.write(line)
+    finally:
+        for outfile in outfiles:
+            outfile.close()
+    if expected_position != manifest['num_graphs']:
+        raise ValueError('Shards have {} graphs but the manifest expects {}'.format(
+            expected_position, manifest['num_graphs']))
+    sys.stderr.write('Merged {} shards into {}-*.txt. Linearized {} graphs, skipped {}.\n'.format(
+        manifest['num_shards'], outfile_prefix, num_written, num_skipped))
+    return num_written, num_skipped
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('mode', choices=['plan', 'run', 'merge'])
+    parser.add_argument('--manifest', required=True, help='Manifest written by plan and read by run and merge')
+    parser.add_argument('--infiles', nargs='+', help='plan: Penman files to preprocess, in order')
+    parser.add_argument('--outfile_prefix', help='plan: merged files will be named using this prefix')
+    parser.add_argument('--num_shards', type=int, default=64, help='plan: number of shards')
+    parser.add_argument('--with_blanks', action='store_true',
+                        help='plan: if True, the merged files have a blank line for each graph that failed')
+    parser.add_argument('--compress', choices=['gz', 'zst'], help='plan: compress shard and merged files')
+    parser.add_argument('--shards', nargs='+', type=int,
+                        help='run: process these shards unless already done, even if claimed by another node '
+                             '(default: claim any that are unclaimed)')
+    parser.add_argument('--jobs', type=int, default=1, help='run: number of shards to process at once')
+    args = parser.parse_args()
+    if args.mode == 'plan':
+        if not args.infiles or not args.outfile_prefix:
+            parser.error('plan needs --infiles and --outfile_prefix')
+        plan(args.infiles, args.outfile_prefix, args.num_shards, args.manifest,
+             output_blank_for_failure=args.with_blanks, compression=args.compress)
+    elif args.mode == 'run':
+        run_shards(args.manifest, shards=args.shards, jobs=args.jobs)
+    else:
+        merge_shards(args.manifest)
@@ -0,0 +1,10 @@
+import os
+import sys
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SAMPLE_FILENAME = os.path.join(REPO_DIR, 'data', 'sample', 'sample.txt')
+
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+sys.path.insert(0, os.path.join(REPO_DIR, 'scripts'))
+sys.path.insert(0, os.path.join(REPO_DIR, 'gw-to-mrs'))
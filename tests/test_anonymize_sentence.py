@@ -0,0 +1,157 @@
+"""
+Check that preprocessing._anonymize_sentence, which builds the sentence once from a list of
+edits, gives the same output as the old version that rebuilt the sentence for every placeholder.
+"""
+import copy
+import random
+import re
+import sys
+
+import pytest
+
+import conftest  # noqa: F401 (puts the repo on sys.path)
+import preprocessing
+
+
+def old_anonymize_sentence(sentence, anon_map):
+    """_anonymize_sentence as it was before edits were collected and applied in one pass."""
+    to_replace = sorted(anon_map, key=lambda x: x['span'], reverse=True)
+    start, end = [sys.maxsize - 1, sys.maxsize]
+    for i, anon_dict in enumerate(to_replace):
+        prev_start, prev_end = start, end
+        start, end = anon_dict['span']
+        if sorted([prev_end, prev_start, end, start], reverse=True) != [prev_end, prev_start, end, start]:
+            del to_replace[i - 1]['realized']
+            sentence = sentence[:start] + anon_dict['ph'] + sentence[start:]
+            sys.stderr.write('Handled overlapping replacement: {}\n'.format(anon_dict))
+            continue
+        if anon_dict['value'].endswith('-'):
+            full_span = sentence[start:end]
+            updated_span = full_span.replace(anon_dict['value'], anon_dict['ph'] + " ")
+            if full_span == updated_span:
+                sys.stderr.write('Substr with hyphen ({}) not found in span: {}\n'.format(anon_dict['value'], full_span))
+            sentence = sentence[:start] + updated_span + sentence[end:]
+            continue
+        old_adjust_span_boundaries(sentence, anon_dict)
+        start, end = anon_dict['span']
+        anon_dict['realized'] = re.sub(r'(\[|\])', '', sentence[start:end])
+        sentence = sentence[:start] + anon_dict['ph'] + sentence[end:]
+    return sentence
+
+
+def old_adjust_span_boundaries(sentence, anon_dict):
+    start, end = anon_dict['span']
+    while start < end and sentence[start] in {'(', '[', '"', '`', "'"}:
+        if sentence[start] == "'":
+            if end - start > 1 and sentence[start + 1] == "'":
+                start += 2
+                continue
+            else:
+                break
+        start += 1
+    while end > start and sentence[end - 1] in {'.', ',', '!', '?', '"', '`', "'", '(', ')', '[', ']', ';', ':'}:
+        if end - start > 1 and re.match(r'[A-Z]', sentence[end - 2]) and sentence[end - 1] == '.':
+            break
+        end -= 1
+    anon_dict['span'][0] = start
+    anon_dict['span'][1] = end
+
+
+def run(anonymize, sentence, anon_map, capsys):
+    """Returns (sentence or exception, anon_map after, stderr) for one implementation."""
+    anon_map = copy.deepcopy(anon_map)
+    try:
+        result = anonymize(sentence, anon_map)
+    except Exception as e:
+        result = (type(e), str(e))
+    return result, anon_map, capsys.readouterr().err
+
+
+def check_same(sentence, anon_map, capsys):
+    old = run(old_anonymize_sentence, sentence, anon_map, capsys)
+    new = run(preprocessing._anonymize_sentence, sentence, anon_map, capsys)
+    assert new == old
+    return new
+
+
+def entity(ph, value, start, end):
+    return {'ph': ph, 'value': value, 'span': [start, end]}
+
+
+CASES = {
+    'plain': ('Abrams handed Browne the cigarette.',
+              [entity('named0', 'Abrams', 0, 6), entity('named1', 'Browne', 14, 20)]),
+    # compound whose parts all have the span of the whole compound
+    'overlapping': ('Call 555-5555 now.',
+                    [entity('card0', '555', 5, 13), entity('card1', '5555', 5, 13)]),
+    'overlapping_three': ('Visit Ekorraa/Ikornaa/Oravaa today.',
+                          [entity('named0', 'Ekorraa', 6, 27), entity('named1', 'Ikornaa', 6, 27),
+                           entity('named2', 'Oravaa', 6, 27)]),
+    'partly_overlapping': ('Pierre Vinken, 61 years old.',
+                           [entity('named0', 'Pierre', 0, 14), entity('named1', 'Vinken', 7, 14)]),
+    'hyphenated': ('The Franco-German border closed.',
+                   [entity('named0', 'Franco-', 4, 16), entity('named1', 'German', 4, 16)]),
+    'hyphen_not_found': ('The Anglo-Saxon period.', [entity('named0', 'Franco-', 4, 15)]),
+    'punctuation': ('He said "(Browne)," and left; [[Abrams]]: ``Smith\'\' U.S. \'Jones\'.',
+                    [entity('named0', 'Browne', 8, 18), entity('named1', 'Abrams', 30, 41),
+                     entity('named2', 'Smith', 42, 51), entity('named3', 'US', 52, 56),
+                     entity('named4', 'Jones', 57, 64)]),
+    'acronym_period': ('He works at I.B.M.', [entity('named0', 'IBM', 12, 18)]),
+    'only_punctuation': ('Wait... what?', [entity('named0', '.', 4, 7)]),
+    'repeated_surface': ('New York is not New York.',
+                         [entity('named0', 'New York', 0, 8), entity('named1', 'New York', 16, 25)]),
+    'repeated_hyphenated': ('Franco-Franco-German talks.',
+                            [entity('named0', 'Franco-', 0, 20)]),
+    'out_of_order': ('Mr. Smith met Ms. Jones.',
+                     [entity('named1', 'Jones', 18, 24), entity('named0', 'Smith', 4, 9)]),
+    'empty': ('Nothing to replace.', []),
+}
+
+
+@pytest.mark.parametrize('name', sorted(CASES))
+def test_same_as_old(name, capsys):
+    sentence, anon_map = CASES[name]
+    check_same(sentence, anon_map, capsys)
+
+
+def test_overlapping_realized(capsys):
+    sentence, anon_map = CASES['overlapping']
+    result, anon_map, err = check_same(sentence, anon_map, capsys)
+    assert result == 'Call card1card0 now.'
+    assert [d.get('realized') for d in anon_map] == [None, None]
+    assert 'Handled overlapping replacement' in err
+
+
+WORDS = ['Abrams', 'Browne', 'U.S.', 'New', 'York', 'Franco-German', '555-5555', 'the', 'a', 'I.B.M.']
+PUNCTUATION = ['', '', '', '.', ',', '"', "''", '``', '(', ')', '[', ']', "'", ';', ':', '!', '?']
+
+
+def random_case(rng):
+    words = [rng.choice(PUNCTUATION) + rng.choice(WORDS) + rng.choice(PUNCTUATION)
+             for _ in range(rng.randint(1, 8))]
+    sentence = ' '.join(words)
+    spans = []
+    pos = 0
+    for word in words:
+        spans.append((pos, pos + len(word)))
+        pos += len(word) + 1
+    anon_map = []
+    for i in range(rng.randint(0, 5)):
+        # spans are often shared between entities (like the parts of a compound) or overlap
+        if rng.random() < 0.3:  # span covering several words
+            first = rng.randrange(len(spans))
+            start, end = spans[first][0], spans[rng.randrange(first, len(spans))][1]
+        else:
+            start, end = rng.choice(spans)
+        value = sentence[start:end].strip('.,"\'`()[];:!?')
+        if rng.random() < 0.2:
+            value = value.split('-')[0] + '-'
+        anon_map.append(entity('named{}'.format(i), value, start, end))
+    return sentence, anon_map
+
+
+def test_same_as_old_random(capsys):
+    rng = random.Random(0)
+    for _ in range(5000):
+        sentence, anon_map = random_case(rng)
+        check_same(sentence, anon_map, capsys)
@@ -0,0 +1,111 @@
+"""
+Check that parse_shards.py retries failed shards, keeps its manifest readable, resumes without
+reparsing finished shards, and merges parses in shard order.
+"""
+import json
+import os
+import shlex
+import sys
+
+import conftest  # noqa: F401 (puts gw-to-mrs/ on sys.path)
+import parse_shards
+
+# Stand-in parser: fails the first FAKE_PARSER_FAILS[shard] times it's run on a shard, otherwise
+# "parses" each line by uppercasing it. Logs each call with the shard's status in the manifest,
+# which must be valid JSON whenever the parser runs. The first shard is slow, so shards finish
+# out of order.
+FAKE_PARSER = """
+import json, os, sys, time
+shard_filename = sys.argv[1]
+workdir, name = os.path.split(shard_filename)
+with open(os.path.join(workdir, 'manifest.json')) as infile:
+    status = json.load(infile)['shards'][name]['status']
+with open(os.path.join(workdir, 'calls.txt'), 'a') as outfile:
+    outfile.write('{} {}\\n'.format(name, status))
+attempts_filename = shard_filename + '.attempts'
+attempts = int(open(attempts_filename).read()) + 1 if os.path.exists(attempts_filename) else 1
+with open(attempts_filename, 'w') as outfile:
+    outfile.write(str(attempts))
+if attempts <= json.loads(os.environ['FAKE_PARSER_FAILS']).get(name, 0):
+    sys.exit(1)
+if name.endswith('00000'):
+    time.sleep(0.5)
+for line in open(shard_filename):
+    sys.stdout.write(line.upper())
+"""
+
+
+def read_calls(workdir):
+    with open(os.path.join(workdir, 'calls.txt')) as infile:
+        return sorted(line.split() for line in infile)
+
+
+def setup_run(tmpdir, monkeypatch, fails):
+    infilename = str(tmpdir.join('sentences.txt'))
+    with open(infilename, 'w') as outfile:
+        for i in range(10):
+            outfile.write('sentence {}\n'.format(i))
+    parser_filename = str(tmpdir.join('fake_parser.py'))
+    with open(parser_filename, 'w') as outfile:
+        outfile.write(FAKE_PARSER)
+    monkeypatch.setenv('FAKE_PARSER_FAILS', json.dumps(fails))
+    parser_cmd = '{} {} {{input}}'.format(shlex.quote(sys.executable), shlex.quote(parser_filename))
+    return infilename, parser_cmd
+
+
+def expected_output(infilename):
+    with open(infilename) as infile:
+        return infile.read().upper()
+
+
+def test_retry_and_atomic_manifest(tmpdir, monkeypatch):
+    infilename, parser_cmd = setup_run(tmpdir, monkeypatch, {'sentences.00001': 1})
+    replaced = []
+    replace = os.replace
+
+    def recording_replace(src, dst):
+        replaced.append((os.path.basename(src), os.path.basename(dst)))
+        replace(src, dst)
+
+    monkeypatch.setattr(parse_shards.os, 'replace', recording_replace)
+    workdir = str(tmpdir.join('work'))
+    outfilename = str(tmpdir.join('parsed.txt'))
+    assert parse_shards.parse_sharded(infilename, outfilename, workdir, parser_cmd=parser_cmd,
+                                      lines_per_shard=3, workers=4)
+    assert read_calls(workdir) == sorted(
+        [['sentences.{:05d}'.format(i), 'running'] for i in range(4)] + [['sentences.00001', 'running']])
+    manifest = parse_shards.load_manifest(workdir)
+    assert {name: (shard['status'], shard['attempts']) for name, shard in manifest['shards'].items()} == {
+        'sentences.00000': ('done', 1), 'sentences.00001': ('done', 2),
+        'sentences.00002': ('done', 1), 'sentences.00003': ('done', 1)}
+    # the manifest is only ever written by renaming a complete temp file over it
+    manifest_writes = [dst for src, dst in replaced if dst == 'manifest.json']
+    assert manifest_writes and all(src == 'manifest.json.tmp' for src, dst in replaced if dst == 'manifest.json')
+    assert len(manifest_writes) == 1 + 2 * 5  # created, then running and done/failed for each attempt
+    assert not os.path.exists(parse_shards.get_manifest_filename(workdir) + '.tmp')
+    with open(outfilename) as infile:
+        assert infile.read() == expected_output(infilename)
+
+
+def test_resume_skips_done_shards(tmpdir, monkeypatch):
+    infilename, parser_cmd = setup_run(tmpdir, monkeypatch, {'sentences.00002': 2})
+    workdir = str(tmpdir.join('work'))
+    outfilename = str(tmpdir.join('parsed.txt'))
+    assert not parse_shards.parse_sharded(infilename, outfilename, workdir, parser_cmd=parser_cmd,
+                                          lines_per_shard=3, workers=4, max_attempts=2)
+    assert not os.path.exists(outfilename)
+    manifest = parse_shards.load_manifest(workdir)
+    assert manifest['shards']['sentences.00002']['status'] == 'failed'
+    assert 'status 1' in manifest['shards']['sentences.00002']['error']
+    assert not os.path.exists(parse_shards.get_parse_filename(os.path.join(workdir, 'sentences.00002')))
+    calls_before = read_calls(workdir)
+
+    # the same command again only parses the failed shard
+    assert parse_shards.parse_sharded(infilename, outfilename, workdir, parser_cmd=parser_cmd,
+                                      lines_per_shard=3, workers=4, max_attempts=2)
+    assert sorted(read_calls(workdir)) == sorted(calls_before + [['sentences.00002', 'running']])
+    manifest = parse_shards.load_manifest(workdir)
+    assert all(shard['status'] == 'done' for shard in manifest['shards'].values())
+    assert manifest['shards']['sentences.00002']['attempts'] == 3
+    with open(outfilename) as infile:
+        assert infile.read() == expected_output(infilename)
@@ -0,0 +1,60 @@
+"""
+Check that one preprocessing.Preprocessor gives the same results from many threads as serially.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import json
+
+from conftest import SAMPLE_FILENAME
+import preprocessing
+import synthetic_dmrs
+
+NUM_THREADS = 16
+
+
+def load_pairs(filename):
+    return [(serialized, label.split('# ::snt ')[-1].strip())
+            for label, serialized in preprocessing.load_serialized_from_file(filename)]
+
+
+def check_encoder(encoder):
+    """Every id maps back to its value, and no value was added twice."""
+    for ids, values in [(encoder.predicate_ids, encoder.predicates), (encoder.bundle_ids, encoder.bundles)]:
+        assert len(ids) == len(values)
+        assert all(values[i] == value for value, i in ids.items())
+    for (predicate_id, bundle_id), label in encoder._labels.items():
+        assert label == encoder.predicates[predicate_id] + '￨' + encoder.bundles[bundle_id]
+    for bundle_id in encoder._bundle_keys.values():
+        assert bundle_id < len(encoder.bundles)
+
+
+def encoder_contents(encoder):
+    return set(encoder.predicates), set(encoder.bundles), set(encoder._labels.values())
+
+
+def test_sample_matches_parallel_files():
+    results = preprocessing.Preprocessor().process_batch(load_pairs(SAMPLE_FILENAME))
+    prefix = SAMPLE_FILENAME[:-len('.txt')]
+    lines = list(zip(*[open(filename, encoding='utf8').read().splitlines()
+                       for filename in preprocessing.get_parallel_filenames(prefix)]))
+    assert results == [(src, tgt, json.loads(anon), orig) for src, tgt, anon, orig in lines]
+
+
+def test_threads_match_serial(tmpdir):
+    corpus_filename = str(tmpdir.join('synthetic.txt'))
+    synthetic_dmrs.write_corpus(corpus_filename, 500, seed=3,
+                                **synthetic_dmrs.params_from_sample(SAMPLE_FILENAME))
+    pairs = load_pairs(SAMPLE_FILENAME) + load_pairs(corpus_filename)
+    pairs.insert(2, ('(x / _broken :ARG1 (', 'Not a graph.'))  # failures are None in both runs
+    serial_preprocessor = preprocessing.Preprocessor()
+    serial = serial_preprocessor.process_batch(pairs)
+    assert serial[2] is None and all(result is not None for result in serial[3:])
+
+    preprocessor = preprocessing.Preprocessor()
+    with ThreadPoolExecutor(NUM_THREADS) as executor:
+        # each pair several times, so threads hit the same new predicates and bundles at once
+        threaded = preprocessor.process_batch(pairs * 4, executor=executor)
+        assert threaded == serial * 4
+        threaded = list(executor.map(lambda pair: preprocessor.process(*pair), pairs[3:]))
+        assert threaded == serial[3:]
+    check_encoder(preprocessor.encoder)
+    assert encoder_contents(preprocessor.encoder) == encoder_contents(serial_preprocessor.encoder)
@@ -0,0 +1,120 @@
+"""
+Check that create_parallel_files_from_profiles gives the same parallel files as the two-step
+path: serializing each filtered DMRS to a Penman file (as mrs-to-penman does) and running
+create_parallel_files on it.
+"""
+import filecmp
+import os
+
+from delphin.mrs import penman, simplemrs, xmrs
+
+from conftest import SAMPLE_FILENAME
+import preprocessing
+import profiles
+
+RELATIONS = """item:
+  i-id :integer :key
+  i-input :string
+
+parse:
+  parse-id :integer :key
+  i-id :integer :key
+
+result:
+  parse-id :integer :key
+  result-id :integer
+  mrs :string
+
+"""
+
+# (item id, sentence, MRS). The first two are the first two graphs of data/sample.
+ITEMS = [
+    ('31', 'The window opened.',
+     '[ TOP: h0 INDEX: e2 [ e SF: prop TENSE: past MOOD: indicative PROG: - PERF: - ]'
+     ' RELS: < [ _the_q<0:3> LBL: h4 ARG0: x3 [ x PERS: 3 NUM: sg IND: + ] RSTR: h5 BODY: h6 ]'
+     ' [ _window_n_1<4:10> LBL: h7 ARG0: x3 ]'
+     ' [ _open_v_1<11:18> LBL: h1 ARG0: e2 ARG1: x3 ] >'
+     ' HCONS: < h0 qeq h1 h5 qeq h7 > ]'),
+    ('51', 'Abrams handed Browne the cigarette.',
+     '[ TOP: h0 INDEX: e2 [ e SF: prop TENSE: past MOOD: indicative PROG: - PERF: - ]'
+     ' RELS: < [ proper_q<0:6> LBL: h4 ARG0: x3 [ x PERS: 3 NUM: sg IND: + ] RSTR: h5 BODY: h6 ]'
+     ' [ named<0:6> LBL: h7 CARG: "Abrams" ARG0: x3 ]'
+     ' [ _hand_v_1<7:13> LBL: h1 ARG0: e2 ARG1: x3 ARG2: x9 [ x PERS: 3 NUM: sg IND: + ]'
+     ' ARG3: x8 [ x PERS: 3 NUM: sg IND: + ] ]'
+     ' [ proper_q<14:20> LBL: h10 ARG0: x8 RSTR: h11 BODY: h12 ]'
+     ' [ named<14:20> LBL: h13 CARG: "Browne" ARG0: x8 ]'
+     ' [ _the_q<21:24> LBL: h14 ARG0: x9 RSTR: h15 BODY: h16 ]'
+     ' [ _cigarette_n_1<25:35> LBL: h17 ARG0: x9 ] >'
+     ' HCONS: < h0 qeq h1 h5 qeq h7 h11 qeq h13 h15 qeq h17 > ]'),
+    # pronouns (attributes allowed by predicate, dropped pronoun_q)
+    ('100', 'He opened it.',
+     '[ TOP: h0 INDEX: e2 [ e SF: prop TENSE: past MOOD: indicative PROG: - PERF: - ]'
+     ' RELS: < [ pron<0:2> LBL: h4 ARG0: x3 [ x PERS: 3 NUM: sg GEND: m IND: + PT: std ] ]'
+     ' [ pronoun_q<0:2> LBL: h5 ARG0: x3 RSTR: h6 BODY: h7 ]'
+     ' [ _open_v_1<3:9> LBL: h1 ARG0: e2 ARG1: x3 ARG2: x8 [ x PERS: 3 NUM: sg GEND: n PT: std ] ]'
+     ' [ pron<10:12> LBL: h9 ARG0: x8 ]'
+     ' [ pronoun_q<10:12> LBL: h10 ARG0: x8 RSTR: h11 BODY: h12 ] >'
+     ' HCONS: < h0 qeq h1 h6 qeq h4 h11 qeq h9 > ]'),
+    # unknown word, number with a dropped udef_q, and a shared label
+    ('101', 'The 61 nonexecutive directors left.',
+     '[ TOP: h0 INDEX: e2 [ e SF: prop TENSE: past MOOD: indicative PROG: - PERF: - ]'
+     ' RELS: < [ _the_q<0:3> LBL: h4 ARG0: x3 [ x PERS: 3 NUM: pl IND: + ] RSTR: h5 BODY: h6 ]'
+     ' [ card<4:6> LBL: h7 CARG: "61" ARG0: e8 [ e SF: prop TENSE: untensed MOOD: indicative ] ARG1: x3 ]'
+     ' [ "_nonexecutive/jj_u_unknown"<7:19> LBL: h7 ARG0: e9 [ e SF: prop TENSE: untensed MOOD: indicative ]'
+     ' ARG1: x3 ]'
+     ' [ _director_n_of<20:29> LBL: h7 ARG0: x3 ARG1: i10 ]'
+     ' [ _leave_v_1<30:35> LBL: h1 ARG0: e2 ARG1: x3 ARG2: i11 ] >'
+     ' HCONS: < h0 qeq h1 h5 qeq h7 > ]'),
+]
+
+
+def write_profile(profile_dir):
+    os.makedirs(profile_dir)
+    with open(os.path.join(profile_dir, 'relations'), 'w') as outfile:
+        outfile.write(RELATIONS)
+    with open(os.path.join(profile_dir, 'item'), 'w') as item_file, \
+         open(os.path.join(profile_dir, 'parse'), 'w') as parse_file, \
+         open(os.path.join(profile_dir, 'result'), 'w') as result_file:
+        for parse_id, (item_id, sentence, mrs) in enumerate(ITEMS):
+            item_file.write('{}@{}\n'.format(item_id, sentence))
+            parse_file.write('{}@{}\n'.format(parse_id, item_id))
+            result_file.write('{}@0@{}\n'.format(parse_id, mrs))
+
+
+def write_penman(profile_dir, penman_filename):
+    """The first step of the two-step path: filter each DMRS and write it as Penman text."""
+    params = preprocessing.load_conversion_params()
+    codec = penman.XMRSCodec()
+    with open(penman_filename, 'w') as outfile:
+        for item_id, sentence, mrss in profiles.read_profile(profile_dir):
+            triples = xmrs.Dmrs.to_triples(xmrs.Dmrs.from_xmrs(mrss[0]), properties=True)
+            g = codec.triples_to_graph(preprocessing.filter_dmrs_triples(triples, params))
+            outfile.write('# ::id {}\n# ::snt {}\n{}\n\n'.format(item_id, sentence, codec.encode(g)))
+
+
+def test_profiles_match_penman_path(tmpdir):
+    profile_dir = str(tmpdir.join('profile'))
+    write_profile(profile_dir)
+    penman_filename = str(tmpdir.join('profile.txt'))
+    write_penman(profile_dir, penman_filename)
+    preprocessing.create_parallel_files(penman_filename, str(tmpdir.join('two_step')))
+    preprocessing.create_parallel_files_from_profiles([profile_dir], str(tmpdir.join('direct')))
+    for two_step_filename, direct_filename in zip(
+            preprocessing.get_parallel_filenames(str(tmpdir.join('two_step'))),
+            preprocessing.get_parallel_filenames(str(tmpdir.join('direct')))):
+        assert filecmp.cmp(two_step_filename, direct_filename, shallow=False), direct_filename
+    with open(preprocessing.get_tgt_filename(str(tmpdir.join('direct')))) as infile:
+        assert len(infile.readlines()) == len(ITEMS)
+
+
+def test_profiles_match_sample(tmpdir):
+    """The items from data/sample give the same -src and -tgt lines as its Penman graphs."""
+    profile_dir = str(tmpdir.join('profile'))
+    write_profile(profile_dir)
+    preprocessing.create_parallel_files_from_profiles([profile_dir], str(tmpdir.join('direct')))
+    sample_prefix = SAMPLE_FILENAME[:-len('.txt')]
+    for get_filename in [preprocessing.get_src_filename, preprocessing.get_tgt_filename]:
+        with open(get_filename(sample_prefix), encoding='utf8') as infile:
+            expected = infile.readlines()[:2]
+        with open(get_filename(str(tmpdir.join('direct'))), encoding='utf8') as infile:
+            assert infile.readlines()[:2] == expected
@@ -0,0 +1,36 @@
+"""
+Check that run_pipeline --dry_run reports the stages a real run would run.
+"""
+import os
+
+import conftest  # noqa: F401 (puts scripts/ on sys.path)
+import run_pipeline
+
+
+def make_stages(tmpdir):
+    a, b, c = (str(tmpdir.join(name)) for name in 'abc')
+    return [
+        run_pipeline.stage('copy_b', 'cp {} {}'.format(a, b), inputs=[a], outputs=[b]),
+        run_pipeline.stage('copy_c', 'cp {} {}'.format(b, c), inputs=[b], outputs=[c]),
+    ]
+
+
+def statuses(results):
+    return {name: result['status'] for name, result in results.items()}
+
+
+def test_dry_run_follows_dependencies(tmpdir):
+    stages = make_stages(tmpdir)
+    state_filename = str(tmpdir.join('state.json'))
+    tmpdir.join('a').write('1')
+    assert statuses(run_pipeline.run_pipeline(stages, state_filename)) == {'copy_b': 'ran', 'copy_c': 'ran'}
+    assert statuses(run_pipeline.run_pipeline(stages, state_filename, dry_run=True)) == {
+        'copy_b': 'skipped', 'copy_c': 'skipped'}
+
+    tmpdir.join('a').write('2')
+    # copy_c's input hasn't changed yet, but it would once copy_b runs
+    dry = statuses(run_pipeline.run_pipeline(stages, state_filename, dry_run=True))
+    assert dry == {'copy_b': 'would run', 'copy_c': 'would run'}
+    assert statuses(run_pipeline.run_pipeline(stages, state_filename)) == {'copy_b': 'ran', 'copy_c': 'ran'}
+    assert tmpdir.join('c').read() == '2'
+    assert os.path.exists(state_filename)
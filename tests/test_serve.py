@@ -0,0 +1,96 @@
+"""
+Check that serve.MicroBatcher keeps its feature encoder bounded without changing its output, and
+that serve.WorkerTranslator keeps one worker process across batches.
+"""
+import shlex
+import sys
+
+from conftest import REPO_DIR, SAMPLE_FILENAME
+import preprocessing
+import serve
+import synthetic_dmrs
+
+
+def load_graphs(tmpdir):
+    corpus_filename = str(tmpdir.join('synthetic.txt'))
+    synthetic_dmrs.write_corpus(corpus_filename, 200, seed=4, **synthetic_dmrs.params_from_sample(SAMPLE_FILENAME))
+    graphs = []
+    for filename in [SAMPLE_FILENAME, corpus_filename]:
+        with open(filename, encoding='utf8') as infile:
+            graphs.extend(serve.iter_stdin_graphs(infile))
+    return graphs
+
+
+def run_batches(batcher, graphs, batch_size=8):
+    results = []
+    for i in range(0, len(graphs), batch_size):
+        batch = [serve.Request(graph) for graph in graphs[i:i + batch_size]]
+        batcher.process_batch(batch)
+        results.extend(request.result for request in batch)
+        yield results[-len(batch):]
+
+
+def test_encoder_reset_keeps_output(tmpdir):
+    graphs = load_graphs(tmpdir)
+    global_size = len(preprocessing.combine_attributes.encoder)
+    unbounded = serve.MicroBatcher(serve.StubTranslator(), rmap={})
+    expected = [result for batch in run_batches(unbounded, graphs) for result in batch]
+    assert all(result['ok'] for result in expected)
+    assert len(unbounded.preprocessor.encoder) > 3 * 100
+
+    bounded = serve.MicroBatcher(serve.StubTranslator(), rmap={}, max_encoder_size=100)
+    results = []
+    encoders = set()
+    for batch in run_batches(bounded, graphs):
+        results.extend(batch)
+        encoders.add(id(bounded.preprocessor.encoder))
+        # reset before a batch once over the limit, so it only grows by one batch's worth past it
+        assert len(bounded.preprocessor.encoder) < 2 * 100
+    assert results == expected
+    assert len(encoders) > 1
+    # serving doesn't touch the module-level encoder used by create_parallel_files
+    assert len(preprocessing.combine_attributes.encoder) == global_size
+
+
+# worker that "translates" with StubTranslator, and reports its pid so restarts can be seen
+STUB_WORKER = """
+import os, sys
+sys.path.insert(0, {repo_dir!r})
+import serve
+translator = serve.StubTranslator()
+batch = []
+for line in sys.stdin:
+    if line.strip():
+        batch.append(line.strip())
+        continue
+    for tokens in translator.translate(batch):
+        print(' '.join([str(os.getpid())] + tokens), flush=True)
+    batch = []
+"""
+
+
+def test_worker_translator(tmpdir):
+    graphs = load_graphs(tmpdir)
+    expected = [result for batch in run_batches(serve.MicroBatcher(serve.StubTranslator(), rmap={}), graphs)
+                for result in batch]
+    worker_cmd = '{} -c {}'.format(shlex.quote(sys.executable), shlex.quote(STUB_WORKER.format(repo_dir=REPO_DIR)))
+    translator = serve.WorkerTranslator(worker_cmd)
+    pids = set()
+
+    class PidTranslator(object):
+        def translate(self, src_lines):
+            predictions = translator.translate(src_lines)
+            pids.update(tokens[0] for tokens in predictions)
+            return [tokens[1:] for tokens in predictions]
+
+    batcher = serve.MicroBatcher(PidTranslator(), rmap={})
+    batches = run_batches(batcher, graphs)
+    results = next(batches)
+    translator.process.kill()  # the worker is started again for the next batch
+    translator.process.wait()
+    for batch in batches:
+        results.extend(batch)
+    translator.close()
+    assert results == expected
+    assert len(pids) == 2  # one worker for all the batches after the restart
+    assert translator.process is None
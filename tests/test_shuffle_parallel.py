@@ -0,0 +1,62 @@
+"""
+Check that shuffle_parallel.shuffle_records gives the same order however many chunks it sorts
+on disk, never merges more than MAX_MERGE_RUNS of them at once, and keeps records aligned
+when the input files have no final newline.
+"""
+import heapq
+import random
+
+import conftest  # noqa: F401 (puts scripts/ on sys.path)
+import preprocessing
+import shuffle_parallel
+
+NUM_RECORDS = 3000
+
+
+def records():
+    return [tuple('{:05d} {}\n'.format(i, suffix) for suffix in ['src', 'tgt', 'anon', 'orig'])
+            for i in range(NUM_RECORDS)]
+
+
+def test_merge_passes_match_in_memory(tmpdir, monkeypatch):
+    in_memory = list(shuffle_parallel.shuffle_records(records(), random.Random(1), 1 << 30))
+    assert sorted(in_memory) == records() and in_memory != records()
+
+    fan_ins = []
+    merge = heapq.merge
+
+    def counting_merge(*iterables):
+        fan_ins.append(len(iterables))
+        return merge(*iterables)
+
+    monkeypatch.setattr(shuffle_parallel.heapq, 'merge', counting_merge)
+    monkeypatch.setattr(shuffle_parallel, 'MAX_MERGE_RUNS', 7)
+    # about one record per chunk, so several merge passes are needed
+    on_disk = list(shuffle_parallel.shuffle_records(records(), random.Random(1), 100, tmpdir=str(tmpdir)))
+    assert on_disk == in_memory
+    assert len(fan_ins) > NUM_RECORDS // 7
+    assert max(fan_ins) <= 7 + 1  # the final merge adds the chunk kept in memory
+    assert tmpdir.listdir() == []
+
+
+def write_parallel_files(prefix, lines):
+    """Write lines (src, tgt, anon, orig tuples, without newlines) with no newline after the last."""
+    for filename, column in zip(preprocessing.get_parallel_filenames(prefix), zip(*lines)):
+        with open(filename, 'w', encoding='utf8') as outfile:
+            outfile.write('\n'.join(column))
+
+
+def test_no_final_newline(tmpdir):
+    lines = [('a', 'A', '[]', 'x'), ('b', 'B', '[]', 'y'), ('c', 'C', '[]', 'z')]
+    prefix = str(tmpdir.join('train'))
+    write_parallel_files(prefix, lines)
+    expected = [tuple(line + '\n' for line in record) for record in lines]
+    assert list(preprocessing.read_parallel_lines(prefix)) == expected
+    for memory_bytes in [1 << 30, 100]:  # in memory, and about one record per chunk
+        for seed in range(5):
+            shuffled = list(shuffle_parallel.shuffle_records(
+                preprocessing.read_parallel_lines(prefix), random.Random(seed), memory_bytes, tmpdir=str(tmpdir)))
+            assert sorted(shuffled) == expected
+    shuffle_parallel.shuffle(prefix, str(tmpdir.join('shuffled')), seed=2)
+    with open(preprocessing.get_orig_filename(str(tmpdir.join('shuffled'))), encoding='utf8') as infile:
+        assert sorted(infile.read().splitlines()) == ['x', 'y', 'z']
@@ -0,0 +1,77 @@
+"""
+Check that unknown_variants.py writes the same files as the scripts/unknowns/prep_*.sh scripts.
+"""
+import filecmp
+import os
+import shutil
+import subprocess
+import sys
+
+from conftest import REPO_DIR, SAMPLE_FILENAME
+import synthetic_dmrs
+import unknown_variants
+
+# replace_rare.py steps of each scripts/unknowns/ prep script, after linearizing train and dev with
+# preprocessing.py
+OLD_SCRIPT_STEPS = {
+    'ignore': [],  # prep_ignore_unknowns.sh
+    'include': [  # prep_include_all_unknowns.sh
+        ['vocab', '--vocabfile', '{outdir}/vocab.txt', '--infile', '{outdir}/train-tgt.txt'],
+        ['replace', '--vocabfile', '{outdir}/vocab.txt', '--infile', '{outdir}/train', '--min_freq', '0'],
+        ['replace', '--vocabfile', '{outdir}/vocab.txt', '--infile', '{outdir}/dev', '--min_freq', '0'],
+    ],
+    'rare': [  # prep_anonymize_rare_unknowns.sh
+        ['vocab', '--vocabfile', '{outdir}/vocab.txt', '--infile', '{outdir}/train-tgt.txt'],
+        ['replace', '--vocabfile', '{outdir}/vocab.txt', '--infile', '{outdir}/train', '--min_freq', '2'],
+        ['replace', '--vocabfile', '{outdir}/vocab.txt', '--infile', '{outdir}/dev', '--min_freq', '2'],
+    ],
+    'all': [  # prep_anonymize_all_unknowns.sh
+        ['vocab', '--vocabfile', '{outdir}/vocab.txt', '--infile', '{outdir}/train-tgt.txt'],
+        ['replace', '--vocabfile', '{outdir}/vocab.txt', '--infile', '{outdir}/train', '--min_freq', '10000'],
+        ['replace', '--vocabfile', '{outdir}/vocab.txt', '--infile', '{outdir}/dev', '--min_freq', '10000'],
+    ],
+}
+PARALLEL_FILES = ['{}-{}.txt'.format(name, side) for name in ['train', 'dev'] for side in ['src', 'tgt', 'anon', 'orig']]
+
+
+def run_old_scripts(datasets, outdir_prefix):
+    # every prep script linearizes the same way, so do it once and copy the files to each variant
+    linearized_dir = outdir_prefix + '_linearized'
+    os.makedirs(linearized_dir)
+    for name, penman_filename in datasets:
+        subprocess.check_call([sys.executable, 'preprocessing.py', penman_filename,
+                               os.path.join(linearized_dir, name)], cwd=REPO_DIR)
+    for variant, steps in OLD_SCRIPT_STEPS.items():
+        outdir = '{}_{}'.format(outdir_prefix, variant)
+        shutil.copytree(linearized_dir, outdir)
+        for step in steps:
+            # no check: replace_rare.py exits with an error for --min_freq 0 without replacing anything
+            subprocess.call([sys.executable, 'replace_rare.py'] + [arg.format(outdir=outdir) for arg in step],
+                            cwd=REPO_DIR)
+
+
+def test_variants_match_old_scripts(tmpdir):
+    params = synthetic_dmrs.params_from_sample(SAMPLE_FILENAME)
+    train_filename = str(tmpdir.join('train.txt'))
+    dev_filename = str(tmpdir.join('dev.txt'))
+    synthetic_dmrs.write_corpus(train_filename, 300, seed=1, **params)
+    synthetic_dmrs.write_corpus(dev_filename, 100, seed=2, **params)
+    with open(dev_filename, 'a') as outfile, open(SAMPLE_FILENAME) as infile:
+        outfile.write(infile.read())
+    datasets = [('train', train_filename), ('dev', dev_filename)]
+    old_prefix = str(tmpdir.join('old'))
+    new_prefix = str(tmpdir.join('new'))
+    run_old_scripts(datasets, old_prefix)
+    unknown_variants.create_unknown_variants(datasets, new_prefix, ['include', 'rare', 'all'])
+    for variant, steps in OLD_SCRIPT_STEPS.items():
+        filenames = PARALLEL_FILES + (['vocab.txt'] if steps else [])
+        old_dir = '{}_{}'.format(old_prefix, variant)
+        new_dir = unknown_variants.get_variant_dir(new_prefix, variant)
+        _, mismatch, errors = filecmp.cmpfiles(old_dir, new_dir, filenames, shallow=False)
+        assert (variant, mismatch, errors) == (variant, [], [])
+    # the corpus has unknowns to replace, so the variants really differ
+    ignore_dir = unknown_variants.get_variant_dir(new_prefix, 'ignore')
+    for variant in ['rare', 'all']:
+        variant_dir = unknown_variants.get_variant_dir(new_prefix, variant)
+        assert not filecmp.cmp(os.path.join(ignore_dir, 'dev-tgt.txt'), os.path.join(variant_dir, 'dev-tgt.txt'),
+                               shallow=False)
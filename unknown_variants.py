@@ -0,0 +1,98 @@
+"""
+Create the parallel files for every way of handling unknown words from one preprocessing run.
+
+The scripts/unknowns/prep_*.sh scripts each linearize the same Penman files and then differ
+only in how replace_rare.py treats unknown-word placeholders (UNKcat0) afterwards:
+* ignore: no replacement (plain preprocessing.py output)
+* include: no replacement either. The script asks for min freq 0, but replace_rare.py treats 0
+  as a missing --min_freq and exits without replacing anything, so every unknown is kept as is
+* rare: unknowns seen fewer than 2 times in training are anonymized as _UNK0, _UNK1, ...
+* all: every unknown is anonymized
+
+Here each graph is decoded and linearized once, into {outdir_prefix}_ignore. The include
+variant gets copies of those files, and the replaced variants are written together in a
+single pass over them, to {outdir_prefix}_{variant}. As in the prep scripts, the vocab comes
+from the training data and is written to vocab.txt in each variant's dir.
+
+Usage (same output dirs as scripts/run_unknown.sh):
+> python unknown_variants.py --datasets train:data_penman/train.txt dev:data_penman/dev.txt \
+    --outdir_prefix data_unk --variants include all rare
+
+"""
+import argparse
+import os
+import shutil
+import sys
+
+import preprocessing
+
+# min_word_freq given to replace_rare.py for each variant (None means don't replace)
+UNKNOWN_HANDLING_MIN_FREQ = {
+    'ignore': None,
+    'include': None,  # prep_include_all_unknowns.sh's --min_freq 0 makes replace_rare.py exit without replacing
+    'rare': 2,
+    'all': 10000,  # high enough that every unknown is replaced
+}
+
+
+def get_variant_dir(outdir_prefix, variant):
+    return '{}_{}'.format(outdir_prefix, variant)
+
+
+def create_unknown_variants(datasets, outdir_prefix, variants, train_name='train', output_blank_for_failure=False,
+                            compression=None):
+    """Write parallel files for each dataset under every requested unknown-handling variant.
+
+    :datasets: list of (name, penman_filename) tuples, e.g. [('train', 'data_penman/train.txt')]
+    :variants: names from UNKNOWN_HANDLING_MIN_FREQ
+    :compression: 'gz' or 'zst' to compress the parallel files of every variant
+
+    """
+    base_dir = get_variant_dir(outdir_prefix, 'ignore')
+    for variant in ['ignore'] + list(variants):
+        variant_dir = get_variant_dir(outdir_prefix, variant)
+        if not os.path.exists(variant_dir):
+            os.makedirs(variant_dir)
+    for name, penman_filename in datasets:
+        preprocessing.create_parallel_files(penman_filename, os.path.join(base_dir, name),
+                                            output_blank_for_failure=output_blank_for_failure,
+                                            compression=compression)
+    sys.stderr.write('done linearizing\n')
+    copied_variants = [v for v in variants if v != 'ignore' and UNKNOWN_HANDLING_MIN_FREQ[v] is None]
+    replaced_variants = [v for v in variants if UNKNOWN_HANDLING_MIN_FREQ[v] is not None]
+    if not copied_variants and not replaced_variants:
+        return
+    vocab_filename = os.path.join(base_dir, 'vocab.txt')
+    preprocessing.build_vocab(preprocessing.get_tgt_filename(os.path.join(base_dir, train_name)), vocab_filename)
+    for variant in copied_variants + replaced_variants:
+        shutil.copyfile(vocab_filename, os.path.join(get_variant_dir(outdir_prefix, variant), 'vocab.txt'))
+    for name, _ in datasets:
+        for variant in copied_variants:
+            for filename in preprocessing.find_parallel_files(os.path.join(base_dir, name)):
+                shutil.copyfile(filename, os.path.join(get_variant_dir(outdir_prefix, variant),
+                                                       os.path.basename(filename)))
+        if not replaced_variants:
+            continue
+        preprocessing.write_rare_token_variants(
+            os.path.join(base_dir, name), vocab_filename,
+            [(UNKNOWN_HANDLING_MIN_FREQ[v], os.path.join(get_variant_dir(outdir_prefix, v), name))
+             for v in replaced_variants])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--datasets', nargs='+', default=['train:data_penman/train.txt', 'dev:data_penman/dev.txt'],
+                        help='name:penman_file pairs. Parallel files are named {variant_dir}/{name}-*.txt')
+    parser.add_argument('--outdir_prefix', default='data_unk', help='Variant dirs are named {outdir_prefix}_{variant}')
+    parser.add_argument('--variants', nargs='+', choices=sorted(UNKNOWN_HANDLING_MIN_FREQ),
+                        default=['include', 'all', 'rare'])
+    parser.add_argument('--train_name', default='train', help='Dataset the vocab is built from')
+    parser.add_argument('--with_blanks', action='store_true',
+                        help='If True, output blank line when deserialization fails.')
+    parser.add_argument('--compress', choices=['gz', 'zst'], help='Compress the parallel files')
+    args = parser.parse_args()
+    datasets = [tuple(dataset.split(':', 1)) for dataset in args.datasets]
+    if args.train_name not in dict(datasets):
+        parser.error('--datasets must include {}'.format(args.train_name))
+    create_unknown_variants(datasets, args.outdir_prefix, args.variants, train_name=args.train_name,
+                            output_blank_for_failure=args.with_blanks, compression=args.compress)